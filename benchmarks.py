@@ -0,0 +1,263 @@
+# Mesures de performance : construction du chemin, interpolation, accélération
+# et simulations complètes, comparées à une référence sauvée en JSON
+#
+#   python benchmarks.py -o resultats.json
+#   python benchmarks.py --quick --baseline reference.json --threshold 0.1
+#
+# Le code de sortie vaut 1 si une mesure est plus lente que la référence de
+# plus du seuil donné.
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import path3d as p3d
+import physic_model_3d as phys
+import shape
+from simulator import Simulator
+
+# Circuits des fichiers de données
+TRACK_FILES = {
+    'circuits': 'datas/xyz_circuits.txt',
+    'circuit_real': 'datas/xyz_circuit_real.txt',
+    'generated': 'datas/xyz_generated.txt',
+}
+
+
+def synthetic_points(n, turns=10, radius=0.3, height=1.):
+    """Points de passage d'une hélice descendante (circuit synthétique)
+
+    Args:
+        n (int): nombre de points de passage
+        turns (float): nombre de tours
+        radius (float): rayon de l'hélice [m]
+        height (float): hauteur de départ [m]
+
+    Returns:
+        array: points de passage, array[3, n]
+    """
+    u = np.linspace(0., 1., n)
+    angle = 2*np.pi*turns*u
+    return np.vstack((radius*np.cos(angle), radius*np.sin(angle), height*(1 - u)))
+
+
+def fixtures(quick=False):
+    """Retourne les circuits de test {nom: points de passage array[3, N]}
+
+    Args:
+        quick (bool): se limite aux circuits synthétiques de 10^3 et 10^4 points
+    """
+    points = {
+        'looping': shape.looping_points(),
+        'parabole': shape.parabole_points(0.681*2, 0.412),
+    }
+    for name, filename in TRACK_FILES.items():
+        points[name] = shape.xyz_from_file(filename, cache=False)
+    for exponent in (3, 4) if quick else (3, 4, 5, 6):
+        points['synthetic_1e{}'.format(exponent)] = synthetic_points(10**exponent)
+    return points
+
+
+def measure(function, repeat=3, duration=0.05):
+    """Chronomètre une fonction et mesure le pic de mémoire allouée
+
+    Après un premier appel (imports, caches), le temps est le meilleur de
+    repeat séries d'appels, chaque série durant au moins duration. Le pic de
+    mémoire (tracemalloc, qui suit aussi les tableaux numpy) est mesuré lors
+    d'un appel séparé pour ne pas fausser le temps.
+
+    Returns:
+        tuple: (temps par appel [s], pic de mémoire [octets])
+    """
+    start = time.perf_counter()
+    function()
+    number = max(1, int(duration/max(time.perf_counter() - start, 1e-9)))
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        best = min(best, (time.perf_counter() - start)/number)
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def _row(bench, fixture, param, elapsed, peak, count, unit):
+    return {
+        'id': '{}/{}/{}'.format(bench, fixture, param),
+        'bench': bench,
+        'fixture': fixture,
+        'param': param,
+        'time': elapsed,
+        'rate': count/elapsed if elapsed > 0 else None,
+        'unit': unit,
+        'peak_memory': peak,
+    }
+
+
+def bench_path(points, name, repeat=3):
+    """Construction du chemin (path3d.path), points générés par seconde"""
+    steps = min(10*points.shape[1], 10**6)
+    elapsed, peak = measure(lambda: p3d.path(points, steps), repeat)
+    return [_row('path', name, steps, elapsed, peak, steps, 'points/s')]
+
+
+def bench_path_at(path, name, calls=2000, repeat=3):
+    """Interpolation en un point (path3d.path_at), appels par seconde"""
+    s = np.random.default_rng(0).uniform(0., path[0][-1], calls)
+
+    def run():
+        for x in s:
+            p3d.path_at(x, path)
+    elapsed, peak = measure(run, repeat)
+    return [_row('path_at', name, calls, elapsed, peak, calls, 'calls/s')]
+
+
+def bench_acceleration(path, name, calls=2000, lanes=10**5, repeat=3):
+    """Accélération scalaire (appels/s) et vectorisée (points/s)"""
+    sPath, XPath, TPath, CPath = path
+    rng = np.random.default_rng(0)
+    k = rng.integers(0, len(sPath), max(calls, lanes))
+    vs = rng.uniform(-2., 2., max(calls, lanes))
+    h = np.sqrt(0.008**2 - 0.014**2/4)
+    T = TPath[:, k].T.tolist()
+    C = CPath[:, k].T.tolist()
+    vs_list = vs.tolist()
+
+    def scalar():
+        for i in range(calls):
+            phys.acceleration(vs_list[i], C[i], T[i], h, 0.00073, 0.008, 9.81)
+    TA, CA, VA = TPath[:, k[:lanes]], CPath[:, k[:lanes]], vs[:lanes]
+    rows = []
+    elapsed, peak = measure(scalar, repeat)
+    rows.append(_row('acceleration', name, calls, elapsed, peak, calls, 'calls/s'))
+    elapsed, peak = measure(lambda: phys.acceleration_array(VA, CA, TA, h, 0.00073, 0.008, 9.81),
+                            repeat)
+    rows.append(_row('acceleration_array', name, lanes, elapsed, peak, lanes, 'points/s'))
+    return rows
+
+
+def bench_simulation(path, name, dts, tEnd=5., repeat=3):
+    """Simulation complète (Simulator.run) pour plusieurs pas de temps, pas par seconde"""
+    rows = []
+    for dt in dts:
+        simulator = Simulator(path, dt=dt, tEnd=tEnd)
+        steps = []
+        elapsed, peak = measure(lambda: steps.append(simulator.run().steps), repeat)
+        rows.append(_row('simulation', name, dt, elapsed, peak, steps[-1], 'steps/s'))
+    return rows
+
+
+def run_benchmarks(quick=False, repeat=3, select=None, log=None):
+    """Lance toutes les mesures
+
+    Les simulations complètes ne sont lancées que sur les circuits d'au plus
+    10^3 points de passage.
+
+    Args:
+        quick (bool): circuits synthétiques réduits et un seul pas de temps
+        repeat (int): nombre de répétitions (le meilleur temps est gardé)
+        select (list): noms des mesures à lancer ('path', 'path_at',
+            'acceleration', 'simulation'), toutes par défaut
+        log (callable): fonction appelée avec chaque ligne de résultat
+
+    Returns:
+        dict: description de la machine ('meta') et lignes de résultats ('results')
+    """
+    select = select or ('path', 'path_at', 'acceleration', 'simulation')
+    dts = (0.001,) if quick else (0.001, 0.0001)
+    results = []
+    for name, points in fixtures(quick).items():
+        rows = []
+        if 'path' in select:
+            rows += bench_path(points, name, repeat)
+        path = p3d.path(points, min(10*points.shape[1], 10**6))
+        if 'path_at' in select:
+            rows += bench_path_at(path, name, repeat=repeat)
+        if 'acceleration' in select:
+            rows += bench_acceleration(path, name, repeat=repeat)
+        if 'simulation' in select and points.shape[1] <= 10**3:
+            rows += bench_simulation(path, name, dts, repeat=repeat)
+        for row in rows:
+            if log:
+                log(row)
+            results.append(row)
+    meta = {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'platform': platform.platform(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'quick': quick,
+    }
+    return {'meta': meta, 'results': results}
+
+
+def compare(current, baseline, threshold=0.1):
+    """Compare des résultats à une référence
+
+    Args:
+        current (dict): résultats (voir run_benchmarks)
+        baseline (dict): résultats de référence
+        threshold (float): ralentissement relatif toléré
+
+    Returns:
+        list: pour chaque mesure présente dans les deux, dictionnaire avec
+            'id', 'time', 'baseline', 'ratio' (temps / référence) et
+            'regression' (vrai si ratio > 1 + threshold)
+    """
+    reference = {row['id']: row for row in baseline['results']}
+    rows = []
+    for row in current['results']:
+        base = reference.get(row['id'])
+        if base is None:
+            continue
+        ratio = row['time']/base['time']
+        rows.append({'id': row['id'], 'time': row['time'], 'baseline': base['time'],
+                     'ratio': ratio, 'regression': ratio > 1 + threshold})
+    return rows
+
+
+def _print_row(row):
+    print('{:<45} {:>12.3e} s {:>12.3e} {:<9} {:>8.1f} Mo'.format(
+        row['id'], row['time'], row['rate'] or 0, row['unit'], row['peak_memory']/2**20))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mesures de performance de la simulation.")
+    parser.add_argument('-o', '--output', help="fichier JSON des résultats")
+    parser.add_argument('--baseline', help="fichier JSON de référence à comparer")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="ralentissement relatif toléré (défaut 0.1 = 10 %%)")
+    parser.add_argument('--quick', action='store_true', help="mesures réduites")
+    parser.add_argument('--repeat', type=int, default=3, help="répétitions par mesure")
+    parser.add_argument('--select', nargs='*',
+                        choices=('path', 'path_at', 'acceleration', 'simulation'))
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.quick, args.repeat, args.select, log=_print_row)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    rows = compare(results, baseline, args.threshold)
+    for row in rows:
+        print('{:<45} x{:.2f}{}'.format(row['id'], row['ratio'],
+                                        '  REGRESSION' if row['regression'] else ''))
+    return 1 if any(row['regression'] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
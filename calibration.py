@@ -0,0 +1,365 @@
+# Calibration du coefficient de frottement (et de h ou r) sur les mesures Tracker
+#
+#   python calibration.py datas/tracker_data.txt
+#
+# Les jeux de paramètres candidats sont simulés ensemble, sous forme de
+# tableaux numpy (une ligne par candidat), comme dans sweep.py.
+import statistics
+import time
+
+import numpy as np
+
+import sweep as sw
+from datafiles import tracker_from_file
+
+
+class ParabolaModel:
+    """Piste parabolique de 2D/simulation_parabole.py
+
+    Args:
+        L (float): longueur horizontale [m]
+        H (float): hauteur verticale [m]
+        points (int): nombre de points de la piste
+        r (float): rayon de la bille [m]
+        b (float): écart des rails [m]
+        g (float): accélération de gravité [m/s²]
+        dt (float): pas de temps [s]
+
+    Attributes:
+        names (tuple): paramètres ajustables : frottement e, hauteur h du
+            centre de la bille sur les rails [m], position de départ s0 [m]
+        defaults (dict): valeur par défaut de chaque paramètre
+        bounds (dict): bornes (min, max) de chaque paramètre
+    """
+    names = ('e', 'h', 's0')
+
+    def __init__(self, L=0.681*2, H=0.412, points=101, r=0.008, b=0.012, g=9.81, dt=0.001):
+        self.A = 4*H/L**2  # parabole d'équation z = A * x**2
+        self.xPath = np.linspace(-L/2, L/2, points)
+        zPath = self.A*self.xPath**2
+        self.sPath = np.hstack((0, np.cumsum(np.sqrt(np.diff(self.xPath)**2 + np.diff(zPath)**2))))
+        self.r = r
+        self.g = g
+        self.dt = dt
+        self.defaults = {'e': 0.0004, 'h': np.sqrt(r**2 - b**2/4), 's0': 0.}
+        self.bounds = {'e': (0., np.inf), 'h': (1e-6, r), 's0': (0., self.sPath[-1])}
+
+    def simulate(self, params, times):
+        """Simule K jeux de paramètres et enregistre s et vs aux instants donnés
+
+        Args:
+            params (dict): valeurs des paramètres (voir names), array[K]
+            times (array): instants d'enregistrement, croissants [s]
+
+        Returns:
+            tuple: (s, vs), array[K, len(times)]
+        """
+        e, h, s = np.broadcast_arrays(*[np.array(params[name], dtype=float) for name in self.names])
+        s = s.copy()
+        vs = np.zeros_like(s)
+        M = 1 + 2/5*self.r**2/h**2  # coefficient d'inertie [1]
+        A, g, dt = self.A, self.g, self.dt
+
+        record = np.rint(np.asarray(times, dtype=float)/dt).astype(int)
+        s_rec = np.empty((s.size, record.size))
+        vs_rec = np.empty((s.size, record.size))
+        j = 0
+        for step in range(record[-1] + 1):
+            while j < record.size and record[j] <= step:
+                s_rec[:, j] = s
+                vs_rec[:, j] = vs
+                j += 1
+            x = np.interp(s, self.sPath, self.xPath)
+            p = 2*A*x  # pente dz/dx
+            cos_beta = 1 / np.sqrt(1+p*p)
+            sin_beta = p / np.sqrt(1+p*p)
+            c = 2*A / (1 + p*p)**1.5  # courbure
+            vs += (-g*sin_beta - e*vs/h * (g*cos_beta + c*vs**2)) / M * dt
+            s += vs*dt
+        return s_rec, vs_rec
+
+
+class PathModel:
+    """Chemin 3D (path3d.path), simulé avec sweep.sweep
+
+    Une bille qui dépasse la fin du chemin y est supposée arrêtée.
+
+    Args:
+        path (tuple): (sPath, XPath, TPath, CPath) tel que retourné par path3d.path()
+        r (float): rayon de la bille [m]
+        b (float): écart des rails [m]
+        g (float): accélération de gravité [m/s²]
+        dt (float): pas de temps [s]
+
+    Attributes:
+        names (tuple): paramètres ajustables : frottement e, rayon r de la
+            bille [m], position de départ s0 [m]
+        defaults (dict): valeur par défaut de chaque paramètre
+        bounds (dict): bornes (min, max) de chaque paramètre
+    """
+    names = ('e', 'r', 's0')
+
+    def __init__(self, path, r=0.008, b=0.014, g=9.81, dt=0.001):
+        self.path = path
+        self.b = b
+        self.g = g
+        self.dt = dt
+        self.defaults = {'e': 0.00073, 'r': r, 's0': 0.}
+        self.bounds = {'e': (0., np.inf), 'r': (b/2 + 1e-6, np.inf), 's0': (0., path[0][-1])}
+
+    def simulate(self, params, times):
+        """Simule K jeux de paramètres et enregistre s et vs aux instants donnés
+
+        Args:
+            params (dict): valeurs des paramètres (voir names), array[K]
+            times (array): instants d'enregistrement, croissants [s]
+
+        Returns:
+            tuple: (s, vs), array[K, len(times)]
+        """
+        lanes, s_rec, vs_rec = sw.sweep(self.path, params['e'], r=params['r'], b=self.b,
+                                        s0=params['s0'], g=self.g, dt=self.dt,
+                                        tEnd=times[-1] + self.dt, times=times)
+        # Après l'arrivée, on garde le dernier état enregistré
+        i = np.where(np.isnan(s_rec), 0, np.arange(s_rec.shape[1]))
+        np.maximum.accumulate(i, axis=1, out=i)
+        rows = np.arange(s_rec.shape[0])[:, None]
+        return s_rec[rows, i], vs_rec[rows, i]
+
+
+class CalibrationResult:
+    """Résultat d'une calibration
+
+    Attributes:
+        values (dict): valeurs ajustées, dont le décalage de temps tau [s]
+            (t_simulation = t_mesure + tau) et le décalage des distances
+            s_offset [m] (s_mesure = s_simulation + s_offset)
+        intervals (dict): demi-largeurs des intervalles de confiance
+        confidence (float): niveau de confiance des intervalles
+        rms (dict): écart quadratique moyen par série mesurée ('s' [m], 'vs' [m/s])
+        lanes (int): nombre total de jeux de paramètres simulés
+        wall_time (float): durée de la calibration [s]
+    """
+
+    def __init__(self, values, intervals, confidence, rms, lanes, wall_time):
+        self.values = values
+        self.intervals = intervals
+        self.confidence = confidence
+        self.rms = rms
+        self.lanes = lanes
+        self.wall_time = wall_time
+
+    def summary(self):
+        """Résumé de la calibration sous forme de dictionnaire"""
+        return {
+            'values': self.values,
+            'intervals': self.intervals,
+            'confidence': self.confidence,
+            'rms': self.rms,
+            'lanes': self.lanes,
+            'wall_time': self.wall_time,
+        }
+
+
+class _Objective:
+    """Résidus pondérés entre les simulations et les mesures
+
+    Les points NaN de chaque série sont ignorés, la vitesse simulée est
+    comparée en valeur absolue (Tracker ne donne que la norme) et le décalage
+    des distances est éliminé en centrant les résidus de s.
+    """
+
+    def __init__(self, model, t, s, vs, series, record_dt, tau_max):
+        self.model = model
+        self.t = np.asarray(t, dtype=float)
+        ok = np.isfinite(self.t)
+        self.data = {}
+        for name, y in (('s', s), ('vs', vs)):
+            if name in series:
+                y = np.asarray(y, dtype=float)
+                mask = ok & np.isfinite(y)
+                self.data[name] = (mask, y[mask], 1/np.std(y[mask]))
+        if not self.data:
+            raise ValueError("Aucune série à ajuster : {}".format(series))
+        every = max(1, int(round(record_dt/model.dt)))
+        self.record_dt = every*model.dt
+        self.times = np.arange(0., np.nanmax(self.t) + tau_max + 2*self.record_dt, self.record_dt)
+        self.lanes = 0
+
+    @property
+    def size(self):
+        return sum(y.size for mask, y, w in self.data.values())
+
+    def simulate(self, params):
+        s_rec, vs_rec = self.model.simulate(params, self.times)
+        self.lanes += s_rec.shape[0]
+        return s_rec, vs_rec
+
+    def residuals(self, s_rec, vs_rec, tau):
+        """Résidus pondérés, array[K, size], avec le décalage tau[K] de chaque ligne"""
+        parts = []
+        for name, (mask, y, w) in self.data.items():
+            rec = s_rec if name == 's' else vs_rec
+            sim = self._interp(self.t[mask][None] + np.asarray(tau)[:, None], rec)
+            if name == 's':
+                res = sim - y
+                res -= res.mean(axis=1, keepdims=True)
+            else:
+                res = np.abs(sim) - y
+            parts.append(w*res)
+        return np.hstack(parts)
+
+    def s_offset(self, s_rec, tau):
+        """Décalage des distances mesurées par rapport à la simulation [m]"""
+        if 's' not in self.data:
+            return np.nan
+        mask, y, w = self.data['s']
+        sim = self._interp(self.t[mask][None] + np.asarray(tau)[:, None], s_rec)
+        return float(np.mean(y - sim[0]))
+
+    def rms(self, s_rec, vs_rec, tau):
+        res = self.residuals(s_rec, vs_rec, tau)[0]
+        rms = {}
+        start = 0
+        for name, (mask, y, w) in self.data.items():
+            rms[name] = float(np.sqrt(np.mean(res[start:start + y.size]**2))/w)
+            start += y.size
+        return rms
+
+    def _interp(self, t, rec):
+        """Interpolation linéaire des enregistrements (pas constant) aux instants t[K, n]"""
+        x = np.clip(t/self.record_dt, 0, rec.shape[1] - 1)
+        i = np.minimum(x.astype(int), rec.shape[1] - 2)
+        w = x - i
+        y0 = np.take_along_axis(rec, i, axis=1)
+        y1 = np.take_along_axis(rec, i + 1, axis=1)
+        return y0 + w*(y1 - y0)
+
+
+def calibrate(model, t, s, vs, fit=('e',), series=('s', 'vs'), initial=None, grid=None,
+              tau_range=(-0.5, 0.5), tau_step=0.005, record_dt=0.005, confidence=0.95):
+    """Ajuste les paramètres d'un modèle sur des mesures s(t) et Vs(t)
+
+    Une recherche sur une grille (tous les candidats du premier paramètre sont
+    simulés ensemble, pour chaque décalage de temps de la grille) donne le
+    point de départ d'un ajustement par moindres carrés de tous les paramètres
+    de fit et du décalage de temps tau, dont le jacobien est lui aussi obtenu
+    en une seule simulation vectorisée.
+
+    Les intervalles de confiance viennent de la matrice de covariance
+    (J^T J)^-1 σ², σ² étant la variance des résidus. Les résidus successifs
+    étant corrélés, ils sont plutôt optimistes.
+
+    Args:
+        model (objet): ParabolaModel ou PathModel
+        t (array): temps des mesures [s]
+        s (array): distances curvilignes mesurées [m] (NaN si absentes)
+        vs (array): vitesses mesurées [m/s], en norme (NaN si absentes)
+        fit (tuple): paramètres à ajuster parmi model.names
+        series (tuple): séries comparées, 's' et/ou 'vs'
+        initial (dict): valeurs initiales (et fixes si non ajustées) des
+            paramètres, model.defaults par défaut
+        grid (array): candidats du premier paramètre de fit pour la recherche
+            initiale, 201 valeurs de 0 à 5 fois sa valeur initiale par défaut
+        tau_range (tuple): décalages de temps (min, max) permis [s]
+        tau_step (float): pas de la grille des décalages de temps [s]
+        record_dt (float): intervalle d'enregistrement des simulations [s]
+        confidence (float): niveau de confiance des intervalles
+
+    Raises:
+        ValueError: si un paramètre à ajuster n'existe pas dans le modèle
+
+    Returns:
+        CalibrationResult: valeurs ajustées et intervalles de confiance
+    """
+    from scipy.optimize import least_squares  # import lent, seulement ici
+
+    start = time.perf_counter()
+    for name in fit:
+        if name not in model.names:
+            raise ValueError("Paramètre inconnu pour ce modèle : {}".format(name))
+    values = dict(model.defaults, **(initial or {}))
+    objective = _Objective(model, t, s, vs, series, record_dt, max(abs(tau) for tau in tau_range))
+
+    # Recherche sur une grille du premier paramètre et du décalage de temps
+    first = fit[0]
+    if grid is None:
+        grid = np.linspace(0., 5*values[first], 201)
+    grid = np.asarray(grid, dtype=float)
+    params = {name: np.full(grid.size, values[name]) for name in model.names}
+    params[first] = grid
+    s_rec, vs_rec = objective.simulate(params)
+    taus = np.arange(tau_range[0], tau_range[1] + tau_step/2, tau_step)
+    cost = np.array([np.sum(objective.residuals(s_rec, vs_rec, np.full(grid.size, tau))**2, axis=1)
+                     for tau in taus])
+    i_tau, i_grid = np.unravel_index(np.nanargmin(cost), cost.shape)
+    values[first] = grid[i_grid]
+
+    # Moindres carrés sur (fit..., tau), résidus et jacobien en une simulation
+    x0 = np.array([values[name] for name in fit] + [taus[i_tau]])
+    scale = np.array([abs(values[name]) or 1e-3 for name in fit] + [tau_step])
+    lower = [model.bounds[name][0] for name in fit] + [tau_range[0]]
+    upper = [model.bounds[name][1] for name in fit] + [tau_range[1]]
+    x0 = np.clip(x0, lower, upper)
+    jacobians = {}
+
+    def residuals(x):
+        n = len(fit)
+        delta = 1e-6*np.maximum(np.abs(x), scale)
+        rows = np.repeat(x[None], n + 1, axis=0)
+        rows[1:, :n] += np.diag(delta[:n])
+        lanes = {name: np.full(n + 1, values[name]) for name in model.names}
+        for k, name in enumerate(fit):
+            lanes[name] = rows[:, k]
+        s_rec, vs_rec = objective.simulate(lanes)
+        res = objective.residuals(s_rec, vs_rec, rows[:, n])
+        res_tau = objective.residuals(s_rec[:1], vs_rec[:1], rows[:1, n] + delta[n])
+        jacobians[x.tobytes()] = np.vstack(((res[1:] - res[0])/delta[:n, None],
+                                            (res_tau - res[0])/delta[n])).T
+        return res[0]
+
+    def jacobian(x):
+        if x.tobytes() not in jacobians:
+            residuals(x)
+        return jacobians[x.tobytes()]
+
+    solution = least_squares(residuals, x0, jac=jacobian, bounds=(lower, upper), x_scale=scale)
+    x = solution.x
+
+    # Intervalles de confiance
+    J = jacobian(x)
+    dof = max(1, objective.size - len(x) - ('s' in objective.data))
+    sigma2 = 2*solution.cost/dof
+    try:
+        cov = np.linalg.inv(J.T @ J)*sigma2
+        half = statistics.NormalDist().inv_cdf((1 + confidence)/2)*np.sqrt(np.diag(cov))
+    except np.linalg.LinAlgError:
+        half = np.full(len(x), np.nan)
+
+    names = list(fit) + ['tau']
+    for name, value in zip(names, x):
+        values[name] = float(value)
+    best = {name: np.array([values[name]]) for name in model.names}
+    s_rec, vs_rec = objective.simulate(best)
+    tau = np.array([values['tau']])
+    values['s_offset'] = objective.s_offset(s_rec, tau)
+    return CalibrationResult({name: float(v) for name, v in values.items()},
+                             dict(zip(names, half.tolist())), confidence,
+                             objective.rms(s_rec, vs_rec, tau), objective.lanes,
+                             time.perf_counter() - start)
+
+
+def calibrate_file(model, filename, **kwargs):
+    """Calibre un modèle sur un fichier Tracker (voir calibrate)"""
+    t, s, vs, As = tracker_from_file(filename)
+    return calibrate(model, t, s, vs, **kwargs)
+
+
+if __name__ == "__main__":
+    import json
+    import sys
+
+    filename = sys.argv[1] if len(sys.argv) > 1 else 'datas/tracker_data.txt'
+    for fit in (('e',), ('e', 'h')):
+        result = calibrate_file(ParabolaModel(), filename, fit=fit)
+        print(json.dumps(result.summary(), indent=2))
@@ -0,0 +1,219 @@
+# Simulation en ligne de commande, sans interface graphique
+#
+#   python cli.py datas/xyz_circuit_real.txt -o resultats.npz --summary resume.json
+#
+# matplotlib n'est importé que si --plot est demandé, numpy et les modules de
+# simulation seulement une fois les arguments lus.
+import argparse
+import contextlib
+import json
+import sys
+import time
+
+_START = time.perf_counter()
+
+
+def parse_args(argv=None):
+    """Lit les arguments de la ligne de commande"""
+    parser = argparse.ArgumentParser(
+        description="Simule le mouvement d'une bille sur un circuit 3D.")
+    parser.add_argument('track', help="fichier des points de passage (x y z en cm, "
+                                      "et inclinaison des rails en degrés en option)")
+    parser.add_argument('-o', '--output',
+                        help="fichier des résultats (.npz ou .csv) ; aucun si absent")
+    parser.add_argument('--summary',
+                        help="fichier du résumé JSON ; sortie standard si absent")
+    parser.add_argument('--plot', action='store_true',
+                        help="affiche les graphiques (importe matplotlib)")
+    parser.add_argument('--store', metavar='DOSSIER',
+                        help="relit le résultat s'il a déjà été calculé, sinon le sauve "
+                             "(voir result_store.py)")
+    profile = parser.add_argument_group('mesure des temps (voir profiling.py)')
+    profile.add_argument('--profile', action='store_true',
+                         help="ajoute au résumé le temps de chaque phase")
+    profile.add_argument('--cprofile', action='store_true',
+                         help="ajoute au résumé le profil de cProfile (avec --profile)")
+    profile.add_argument('--trace',
+                         help="fichier de la chronologie des phases (avec --profile)")
+    physics = parser.add_argument_group('paramètres physiques')
+    physics.add_argument('-e', type=float, default=0.00073, help="coefficient de frottement")
+    physics.add_argument('-r', type=float, default=0.008, help="rayon de la bille [m]")
+    physics.add_argument('-m', type=float, default=0.008, help="masse de la bille [kg]")
+    physics.add_argument('-b', type=float, default=0.014, help="écart des rails [m]")
+    physics.add_argument('-g', type=float, default=9.81, help="gravité [m/s²]")
+    numerics = parser.add_argument_group('intégration')
+    numerics.add_argument('--integrator', default='euler',
+                          choices=('euler', 'verlet', 'rk4', 'rk45', 'arclength'))
+    numerics.add_argument('--dt', type=float, default=0.0001,
+                          help="pas de temps (pas initial pour rk45) [s]")
+    numerics.add_argument('--tEnd', type=float, default=20, help="durée maximale [s]")
+    numerics.add_argument('--rtol', type=float, default=1e-6, help="tolérance relative (rk45)")
+    numerics.add_argument('--atol', type=float, default=1e-9, help="tolérance absolue (rk45)")
+    numerics.add_argument('--events', nargs='*',
+                          choices=('end', 'stall', 'lift_off', 'derail'),
+                          help="événements terminaux (voir Simulator)")
+    numerics.add_argument('--steps', type=int, default=400,
+                          help="nombre de points du chemin")
+    numerics.add_argument('--every', type=int, default=1,
+                          help="n'enregistre qu'un pas sur EVERY")
+    numerics.add_argument('--no-jit', dest='jit', action='store_false',
+                          help="n'utilise pas la boucle compilée par numba (euler)")
+    args = parser.parse_args(argv)
+    if args.events and 'derail' in args.events and _banked(args.track) is False:
+        parser.error("--events derail : {} ne donne pas d'inclinaison des rails "
+                     "(4e colonne)".format(args.track))
+    return args
+
+
+def _banked(filename):
+    """Indique si un fichier de circuit donne une inclinaison non nulle
+
+    Lecture en Python pur, pour ne pas importer numpy avant la simulation.
+
+    Returns:
+        bool: vrai si une ligne a une 4e colonne non nulle, None si le fichier
+            ne peut être lu (l'erreur est alors signalée par run)
+    """
+    try:
+        with open(filename) as f:
+            for line in f:
+                fields = line.split()
+                try:
+                    if len(fields) >= 4 and float(fields[3]) != 0:
+                        return True
+                except ValueError:  # en-tête
+                    continue
+    except (OSError, UnicodeDecodeError):
+        return None
+    return False
+
+
+def run(args):
+    """Lance la simulation décrite par les arguments
+
+    Returns:
+        tuple: (SimulationResult, résumé sous forme de dictionnaire)
+    """
+    start = time.perf_counter()
+    import integrators
+    import kernels
+    import path3d as p3d
+    import profiling
+    import shape
+    from path_cache import cached_path
+    from simulator import BankedSimulator, Simulator
+    import_time = time.perf_counter() - start
+
+    profiler = None
+    if args.profile:
+        profiler = profiling.Profiler(cprofile=args.cprofile, trace=bool(args.trace))
+    with profiler or contextlib.nullcontext():
+        start = time.perf_counter()
+        points, beta = shape.track_from_file(args.track)
+        path = cached_path(points, args.steps)
+        params = {}
+        simulator_class = Simulator
+        if beta.any():
+            simulator_class = BankedSimulator
+            params['beta'] = p3d.path_tilt(points, beta, args.steps)
+        path_time = time.perf_counter() - start
+
+        integrator = args.integrator
+        if integrator == 'rk45':
+            integrator = integrators.RK45(rtol=args.rtol, atol=args.atol, dt=args.dt)
+        simulator = simulator_class(path, r=args.r, m=args.m, b=args.b, e=args.e, g=args.g,
+                                    dt=args.dt, tEnd=args.tEnd, integrator=integrator,
+                                    events=args.events, jit=args.jit,
+                                    recorder=args.every if args.every > 1 else None, **params)
+        start = time.perf_counter()
+        if args.store:
+            from result_store import ResultStore
+            store = ResultStore(args.store)
+            result = store.run(simulator)
+        else:
+            result = simulator.run()
+        wall_time = time.perf_counter() - start
+
+    steps = result.steps
+    E_tot = result.E_tot
+    summary = {
+        'track': args.track,
+        'parameters': {'e': args.e, 'r': args.r, 'm': args.m, 'b': args.b, 'g': args.g},
+        'integrator': args.integrator,
+        'banked': bool(beta.any()),
+        'dt': args.dt,
+        'jit': simulator.jit and kernels.compiled_euler_loop() is not None,
+        'length': float(result.length),
+        'finished': bool(result.finished),
+        'finish_time': float(result.finish_time),
+        'energy_loss': float(E_tot[0] - E_tot[-1]),
+        'events': [[name, float(t), float(s), float(vs)] for name, t, s, vs in result.events],
+        'steps': steps,
+        'records': len(result.t),
+        'n_eval': result.n_eval,
+        'wall_time': wall_time,
+        'steps_per_second': steps/wall_time if wall_time > 0 else None,
+        'path_time': path_time,
+        'import_time': import_time,
+        'startup_time': start - _START,  # du lancement du module au début du calcul
+    }
+    if args.store:
+        summary['stored'] = store.hits > 0  # résultat relu plutôt que calculé
+    if profiler is not None:
+        summary['profile'] = profiler.report()
+        if args.trace:
+            profiler.save_trace(args.trace)
+    return result, summary
+
+
+def save_result(result, filename):
+    """Sauve les trajectoires en .npz (ou en .csv selon l'extension)"""
+    import numpy as np
+    columns = {'t': result.t, 's': result.s, 'vs': result.vs, 'a': result.a,
+               'E_cin': result.E_cin, 'E_pot': result.E_pot}
+    if filename.endswith('.csv'):
+        np.savetxt(filename, np.column_stack(list(columns.values())), delimiter=',',
+                   header=','.join(columns), comments='')
+    else:
+        np.savez(filename, **columns)
+
+
+def plot(result):
+    """Affiche vitesse, distance et énergies (import tardif de matplotlib)"""
+    import matplotlib.pyplot as plt
+    plt.figure()
+    plt.subplot(211)
+    plt.plot(result.t, result.vs)
+    plt.ylabel("Vitesse tangentielle [m/s]")
+    plt.subplot(212)
+    plt.plot(result.t, result.s)
+    plt.ylabel('Distance curviligne [m]')
+    plt.xlabel('Temps [s]')
+    plt.figure()
+    plt.plot(result.t, result.E_pot, 'b-', label='Energie potentielle')
+    plt.plot(result.t, result.E_cin, 'r-', label='Energie cinétique')
+    plt.plot(result.t, result.E_tot, 'k-', label='Energie mécanique totale')
+    plt.legend()
+    plt.ylabel('Energie [J]')
+    plt.xlabel('Temps [s]')
+    plt.show()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    result, summary = run(args)
+    if args.output:
+        save_result(result, args.output)
+    text = json.dumps(summary, indent=2)
+    if args.summary:
+        with open(args.summary, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    if args.plot:
+        plot(result)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
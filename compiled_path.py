@@ -0,0 +1,104 @@
+# Chemin "compilé" : table de consultation sur une grille uniforme en distance curviligne
+import numpy as np
+
+import path3d as p3d
+
+
+class CompiledPath:
+    """Chemin rééchantillonné sur une grille uniforme en distance curviligne
+
+    X, T et C sont stockés dans un seul tableau contigu array[n, 9] ; la
+    consultation en s se fait par un calcul d'indice et une interpolation
+    linéaire, sans recherche dichotomique.
+
+    Args:
+        path (tuple): (sPath, XPath, TPath, CPath) tel que retourné par path3d.path()
+        n (int): nombre de points de la grille, par défaut 4 fois celui du chemin
+    """
+
+    def __init__(self, path, n=None):
+        sPath, XPath, TPath, CPath = path
+        if not n:
+            n = 4*len(sPath)
+        self.path = path
+        self.n = n
+        self.length = sPath[-1]
+        self.s = np.linspace(sPath[0], sPath[-1], n)
+        self.ds = self.s[1] - self.s[0]
+        self.table = np.ascontiguousarray(
+            p3d.ainterp(self.s, sPath, np.vstack((XPath, TPath, CPath))).T)
+
+    def at(self, s):
+        """Retourne X, T et C en un point du chemin
+
+        Args:
+            s (float): distance curviligne du point
+
+        Returns:
+            array: array[9] avec X (0:3), T (3:6) et C (6:9)
+        """
+        u = (s - self.s[0])/self.ds
+        if u <= 0:
+            return self.table[0].copy()
+        if u >= self.n - 1:
+            return self.table[-1].copy()
+        j = int(u)
+        v0, v1 = self.table[j], self.table[j+1]
+        return v0 + (v1 - v0)*(u - j)
+
+    def at_many(self, s):
+        """Retourne X, T et C en plusieurs points du chemin
+
+        Args:
+            s (array): distances curvilignes des M points
+
+        Returns:
+            array: array[M, 9] avec X (0:3), T (3:6) et C (6:9)
+        """
+        u = np.clip((np.asarray(s, dtype=float) - self.s[0])/self.ds, 0, self.n - 1)
+        j = np.minimum(u.astype(int), self.n - 2)
+        f = (u - j)[..., None]
+        v0 = self.table[j]
+        return v0 + (self.table[j+1] - v0)*f
+
+    def as_path(self):
+        """Retourne la grille sous la forme (sPath, XPath, TPath, CPath) de path3d.path()"""
+        table = self.table.T
+        return self.s, table[0:3], table[3:6], table[6:9]
+
+    def max_error(self, samples=None):
+        """Calcule l'erreur maximale d'interpolation par rapport à path3d.ainterp
+
+        Args:
+            samples (int): nombre de points de comparaison, par défaut 10 par
+                intervalle de la grille (les points du chemin d'origine sont
+                toujours inclus)
+
+        Returns:
+            dict: erreur absolue maximale sur X, T et C
+        """
+        sPath, XPath, TPath, CPath = self.path
+        if not samples:
+            samples = 10*self.n
+        s = np.union1d(np.linspace(sPath[0], sPath[-1], samples), sPath)
+        exact = p3d.ainterp(s, sPath, np.vstack((XPath, TPath, CPath))).T
+        error = np.abs(self.at_many(s) - exact)
+        return {'X': error[:, 0:3].max(), 'T': error[:, 3:6].max(), 'C': error[:, 6:9].max()}
+
+
+def compile_path(path, tol, n=None, n_max=2**20):
+    """Compile un chemin en doublant la grille jusqu'à une erreur sur X, T et C ≤ tol
+
+    Args:
+        path (tuple): (sPath, XPath, TPath, CPath) tel que retourné par path3d.path()
+        tol (float): erreur absolue maximale acceptée
+        n (int): nombre de points de départ de la grille
+        n_max (int): nombre maximal de points de la grille
+
+    Returns:
+        CompiledPath: le chemin compilé (le plus fin essayé si tol n'est pas atteint)
+    """
+    compiled = CompiledPath(path, n)
+    while max(compiled.max_error().values()) > tol and 2*compiled.n <= n_max:
+        compiled = CompiledPath(path, 2*compiled.n)
+    return compiled
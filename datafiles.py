@@ -0,0 +1,136 @@
+# Chargement des fichiers de données (colonnes de nombres) avec un cache binaire
+import hashlib
+import io
+import json
+import os
+
+import numpy as np
+
+
+def load_table(filename, columns=None, allow_nan=False, cache=True):
+    """Charge un fichier texte de colonnes de nombres (flottants)
+
+    Une éventuelle ligne d'en-tête (non numérique) est ignorée. Le tableau lu
+    est sauvé à côté du fichier (filename.cache.npy et filename.cache.json) ;
+    les chargements suivants lisent ce cache en mémoire partagée (memmap) tant
+    que la date de modification et la taille du fichier, ou à défaut son
+    empreinte sha1, n'ont pas changé.
+
+    Args:
+        filename (str): nom du fichier
+        columns (int): nombre de colonnes attendu (non vérifié si None)
+        allow_nan (bool): accepte les cases NaN
+        cache (bool): utilise et met à jour le cache binaire
+
+    Raises:
+        ValueError: si le fichier est vide, si une ligne n'a pas le nombre de
+            colonnes des autres ou une valeur non numérique, si le nombre de
+            colonnes n'est pas celui attendu ou s'il contient des NaN non
+            autorisés (le message commence par le nom du fichier)
+
+    Returns:
+        array: tableau array[lignes, colonnes] en lecture seule
+    """
+    stat = os.stat(filename)
+    data = _load_cache(filename, stat) if cache else None
+    if data is None:
+        with open(filename, 'rb') as f:
+            content = f.read()
+        data = _parse(content, filename)
+        if cache:
+            _save_cache(filename, stat, content, data)
+
+    if columns is not None and data.shape[1] != columns:
+        raise ValueError("{} : {} colonnes au lieu de {}".format(filename, data.shape[1], columns))
+    if not allow_nan:
+        rows = np.nonzero(np.isnan(data).any(axis=1))[0]
+        if rows.size:
+            raise ValueError("{} : valeur manquante (NaN) à la ligne de données {}".format(
+                filename, rows[0] + 1))
+    return data
+
+
+def tracker_from_file(filename):
+    """Charge les données du logiciel Tracker (en-tête "t S Vs As", cases NaN)
+
+    Args:
+        filename (str): nom du fichier
+
+    Returns:
+        tuple: (t, s, Vs, As) en unités SI, NaN là où Tracker n'a pas de valeur
+    """
+    return tuple(load_table(filename, columns=4, allow_nan=True).T)
+
+
+def simulation_from_file(filename):
+    """Charge des données de simulation sauvées par np.savetxt (t s Vs)
+
+    Args:
+        filename (str): nom du fichier
+
+    Returns:
+        tuple: (t, s, Vs) en unités SI
+    """
+    return tuple(load_table(filename, columns=3).T)
+
+
+def _parse(content, filename):
+    """Lit les colonnes de flottants d'un contenu texte, en sautant l'en-tête"""
+    skip = 0
+    try:
+        [float(x) for x in content.split(b'\n', 1)[0].split()]
+    except ValueError:
+        skip = 1
+    try:
+        data = np.loadtxt(io.BytesIO(content), dtype=float, skiprows=skip, ndmin=2)
+    except ValueError as error:  # ligne de longueur différente ou non numérique
+        raise ValueError("{} : {}".format(filename, error)) from error
+    if data.size == 0:
+        raise ValueError("{} : aucune donnée".format(filename))
+    data.setflags(write=False)
+    return data
+
+
+def _cache_paths(filename):
+    return filename + '.cache.npy', filename + '.cache.json'
+
+
+def _load_cache(filename, stat):
+    """Retourne le tableau du cache s'il correspond encore au fichier, sinon None"""
+    npy, meta = _cache_paths(filename)
+    try:
+        with open(meta) as f:
+            key = json.load(f)
+        if key['size'] != stat.st_size:
+            return None
+        if key['mtime_ns'] != stat.st_mtime_ns:
+            # Fichier touché : on vérifie son contenu avant de réutiliser le cache
+            with open(filename, 'rb') as f:
+                if hashlib.sha1(f.read()).hexdigest() != key['sha1']:
+                    return None
+            key['mtime_ns'] = stat.st_mtime_ns
+            _write_json(meta, key)
+        return np.load(npy, mmap_mode='r')
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _save_cache(filename, stat, content, data):
+    """Ecrit le cache d'un fichier (ignoré si le dossier n'est pas accessible)"""
+    npy, meta = _cache_paths(filename)
+    try:
+        tmp = npy + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.save(f, data)
+        os.replace(tmp, npy)
+        _write_json(meta, {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                           'sha1': hashlib.sha1(content).hexdigest()})
+    except OSError:
+        pass
+
+
+def _write_json(filename, obj):
+    tmp = filename + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(obj, f)
+    os.replace(tmp, filename)
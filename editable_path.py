@@ -0,0 +1,199 @@
+# Chemin modifiable : déplacement, insertion et suppression de points de passage
+# sans reconstruire tout le chemin
+import numpy as np
+
+
+class EditablePath:
+    """Chemin passant par des points de passage modifiables
+
+    Le chemin est la spline cubique d'interpolation des points de passage
+    (paramètre : corde accumulée, extrémités "not-a-knot", comme
+    path3d.path_spline), échantillonnée à samples points par intervalle entre
+    deux points de passage. T et C sont calculés à partir des dérivées de la
+    spline (comme path3d.path_analytic) et s est la corde accumulée entre les
+    échantillons (comme path3d.path_vectors).
+
+    L'influence d'un point de passage sur une spline cubique décroît d'un
+    facteur 2 - sqrt(3) ≈ 0.27 par intervalle. Après une modification, seule
+    la spline des window intervalles de part et d'autre est donc recalculée, en
+    imposant aux bords de cette fenêtre les dérivées de la spline précédente ;
+    les distances curvilignes en aval sont simplement décalées. L'écart avec
+    une reconstruction complète est de l'ordre de 0.27**window (voir check).
+
+    Args:
+        points (array): N points de passage, array[3, N] [m]
+        samples (int): nombre d'échantillons par intervalle
+        window (int): demi-largeur de la zone recalculée [intervalles]
+
+    Attributes:
+        sPath (array): distance curviligne des échantillons, array[M]
+        XPath (array): coordonnées des échantillons, array[3, M]
+        TPath (array): vecteur tangent unitaire, array[3, M]
+        CPath (array): vecteur de courbure, array[3, M]
+    """
+
+    def __init__(self, points, samples=10, window=24):
+        self.samples = samples
+        self.window = window
+        self._points = np.array(points, dtype=float)
+        self.rebuild()
+
+    @property
+    def points(self):
+        """Points de passage (copie), array[3, N]"""
+        return self._points.copy()
+
+    def path(self):
+        """Retourne (sPath, XPath, TPath, CPath), comme path3d.path()
+
+        Les tableaux retournés sont ceux du chemin : ils changent à chaque
+        modification.
+        """
+        return self.sPath, self.XPath, self.TPath, self.CPath
+
+    def rebuild(self):
+        """Reconstruit tout le chemin"""
+        from scipy.interpolate import CubicSpline  # import lent, seulement ici
+
+        n = self._points.shape[1]
+        self._tau = _chord(self._points)
+        self._c = CubicSpline(self._tau, self._points, axis=1).c  # array[4, N-1, 3]
+        m = (n - 1)*self.samples + 1
+        self.sPath = np.zeros(m)
+        self.XPath = np.empty((3, m))
+        self.TPath = np.empty((3, m))
+        self.CPath = np.empty((3, m))
+        self._sample(0, n - 1)
+        self._arc_length(0, m - 1)
+
+    def move(self, i, point):
+        """Déplace le point de passage i
+
+        Args:
+            i (int): indice du point de passage
+            point (array): nouvelles coordonnées [m]
+        """
+        i = range(self._points.shape[1])[i]
+        self._points[:, i] = point
+        self._update(i - 1, i + 1)
+
+    def insert(self, i, point):
+        """Insère un point de passage, qui prend l'indice i
+
+        Args:
+            i (int): indice du nouveau point de passage (0 ≤ i ≤ N)
+            point (array): coordonnées [m]
+        """
+        n = self._points.shape[1]
+        if not 0 <= i <= n:
+            raise IndexError("Indice d'insertion hors du chemin : {}".format(i))
+        S = self.samples
+        self._points = np.insert(self._points, i, point, axis=1)
+        # Un intervalle de plus (valeurs provisoires, recalculées ensuite)
+        j = min(i, n - 1)
+        self._c = np.insert(self._c, j, self._c[:, max(j - 1, 0)], axis=1)
+        k = j*S
+        for name in ('XPath', 'TPath', 'CPath'):
+            setattr(self, name, np.insert(getattr(self, name), [k]*S, 0., axis=1))
+        self.sPath = np.insert(self.sPath, [k]*S, self.sPath[k])
+        self._update(i - 1, i + 1)
+
+    def delete(self, i):
+        """Supprime le point de passage i"""
+        n = self._points.shape[1]
+        i = range(n)[i]
+        if n <= 2:
+            raise ValueError("Un chemin a au moins deux points de passage")
+        S = self.samples
+        self._points = np.delete(self._points, i, axis=1)
+        j = min(i, n - 2)
+        self._c = np.delete(self._c, j, axis=1)
+        k = np.arange(j*S, (j + 1)*S)
+        if i == n - 1:
+            k += 1  # le dernier échantillon est celui du point supprimé
+        for name in ('XPath', 'TPath', 'CPath'):
+            setattr(self, name, np.delete(getattr(self, name), k, axis=1))
+        self.sPath = np.delete(self.sPath, k)
+        self._update(i - 1, i)
+
+    def check(self):
+        """Compare le chemin à une reconstruction complète
+
+        Returns:
+            dict: écart maximal sur chaque élément ('s', 'X', 'T', 'C')
+        """
+        full = EditablePath(self._points, self.samples, self.window)
+        return {name: float(np.max(np.abs(a - b)))
+                for name, a, b in zip('sXTC', self.path(), full.path())}
+
+    def _update(self, first, last):
+        """Recalcule le chemin après une modification des points first..last
+
+        Les intervalles dont le paramètre a changé sont ceux entre first et
+        last ; la spline est recalculée sur window intervalles de plus de part
+        et d'autre.
+        """
+        from scipy.interpolate import CubicSpline
+
+        n = self._points.shape[1]
+        self._tau = _chord(self._points)
+        lo = max(0, first - self.window)
+        hi = min(n - 1, last + self.window)
+        # Dérivées imposées aux bords de la fenêtre (dans la spline précédente,
+        # les intervalles lo et hi ne sont pas touchés par la modification)
+        left = 'not-a-knot' if lo == 0 else (1, self._c[2, lo])
+        right = 'not-a-knot' if hi == n - 1 else (1, self._c[2, hi])
+        if hi - lo < 3 and 'not-a-knot' in (left, right):
+            self._c = CubicSpline(self._tau, self._points, axis=1).c
+            lo, hi = 0, n - 1
+        else:
+            spline = CubicSpline(self._tau[lo:hi+1], self._points[:, lo:hi+1], axis=1,
+                                 bc_type=(left, right))
+            self._c[:, lo:hi] = spline.c
+        self._sample(lo, hi)
+        self._arc_length(lo*self.samples, hi*self.samples)
+
+    def _sample(self, lo, hi):
+        """Echantillonne les intervalles lo..hi-1 (et la fin si hi est le dernier point)"""
+        S = self.samples
+        dtau = np.diff(self._tau[lo:hi+1])
+        u = dtau[:, None]*np.linspace(0., 1., S, endpoint=False)
+        elements = _evaluate(self._c[:, lo:hi, None, :], u[..., None])
+        for name, value in zip(('XPath', 'TPath', 'CPath'), elements):
+            getattr(self, name)[:, lo*S:hi*S] = value.reshape(-1, 3).T
+        if hi == self._points.shape[1] - 1:
+            elements = _evaluate(self._c[:, -1], dtau[-1])
+            for name, value in zip(('XPath', 'TPath', 'CPath'), elements):
+                getattr(self, name)[:, -1] = value
+
+    def _arc_length(self, first, last):
+        """Recalcule s entre les échantillons first et last et décale l'aval"""
+        s = (self.sPath[first] if first else 0.) + _chord(self.XPath[:, first:last+1])
+        shift = s[-1] - self.sPath[last]
+        self.sPath[first:last+1] = s
+        self.sPath[last+1:] += shift
+
+
+def _evaluate(c, u):
+    """Point, vecteur tangent et vecteur de courbure d'une spline cubique
+
+    Args:
+        c (array): coefficients des polynômes en (tau - début de l'intervalle),
+            array[4, ..., 3]
+        u (array): tau - début de l'intervalle, diffusable avec c[0]
+
+    Returns:
+        tuple: (X, T, C), array[..., 3]
+    """
+    X = ((c[0]*u + c[1])*u + c[2])*u + c[3]
+    dX = (3*c[0]*u + 2*c[1])*u + c[2]
+    d2X = 6*c[0]*u + 2*c[1]
+    speed = np.sqrt(np.sum(dX**2, axis=-1, keepdims=True))
+    T = dX/speed
+    C = (d2X - np.sum(d2X*T, axis=-1, keepdims=True)*T)/speed**2
+    return X, T, C
+
+
+def _chord(points):
+    """Corde accumulée le long de points, array[3, N] -> array[N]"""
+    return np.hstack((0., np.cumsum(np.sqrt(np.sum(np.diff(points)**2, axis=0)))))
@@ -0,0 +1,193 @@
+# Etudes de Monte Carlo : effet des erreurs de relevé des points de passage
+import multiprocessing
+import os
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import path3d as p3d
+from simulator import Simulator
+
+# Résultat d'une simulation de l'ensemble
+SAMPLE_DTYPE = np.dtype([
+    ('finished', bool),      # vrai si la bille a atteint la fin du chemin
+    ('finish_time', float),  # temps de parcours [s] (nan sinon)
+    ('length', float),       # longueur du chemin [m]
+    ('vs_max', float),       # vitesse maximale [m/s]
+    ('normal_min', float),   # force normale spécifique minimale, selon la normale
+                             # des rails (Simulator.normal_force, < 0 : décollage) [m/s²]
+])
+
+
+class EnsembleResult:
+    """Résultats d'une étude de Monte Carlo
+
+    Attributes:
+        samples (array): tableau structuré, un élément par tirage (voir SAMPLE_DTYPE)
+        workers (dict): par processus, nombre de tirages, temps de calcul [s]
+            et débit [tirages/s]
+        wall_time (float): durée totale [s]
+    """
+
+    def __init__(self, samples, workers, wall_time):
+        self.samples = samples
+        self.workers = workers
+        self.wall_time = wall_time
+
+    def distribution(self, name, percentiles=(5, 50, 95)):
+        """Statistiques d'une grandeur sur les tirages terminés
+
+        Args:
+            name (str): 'finish_time', 'length', 'vs_max' ou 'normal_min'
+            percentiles (tuple): centiles à calculer
+
+        Returns:
+            dict: moyenne, écart type, minimum, maximum et centiles
+        """
+        values = self.samples[name][self.samples['finished']]
+        if values.size == 0:
+            return {}
+        stats = {'mean': values.mean(), 'std': values.std(), 'min': values.min(),
+                 'max': values.max()}
+        for p, v in zip(percentiles, np.percentile(values, percentiles)):
+            stats['p{}'.format(p)] = v
+        return stats
+
+    def summary(self):
+        """Résumé de l'étude : distributions et débit"""
+        return {
+            'samples': len(self.samples),
+            'finished': int(self.samples['finished'].sum()),
+            'finish_time': self.distribution('finish_time'),
+            'vs_max': self.distribution('vs_max'),
+            'normal_min': self.distribution('normal_min'),
+            'wall_time': self.wall_time,
+            'samples_per_second': len(self.samples)/self.wall_time,
+            'workers': self.workers,
+        }
+
+
+def perturb(points, sigma, n, seed=None):
+    """Tire n jeux de points de passage bruités
+
+    Args:
+        points (array): points de passage, array[3, N] [m]
+        sigma (float): écart type du bruit gaussien sur chaque coordonnée [m]
+        n (int): nombre de tirages
+        seed (int): graine du générateur aléatoire
+
+    Returns:
+        array: points bruités, array[n, 3, N]
+    """
+    rng = np.random.default_rng(seed)
+    return points[None] + rng.normal(0., sigma, (n,) + points.shape)
+
+
+def simulate_sample(points, steps=None, **params):
+    """Construit le chemin et simule un tirage
+
+    Args:
+        points (array): points de passage, array[3, N]
+        steps (int): nombre de points du chemin
+        **params: paramètres transmis à Simulator
+
+    Returns:
+        tuple: valeurs des champs de SAMPLE_DTYPE
+    """
+    simulator = Simulator(p3d.path(points, steps), **params)
+    result = simulator.run()
+    normal = min(simulator.normal_force(s, vs) for s, vs in zip(result.s, result.vs))
+    return (result.finished, result.finish_time if result.finished else np.nan,
+            result.length, np.max(np.abs(result.vs)), normal)
+
+
+def run_ensemble(points, sigma=0.003, n=1000, seed=None, steps=None, workers=None,
+                 chunksize=None, integrator='rk4', dt=0.01, **params):
+    """Simule n tirages de points de passage bruités sur plusieurs processus
+
+    Les points bruités sont placés en mémoire partagée, de même que le
+    tableau des résultats : les processus ne s'échangent que des bornes de
+    paquets de tirages et leurs compteurs.
+
+    Args:
+        points (array): points de passage relevés, array[3, N] [m]
+        sigma (float): écart type de l'erreur de relevé [m]
+        n (int): nombre de tirages
+        seed (int): graine du générateur aléatoire
+        steps (int): nombre de points de chaque chemin
+        workers (int): nombre de processus, par défaut le nombre de coeurs
+            (1 : calcul dans le processus courant)
+        chunksize (int): tirages par paquet, par défaut ~4 paquets par processus
+        integrator (str ou objet): schéma d'intégration
+        dt (float): pas de temps [s]
+        **params: paramètres physiques transmis à Simulator
+
+    Returns:
+        EnsembleResult: résultats de l'étude
+    """
+    start = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    chunksize = chunksize or max(1, n//(4*workers))
+    chunks = [(i, min(i + chunksize, n)) for i in range(0, n, chunksize)]
+    params = dict(params, integrator=integrator, dt=dt, steps=steps)
+
+    inputs = perturb(np.asarray(points, dtype=float), sigma, n, seed)
+    samples = np.zeros(n, dtype=SAMPLE_DTYPE)
+    if workers == 1:
+        stats = [_run_chunk(inputs, samples, params, chunk) for chunk in chunks]
+    else:
+        shm_in = _shared_copy(inputs)
+        shm_out = _shared_copy(samples)
+        try:
+            specs = ((shm_in.name, inputs.shape, inputs.dtype),
+                     (shm_out.name, samples.shape, samples.dtype))
+            with multiprocessing.Pool(workers, _init_worker, (specs, params)) as pool:
+                stats = list(pool.imap_unordered(_worker_chunk, chunks))
+            samples[:] = np.ndarray(samples.shape, samples.dtype, buffer=shm_out.buf)
+        finally:
+            for shm in (shm_in, shm_out):
+                shm.close()
+                shm.unlink()
+
+    per_worker = {}
+    for pid, count, elapsed in stats:
+        worker = per_worker.setdefault(pid, {'samples': 0, 'time': 0.})
+        worker['samples'] += count
+        worker['time'] += elapsed
+    for worker in per_worker.values():
+        worker['samples_per_second'] = worker['samples']/worker['time'] if worker['time'] else None
+    return EnsembleResult(samples, per_worker, time.perf_counter() - start)
+
+
+def _shared_copy(array):
+    """Copie un tableau dans un nouveau bloc de mémoire partagée"""
+    shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+    np.ndarray(array.shape, array.dtype, buffer=shm.buf)[...] = array
+    return shm
+
+
+def _run_chunk(inputs, samples, params, chunk):
+    """Simule les tirages [début, fin[ et retourne (pid, nombre, durée)"""
+    start = time.perf_counter()
+    for i in range(*chunk):
+        samples[i] = simulate_sample(inputs[i], **params)
+    return os.getpid(), chunk[1] - chunk[0], time.perf_counter() - start
+
+
+# Etat d'un processus de calcul : blocs partagés attachés et paramètres
+_worker = {}
+
+
+def _init_worker(specs, params):
+    arrays = []
+    for name, shape, dtype in specs:
+        shm = shared_memory.SharedMemory(name=name)
+        _worker.setdefault('shm', []).append(shm)  # garde les blocs ouverts
+        arrays.append(np.ndarray(shape, dtype, buffer=shm.buf))
+    _worker['inputs'], _worker['samples'] = arrays
+    _worker['params'] = params
+
+
+def _worker_chunk(chunk):
+    return _run_chunk(_worker['inputs'], _worker['samples'], _worker['params'], chunk)
@@ -0,0 +1,447 @@
+# Schémas d'intégration de l'équation du mouvement ds/dt = vs, dvs/dt = a(s, vs)
+import bisect
+import math
+
+import numpy as np
+
+
+class SemiImplicitEuler:
+    """Euler semi-implicite (symplectique), le schéma historique des simulations
+
+    Args:
+        dt (float): pas de temps [s]
+    """
+    name = 'euler'
+    adaptive = False
+    order = 1
+
+    def __init__(self, dt=0.0001):
+        self.dt = dt
+
+    def step(self, f, s, vs, a, dt):
+        """Avance d'un pas
+
+        Args:
+            f (callable): accélération f(s, vs)
+            s (float): distance curviligne au début du pas
+            vs (float): vitesse au début du pas
+            a (float): accélération au début du pas, f(s, vs)
+            dt (float): pas de temps
+
+        Returns:
+            tuple: (s, vs, a, err) à la fin du pas, err étant l'erreur estimée
+                (0 pour les schémas à pas fixe)
+        """
+        vs = vs + a*dt
+        s = s + vs*dt
+        return s, vs, f(s, vs), 0.
+
+
+class VelocityVerlet(SemiImplicitEuler):
+    """Verlet vitesse (saute-mouton), symplectique d'ordre 2
+
+    Le frottement dépendant de la vitesse est évalué avec une prédiction de la
+    vitesse en fin de pas, ce qui garde une seule évaluation de l'accélération
+    par pas (le schéma n'est exactement symplectique que sans frottement).
+    """
+    name = 'verlet'
+    order = 2
+
+    def step(self, f, s, vs, a, dt):
+        vs_half = vs + 0.5*dt*a
+        s = s + dt*vs_half
+        a = f(s, vs + dt*a)
+        return s, vs_half + 0.5*dt*a, a, 0.
+
+
+class RK4(SemiImplicitEuler):
+    """Runge-Kutta classique d'ordre 4 (4 évaluations par pas)"""
+    name = 'rk4'
+    order = 4
+
+    def step(self, f, s, vs, a, dt):
+        half = 0.5*dt
+        v2 = vs + half*a
+        a2 = f(s + half*vs, v2)
+        v3 = vs + half*a2
+        a3 = f(s + half*v2, v3)
+        v4 = vs + dt*a3
+        a4 = f(s + dt*v3, v4)
+        s = s + dt/6*(vs + 2*v2 + 2*v3 + v4)
+        vs = vs + dt/6*(a + 2*a2 + 2*a3 + a4)
+        return s, vs, f(s, vs), 0.
+
+
+# Coefficients de Dormand-Prince 5(4)
+_DP_A = (
+    (),
+    (1/5,),
+    (3/40, 9/40),
+    (44/45, -56/15, 32/9),
+    (19372/6561, -25360/2187, 64448/6561, -212/729),
+    (9017/3168, -355/33, 46732/5247, 49/176, -5103/18656),
+    (35/384, 0., 500/1113, 125/192, -2187/6784, 11/84),
+)
+_DP_E = (71/57600, 0., -71/16695, 71/1920, -17253/339200, 22/525, -1/40)
+
+
+class RK45(SemiImplicitEuler):
+    """Runge-Kutta de Dormand-Prince 5(4) à pas adaptatif
+
+    Le pas est ajusté pour garder l'erreur locale estimée sous
+    atol + rtol*|y| pour s et vs. La dernière étape sert de première étape
+    au pas suivant (6 évaluations par pas accepté).
+
+    Args:
+        rtol (float): tolérance relative
+        atol (float): tolérance absolue
+        dt (float): pas initial [s]
+        dt_max (float): pas maximal [s]
+    """
+    name = 'rk45'
+    adaptive = True
+    order = 5
+
+    def __init__(self, rtol=1e-6, atol=1e-9, dt=0.001, dt_max=0.1):
+        self.rtol = rtol
+        self.atol = atol
+        self.dt = dt
+        self.dt_max = dt_max
+
+    def step(self, f, s, vs, a, dt):
+        ks = [vs]
+        ka = [a]
+        for row in _DP_A[1:]:
+            si = s + dt*sum(c*k for c, k in zip(row, ks))
+            vi = vs + dt*sum(c*k for c, k in zip(row, ka))
+            ks.append(vi)
+            ka.append(f(si, vi))
+        # La dernière étape est évaluée en (s, vs) à la fin du pas
+        s_new, vs_new = si, vi
+        err_s = dt*sum(c*k for c, k in zip(_DP_E, ks))
+        err_vs = dt*sum(c*k for c, k in zip(_DP_E, ka))
+        sc_s = self.atol + self.rtol*max(abs(s), abs(s_new))
+        sc_vs = self.atol + self.rtol*max(abs(vs), abs(vs_new))
+        err = math.sqrt(((err_s/sc_s)**2 + (err_vs/sc_vs)**2)/2)
+        return s_new, vs_new, ka[-1], err
+
+    def next_dt(self, dt, err):
+        """Retourne le pas suivant à partir de l'erreur normalisée du pas courant"""
+        if err == 0:
+            factor = 5.
+        else:
+            factor = min(5., max(0.2, 0.9*err**(-1/self.order)))
+        return min(self.dt_max, dt*factor)
+
+
+class ArcLength:
+    """Intégration selon la distance curviligne, d'un point du chemin au suivant
+
+    Tant que la bille avance dans le même sens, l'équation du mouvement
+    s'écrit dE/ds = a(s, vs) avec E = vs²/2, et le temps s'obtient par
+    dt/ds = 1/|vs|. Ces deux équations sont intégrées par Runge-Kutta 4 sur
+    chaque intervalle de la grille (les points du chemin, entre lesquels T et
+    C sont linéaires) : le nombre de pas dépend du chemin et non plus de la
+    durée de la simulation.
+
+    Près d'un arrêt ou d'un demi-tour (1/|vs| diverge), un pas est refusé si
+    la vitesse y tombe sous v_switch/2, si E y varie de plus de max_change
+    fois sa valeur ou si un événement y change de signe. L'intervalle est alors
+    parcouru par time_integrator, pas de temps par pas de temps, jusqu'au point
+    suivant de la grille, ou, après un demi-tour, jusqu'à ce que la vitesse
+    dépasse v_switch dans l'autre sens.
+
+    Args:
+        dt (float): pas initial de time_integrator [s]
+        v_switch (float): vitesse sous laquelle l'intégration se fait en temps [m/s]
+        max_change (float): variation relative maximale de E sur un pas
+        time_integrator (objet): schéma en temps, par défaut RK45 (rtol=1e-9)
+        grid (array): points de la grille, par défaut ceux du chemin (voir
+            Simulator)
+    """
+    name = 'arclength'
+
+    def __init__(self, dt=0.001, v_switch=0.1, max_change=0.5, time_integrator=None, grid=None):
+        self.dt = dt
+        self.v_switch = v_switch
+        self.max_change = max_change
+        if time_integrator is None:
+            time_integrator = RK45(rtol=1e-9, atol=1e-12, dt=dt)
+        self.time_integrator = time_integrator
+        self.grid = grid
+
+    def integrate(self, f, grid, s, vs, tEnd, events=()):
+        """Intègre le mouvement jusqu'à la fin de la grille, tEnd ou un événement terminal
+
+        Args:
+            f (callable): accélération f(s, vs)
+            grid (array): distances curvilignes des points de la grille (self.grid
+                si elle est donnée), la dernière étant la fin du chemin
+            s, vs, tEnd, events: voir integrate ; l'arrivée au bout de la
+                grille est toujours terminale (événement 'end')
+
+        Returns:
+            tuple: comme integrate
+        """
+        grid = [float(x) for x in (grid if self.grid is None else self.grid)]
+        length = grid[-1]
+        tol = 1e-9*(length - grid[0])
+        n_eval = 0
+        acceleration = f
+
+        def counted(s, vs):
+            nonlocal n_eval
+            n_eval += 1
+            return acceleration(s, vs)
+
+        f = counted
+        events = list(events)
+        if not any(event.name == 'end' for event in events):
+            events.append(Event('end', lambda s, vs: s - length, direction=1))
+        a = f(s, vs)
+        t = 0.
+        t_sim, s_sim, vs_sim, a_sim = [t], [s], [vs], [a]
+        found = []
+        values = [event.function(s, vs) for event in events]
+        E_min = (self.v_switch/2)**2/2
+        while t < tEnd and not any(_terminal(events, name) for name, *state in found):
+            sign = 1. if vs >= 0 else -1.
+            if sign > 0:
+                j = bisect.bisect_right(grid, s + tol)
+                target = grid[j] if j < len(grid) else None
+            else:
+                j = bisect.bisect_left(grid, s - tol) - 1
+                target = grid[j] if j >= 0 else None
+
+            # Pas en distance curviligne
+            step = None
+            if target is not None and abs(vs) >= self.v_switch/2:
+                step = self._step(f, sign, s, vs, a, target - s, E_min)
+            if step is not None:
+                dt, vs_new, a_new = step
+                new_values = [event.function(target, vs_new) for event in events]
+                if t + dt <= tEnd and not any(
+                        event.crossed(g0, g1) for event, g0, g1 in zip(events, values, new_values)
+                        if event.name != 'end'):
+                    t, s, vs, a = t + dt, target, vs_new, a_new
+                    values = new_values
+                    t_sim.append(t)
+                    s_sim.append(s)
+                    vs_sim.append(vs)
+                    a_sim.append(a)
+                    if s >= length - tol:
+                        found.append(('end', t, s, vs))
+                    continue
+
+            # Pas de temps jusqu'au point suivant ou jusqu'au demi-tour
+            v_switch = self.v_switch
+            stops = [Event('_reverse', lambda s, vs: -sign*vs - v_switch, direction=1)]
+            if target is not None:
+                stops.append(Event('_node', lambda s, vs: sign*(s - target), direction=1))
+            *sim, found_time, n = integrate(acceleration, self.time_integrator, s, vs,
+                                            tEnd - t, events + stops)
+            n_eval += n
+            for ti, si, vsi, ai in list(zip(*sim))[1:]:
+                t_sim.append(t + ti)
+                s_sim.append(si)
+                vs_sim.append(vsi)
+                a_sim.append(ai)
+            found += [(name, t + te, se, vse) for name, te, se, vse in found_time
+                      if not name.startswith('_')]
+            t, s, vs, a = t_sim[-1], s_sim[-1], vs_sim[-1], a_sim[-1]
+            values = [event.function(s, vs) for event in events]
+        return t_sim, s_sim, vs_sim, a_sim, found, n_eval
+
+    def _step(self, f, sign, s, vs, a, ds, E_min):
+        """Un pas de Runge-Kutta 4 de (E, t) sur ds, ou None si le pas est refusé
+
+        Returns:
+            tuple: (durée du pas, vitesse et accélération à la fin du pas)
+        """
+        h = abs(ds)
+        E = vs*vs/2
+        # dE/du = sign*a et dt/du = 1/|vs|, u = sign*(s - s0) étant la distance parcourue
+        kE1, kt1 = sign*a, 1/abs(vs)
+        E2 = E + h/2*kE1
+        if E2 < E_min:
+            return None
+        v2 = sign*math.sqrt(2*E2)
+        kE2, kt2 = sign*f(s + sign*h/2, v2), 1/abs(v2)
+        E3 = E + h/2*kE2
+        if E3 < E_min:
+            return None
+        v3 = sign*math.sqrt(2*E3)
+        kE3, kt3 = sign*f(s + sign*h/2, v3), 1/abs(v3)
+        E4 = E + h*kE3
+        if E4 < E_min:
+            return None
+        v4 = sign*math.sqrt(2*E4)
+        kE4, kt4 = sign*f(s + ds, v4), 1/abs(v4)
+        E_new = E + h/6*(kE1 + 2*kE2 + 2*kE3 + kE4)
+        if E_new < E_min or abs(E_new - E) > self.max_change*E:
+            return None
+        vs_new = sign*math.sqrt(2*E_new)
+        return h/6*(kt1 + 2*kt2 + 2*kt3 + kt4), vs_new, f(s + ds, vs_new)
+
+
+INTEGRATORS = {cls.name: cls for cls in (SemiImplicitEuler, VelocityVerlet, RK4, RK45, ArcLength)}
+
+
+def get_integrator(integrator, dt=0.0001):
+    """Retourne un schéma d'intégration à partir de son nom ou de l'objet lui-même
+
+    Args:
+        integrator (str ou objet): 'euler', 'verlet', 'rk4', 'rk45' ou un schéma
+        dt (float): pas de temps (pas initial pour rk45)
+
+    Returns:
+        objet: le schéma d'intégration
+    """
+    if isinstance(integrator, str):
+        try:
+            return INTEGRATORS[integrator](dt=dt)
+        except KeyError:
+            raise ValueError("Schéma d'intégration inconnu : {}".format(integrator))
+    return integrator
+
+
+class Event:
+    """Evénement détecté pendant l'intégration, quand g(s, vs) s'annule
+
+    Args:
+        name (str): nom de l'événement
+        function (callable): fonction g(s, vs) qui s'annule à l'événement
+        terminal (bool): arrête l'intégration à l'événement
+        direction (int): 1 (resp. -1) pour ne détecter que les passages de g
+            du négatif au positif (resp. du positif au négatif), 0 pour les deux
+    """
+
+    def __init__(self, name, function, terminal=True, direction=0):
+        self.name = name
+        self.function = function
+        self.terminal = terminal
+        self.direction = direction
+
+    def crossed(self, g0, g1):
+        """Vrai si g passe par zéro entre deux pas dans la direction voulue"""
+        if self.direction >= 0 and g0 < 0 <= g1:
+            return True
+        return self.direction <= 0 and g0 > 0 >= g1
+
+
+def integrate(f, integrator, s, vs, tEnd, events=()):
+    """Intègre le mouvement jusqu'à tEnd ou jusqu'à un événement terminal
+
+    L'instant de chaque événement est localisé (méthode de Brent) sur la sortie
+    dense d'Hermite du pas où g change de signe. Un événement terminal remplace
+    le dernier pas par l'état à l'événement.
+
+    Args:
+        f (callable): accélération f(s, vs)
+        integrator (objet): schéma d'intégration
+        s (float): distance curviligne initiale [m]
+        vs (float): vitesse initiale [m/s]
+        tEnd (float): durée maximale [s]
+        events (list): événements à détecter (voir Event)
+
+    Returns:
+        tuple: listes (t, s, vs, a) des pas acceptés, a étant l'accélération
+            en chaque point enregistré, la liste des événements rencontrés
+            (nom, t, s, vs) et le nombre d'évaluations de f
+    """
+    n_eval = 0
+    acceleration = f
+
+    def counted(s, vs):
+        nonlocal n_eval
+        n_eval += 1
+        return acceleration(s, vs)
+
+    f = counted
+    a = f(s, vs)
+    t = 0.
+    t_sim, s_sim, vs_sim, a_sim = [t], [s], [vs], [a]
+    found = []
+    values = [event.function(s, vs) for event in events]
+    dt = integrator.dt
+    while t < tEnd:
+        dt = min(dt, tEnd - t)
+        s_new, vs_new, a_new, err = integrator.step(f, s, vs, a, dt)
+        if integrator.adaptive:
+            dt_next = integrator.next_dt(dt, err)
+            if err > 1:
+                dt = dt_next  # pas rejeté
+                continue
+        t_new = t + dt
+
+        # Recherche des événements sur le pas
+        stop = None
+        new_values = [event.function(s_new, vs_new) for event in events]
+        for event, g0, g1 in zip(events, values, new_values):
+            if event.crossed(g0, g1):
+                from scipy.optimize import brentq  # import lent, seulement si besoin
+                step = (t, t_new, s, s_new, vs, vs_new, a, a_new)
+                te = brentq(lambda te: event.function(*_hermite_point(te, *step)), t, t_new)
+                se, vse = _hermite_point(te, *step)
+                found.append((event.name, te, se, vse))
+                if event.terminal and (stop is None or te < stop[0]):
+                    stop = (te, se, vse)
+        if stop is not None:
+            t_new, s_new, vs_new = stop
+            a_new = f(s_new, vs_new)
+            found = [e for e in found if e[1] <= t_new]
+
+        t, s, vs, a = t_new, s_new, vs_new, a_new
+        values = new_values
+        t_sim.append(t)
+        s_sim.append(s)
+        vs_sim.append(vs)
+        a_sim.append(a)
+        if stop is not None:
+            break
+        if integrator.adaptive:
+            dt = dt_next
+    return t_sim, s_sim, vs_sim, a_sim, found, n_eval
+
+
+def _terminal(events, name):
+    """Vrai si l'événement de nom donné est terminal"""
+    return any(event.name == name and event.terminal for event in events)
+
+
+def _hermite_point(t, t0, t1, s0, s1, vs0, vs1, a0, a1):
+    """Sortie dense d'Hermite d'un seul pas, en un instant t0 ≤ t ≤ t1"""
+    h = t1 - t0
+    x = (t - t0)/h
+    h00 = (1 + 2*x)*(1 - x)**2
+    h10 = x*(1 - x)**2
+    h01 = x**2*(3 - 2*x)
+    h11 = x**2*(x - 1)
+    return (h00*s0 + h10*h*vs0 + h01*s1 + h11*h*vs1,
+            h00*vs0 + h10*h*a0 + h01*vs1 + h11*h*a1)
+
+
+def hermite(t, tp, sp, vsp, ap):
+    """Sortie dense : interpolation cubique d'Hermite de s et vs entre les pas
+
+    Args:
+        t (array): temps où évaluer la trajectoire
+        tp (array): temps des pas
+        sp (array): distance curviligne aux pas
+        vsp (array): vitesse aux pas (dérivée de s)
+        ap (array): accélération aux pas (dérivée de vs)
+
+    Returns:
+        tuple: (s, vs) aux temps t
+    """
+    t = np.clip(np.asarray(t, dtype=float), tp[0], tp[-1])
+    i = np.clip(np.searchsorted(tp, t, 'right') - 1, 0, len(tp) - 2)
+    h = tp[i+1] - tp[i]
+    x = (t - tp[i])/h
+    h00 = (1 + 2*x)*(1 - x)**2
+    h10 = x*(1 - x)**2
+    h01 = x**2*(3 - 2*x)
+    h11 = x**2*(x - 1)
+    s = h00*sp[i] + h10*h*vsp[i] + h01*sp[i+1] + h11*h*vsp[i+1]
+    vs = h00*vsp[i] + h10*h*ap[i] + h01*vsp[i+1] + h11*h*ap[i+1]
+    return s, vs
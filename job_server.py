@@ -0,0 +1,560 @@
+# Service local de simulations : file de travaux à priorités, calcul sur
+# plusieurs processus et suivi en direct
+#
+#   python job_server.py serve --port 8765
+#   python job_server.py load-test --jobs 200 --concurrency 32
+#
+# Le protocole est une suite de lignes JSON sur une connexion TCP locale (ou
+# une socket Unix). Le client envoie une ligne :
+#
+#   {"op": "submit", "job": {"track": "datas/xyz_circuit_real.txt", "e": 0.0008},
+#    "priority": 1}
+#
+# puis reçoit, une par ligne, les messages du travail : 'accepted' (numéro du
+# travail, vrai si un travail identique était déjà en cours), 'started',
+# 'progress' (avancement et états (t, s, vs), un sur 'every' pas) puis 'done'
+# (résumé de la simulation) ou 'error'. {"op": "status"} retourne les
+# compteurs du service.
+#
+# Deux demandes identiques (mêmes paramètres une fois les valeurs par défaut
+# complétées) pendant qu'un travail est en attente ou en cours sont servies par
+# ce même travail : le second client reçoit aussi les messages déjà envoyés.
+import asyncio
+import concurrent.futures
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import threading
+import time
+
+import numpy as np
+
+import recorders
+
+# Paramètres d'un travail et leurs valeurs par défaut. Le circuit est un
+# fichier de points de passage (track, en cm) ou les points eux-mêmes
+# (points, [[x...], [y...], [z...]] en m).
+JOB_DEFAULTS = {
+    'track': None,
+    'points': None,
+    'steps': 400,          # nombre de points du chemin
+    'e': 0.00073,          # coefficient de frottement
+    'r': 0.008,            # rayon de la bille [m]
+    'm': 0.008,            # masse de la bille [kg]
+    'b': 0.014,            # écart des rails [m]
+    'g': 9.81,             # accélération de gravité [m/s²]
+    'dt': 0.0001,          # pas de temps [s]
+    'tEnd': 20,            # durée maximale [s]
+    'integrator': 'euler',
+    'every': 100,          # un état transmis sur every pas
+}
+
+# Pas de la boucle d'Euler entre deux messages d'avancement
+PROGRESS_STEPS = 4096
+
+
+def job_key(job):
+    """Complète un travail par les valeurs par défaut et calcule son empreinte
+
+    Raises:
+        ValueError: pour un paramètre inconnu ou sans circuit
+
+    Returns:
+        tuple: (travail complété, empreinte)
+    """
+    unknown = set(job) - set(JOB_DEFAULTS)
+    if unknown:
+        raise ValueError("Paramètres inconnus : {}".format(', '.join(sorted(unknown))))
+    job = dict(JOB_DEFAULTS, **job)
+    if (job['track'] is None) == (job['points'] is None):
+        raise ValueError("Il faut donner soit track, soit points")
+    text = json.dumps(job, sort_keys=True)
+    return job, hashlib.sha1(text.encode()).hexdigest()
+
+
+class JobServer:
+    """Service de simulations (voir le début du module)
+
+    Les travaux attendent dans une file triée par priorité décroissante (puis
+    par ordre d'arrivée) ; au plus workers travaux sont confiés en même temps
+    au groupe de processus. Chaque processus envoie l'avancement de ses
+    simulations dans une file commune (multiprocessing.Queue), lue par un fil
+    d'exécution qui le transmet à la boucle asyncio.
+
+    Args:
+        workers (int): nombre de processus, par défaut le nombre de coeurs
+        host (str): adresse d'écoute TCP
+        port (int): port TCP (0 : choisi par le système, voir address)
+        path (str): socket Unix à utiliser à la place de TCP
+
+    Attributes:
+        address: adresse d'écoute, (host, port) ou chemin de la socket
+        stats (dict): travaux soumis, dédoublonnés, terminés et en erreur
+    """
+
+    def __init__(self, workers=None, host='127.0.0.1', port=8765, path=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.address = path or (host, port)
+        self.stats = {'submitted': 0, 'deduplicated': 0, 'done': 0, 'errors': 0}
+        self._jobs = {}       # numéro: travail (en attente ou en cours)
+        self._inflight = {}   # empreinte: travail
+        self._ids = itertools.count(1)
+        self._order = itertools.count()
+
+    async def start(self):
+        """Démarre les processus et l'écoute des connexions"""
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.PriorityQueue()
+        context = multiprocessing.get_context()
+        self._progress = context.Queue()
+        self._pool = concurrent.futures.ProcessPoolExecutor(
+            self.workers, context, initializer=_init_worker, initargs=(self._progress,))
+        self._reader = threading.Thread(target=self._read_progress, daemon=True)
+        self._reader.start()
+        self._dispatchers = [asyncio.create_task(self._dispatch())
+                             for _ in range(self.workers)]
+        if isinstance(self.address, str):
+            self._server = await asyncio.start_unix_server(self._client, self.address,
+                                                           limit=2**24)
+        else:
+            self._server = await asyncio.start_server(self._client, *self.address,
+                                                      limit=2**24)
+            self.address = self._server.sockets[0].getsockname()[:2]
+        return self
+
+    async def close(self):
+        """Arrête l'écoute, les travaux en attente et les processus"""
+        self._server.close()
+        await self._server.wait_closed()
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.remove(self.address)
+        for task in self._dispatchers:
+            task.cancel()
+        await asyncio.gather(*self._dispatchers, return_exceptions=True)
+        for job in list(self._jobs.values()):
+            self._finish(job, {'event': 'error', 'message': "Service arrêté"})
+        await self._loop.run_in_executor(None, self._pool.shutdown)
+        self._progress.put(None)
+        self._reader.join()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+        return False
+
+    def submit(self, job, priority=0):
+        """Met un travail dans la file, ou retrouve le travail identique en cours
+
+        Args:
+            job (dict): paramètres du travail (voir JOB_DEFAULTS)
+            priority (float): priorité, les plus grandes d'abord
+
+        Raises:
+            ValueError: si le travail est invalide (voir job_key) ou si la
+                priorité n'est pas un nombre fini
+            TypeError: si la priorité n'est pas un nombre
+
+        Returns:
+            tuple: (travail, asyncio.Queue de ses messages, vrai si dédoublonné)
+        """
+        # Vérifications avant tout enregistrement : un travail inscrit dans
+        # _inflight mais absent de la file bloquerait les demandes identiques
+        priority = float(priority)
+        if not np.isfinite(priority):
+            raise ValueError("Priorité invalide : {}".format(priority))
+        job, key = job_key(job)
+        self.stats['submitted'] += 1
+        messages = asyncio.Queue()
+        current = self._inflight.get(key)
+        if current is not None:
+            self.stats['deduplicated'] += 1
+            for message in current.history:
+                messages.put_nowait(message)
+            current.subscribers.append(messages)
+            return current, messages, True
+        current = _Job(next(self._ids), key, job)
+        current.subscribers.append(messages)
+        self._jobs[current.id] = current
+        self._inflight[key] = current
+        self._queue.put_nowait((-priority, next(self._order), current))
+        return current, messages, False
+
+    def status(self):
+        """Compteurs du service et travaux en attente ou en cours"""
+        running = sum(job.started is not None for job in self._jobs.values())
+        return dict(self.stats, queued=len(self._jobs) - running, running=running,
+                    workers=self.workers)
+
+    async def _dispatch(self):
+        """Confie les travaux de la file au groupe de processus, un à la fois"""
+        while True:
+            priority, order, job = await self._queue.get()
+            if job.finished:
+                continue
+            try:
+                await self._loop.run_in_executor(self._pool, _run_job, job.id, job.params)
+            except asyncio.CancelledError:
+                raise
+            except Exception as error:  # processus arrêté (BrokenProcessPool...)
+                self._finish(job, {'event': 'error', 'message': repr(error)})
+            else:
+                await job.done.wait()
+
+    def _read_progress(self):
+        """Fil d'exécution : transmet les messages des processus à la boucle"""
+        while True:
+            item = self._progress.get()
+            if item is None:
+                return
+            self._loop.call_soon_threadsafe(self._message, *item)
+
+    def _message(self, job_id, message):
+        job = self._jobs.get(job_id)
+        if job is None:
+            return
+        message['id'] = job_id
+        if message['event'] == 'started':
+            job.started = time.perf_counter()
+        if message['event'] in ('done', 'error'):
+            now = time.perf_counter()
+            message['queue_time'] = (job.started or now) - job.submitted
+            message['run_time'] = now - (job.started or now)
+            self._finish(job, message)
+        else:
+            job.send(message)
+
+    def _finish(self, job, message):
+        if job.finished:
+            return
+        job.finished = True
+        message.setdefault('id', job.id)
+        self.stats['done' if message['event'] == 'done' else 'errors'] += 1
+        job.send(message)
+        job.done.set()
+        del self._jobs[job.id]
+        if self._inflight.get(job.key) is job:
+            del self._inflight[job.key]
+
+    async def _client(self, reader, writer):
+        """Connexion d'un client : une demande, puis les messages qui en découlent"""
+        job = messages = None
+        try:
+            line = await reader.readline()
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("Demande invalide : {}".format(line[:100]))
+                if request.get('op') == 'status':
+                    await _send(writer, dict(self.status(), event='status'))
+                    return
+                if request.get('op') != 'submit':
+                    raise ValueError("Opération inconnue : {}".format(request.get('op')))
+                job, messages, duplicate = self.submit(request.get('job', {}),
+                                                       request.get('priority', 0))
+            except (TypeError, ValueError) as error:  # json.JSONDecodeError compris
+                await _send(writer, {'event': 'error', 'message': str(error)})
+                return
+            await _send(writer, {'event': 'accepted', 'id': job.id, 'duplicate': duplicate,
+                                 'queued': self._queue.qsize()})
+            while True:
+                message = await messages.get()
+                await _send(writer, message)
+                if message['event'] in ('done', 'error'):
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # client parti : le travail continue pour les autres
+        finally:
+            if job is not None and messages in job.subscribers:
+                job.subscribers.remove(messages)
+            writer.close()
+
+
+class _Job:
+    """Travail en attente ou en cours, et les files de ses clients"""
+
+    def __init__(self, id, key, params):
+        self.id = id
+        self.key = key
+        self.params = params
+        self.subscribers = []
+        self.history = []  # messages déjà envoyés, pour les demandes identiques
+        self.submitted = time.perf_counter()
+        self.started = None
+        self.finished = False
+        self.done = asyncio.Event()
+
+    def send(self, message):
+        self.history.append(message)
+        for messages in self.subscribers:
+            messages.put_nowait(message)
+
+
+async def _send(writer, message):
+    writer.write(json.dumps(message).encode() + b'\n')
+    await writer.drain()
+
+
+async def _connect(address):
+    if isinstance(address, str):
+        return await asyncio.open_unix_connection(address, limit=2**24)
+    return await asyncio.open_connection(*address, limit=2**24)
+
+
+async def submit(address, job, priority=0):
+    """Soumet un travail et retourne ses messages au fur et à mesure
+
+    Usage : async for message in submit(('127.0.0.1', 8765), {...}): ...
+
+    Args:
+        address: (host, port) ou chemin de la socket Unix du service
+        job (dict): paramètres du travail (voir JOB_DEFAULTS)
+        priority (float): priorité, les plus grandes d'abord
+
+    Yields:
+        dict: messages du travail, jusqu'à 'done' ou 'error'
+    """
+    reader, writer = await _connect(address)
+    try:
+        await _send(writer, {'op': 'submit', 'job': job, 'priority': priority})
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise ConnectionError("Connexion fermée par le service")
+            message = json.loads(line)
+            yield message
+            if message['event'] in ('done', 'error'):
+                return
+    finally:
+        writer.close()
+
+
+async def status(address):
+    """Compteurs du service (voir JobServer.status)"""
+    reader, writer = await _connect(address)
+    try:
+        await _send(writer, {'op': 'status'})
+        return json.loads(await reader.readline())
+    finally:
+        writer.close()
+
+
+# Processus de calcul : file des messages vers le service
+_worker = {}
+
+
+def _init_worker(progress):
+    _worker['progress'] = progress
+
+
+def _run_job(job_id, params):
+    """Simule un travail dans un processus de calcul
+
+    Les messages ('started', 'progress', puis 'done' ou 'error') passent tous
+    par la file du service, dans l'ordre : le résultat de la fonction n'est
+    pas utilisé.
+    """
+    progress = _worker['progress']
+
+    def send(message):
+        progress.put((job_id, message))
+
+    send({'event': 'started', 'pid': os.getpid()})
+    try:
+        send({'event': 'done', 'summary': simulate(params, send)})
+    except Exception as error:
+        send({'event': 'error', 'message': '{}: {}'.format(type(error).__name__, error)})
+
+
+def simulate(params, send=None):
+    """Lance la simulation d'un travail
+
+    Args:
+        params (dict): paramètres du travail, complétés (voir job_key)
+        send (callable): reçoit les messages 'progress', tous les
+            PROGRESS_STEPS pas avec le schéma 'euler', à la fin sinon
+
+    Returns:
+        dict: résumé de la simulation
+    """
+    import shape
+    from path_cache import cached_path
+    from simulator import Simulator
+
+    start = time.perf_counter()
+    if params['track'] is not None:
+        points = shape.xyz_from_file(params['track'])
+    else:
+        points = np.array(params['points'], dtype=float)
+    path = cached_path(points, params['steps'])
+    recorder = _ProgressRecorder(send, params['every'], params['tEnd'])
+    simulator = Simulator(path, r=params['r'], m=params['m'], b=params['b'], e=params['e'],
+                          g=params['g'], dt=params['dt'], tEnd=params['tEnd'],
+                          integrator=params['integrator'], recorder=recorder)
+    simulator.chunk = PROGRESS_STEPS
+    result = simulator.run()
+    E_tot = result.E_tot
+    return {
+        'length': float(result.length),
+        'finished': bool(result.finished),
+        'finish_time': float(result.finish_time) if result.finished else None,
+        'max_speed': float(np.max(np.abs(result.vs))),
+        'energy_loss': float(E_tot[0] - E_tot[-1]),
+        'steps': result.steps,
+        'n_eval': result.n_eval,
+        'wall_time': time.perf_counter() - start,
+    }
+
+
+class _ProgressRecorder(recorders.Recorder):
+    """Garde tous les états et en envoie un sur k à chaque paquet"""
+
+    def __init__(self, send, k, tEnd):
+        self.send = send
+        self.k = k
+        self.tEnd = tEnd
+
+    def start(self, capacity):
+        super().start(capacity)
+        self._index = 0  # indice du premier état du prochain paquet (voir Decimate)
+
+    def write(self, states):
+        super().write(states)
+        sent = states[-self._index % self.k::self.k]
+        self._index += len(states)
+        if self.send is not None and len(states):
+            self.send({'event': 'progress', 'fraction': min(states['t'][-1]/self.tEnd, 1.),
+                       'states': np.column_stack((sent['t'], sent['s'], sent['vs'])).tolist()})
+
+
+async def load_test(address=None, jobs=200, concurrency=32, distinct=50, workers=None,
+                    seed=0, **params):
+    """Mesure le débit et les latences du service
+
+    jobs travaux sont soumis par concurrency clients simultanés ; leurs
+    coefficients de frottement sont tirés parmi distinct valeurs, de sorte
+    qu'une partie des demandes sont identiques à un travail en cours. Un
+    service est lancé pour l'occasion si address est None.
+
+    Args:
+        address: adresse d'un service déjà lancé
+        jobs (int): nombre de travaux soumis
+        concurrency (int): nombre de clients simultanés
+        distinct (int): nombre de travaux différents
+        workers (int): processus du service lancé pour le test
+        seed (int): graine du générateur aléatoire
+        **params: paramètres des travaux (voir JOB_DEFAULTS), par défaut le
+            circuit réel pendant 2 s avec dt = 1e-4 s : 20 000 pas, soit
+            plusieurs messages 'progress' (un tous les PROGRESS_STEPS pas)
+
+    Returns:
+        dict: débit des demandes et débit des travaux distincts réellement
+            simulés (les demandes dédoublonnées ne coûtent rien) [travaux/s],
+            latences de bout en bout et du premier message 'progress' [s]
+            (médiane, p90, p99, max), messages 'progress' reçus par demande,
+            travaux dédoublonnés et en erreur
+    """
+    if address is None:
+        async with JobServer(workers, port=0) as server:
+            report = await load_test(server.address, jobs, concurrency, distinct,
+                                     seed=seed, **params)
+            report['workers'] = server.workers
+            return report
+
+    job = dict({'track': 'datas/xyz_circuit_real.txt', 'tEnd': 2, 'dt': 0.0001, 'every': 100},
+               **params)
+    rng = np.random.default_rng(seed)
+    frictions = np.linspace(0.0005, 0.001, distinct)[rng.integers(0, distinct, jobs)]
+    priorities = rng.integers(0, 3, jobs)
+    latencies = []
+    first_progress = []
+    progress = []
+    counts = {'deduplicated': 0, 'errors': 0}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def client(e, priority):
+        async with semaphore:
+            start = time.perf_counter()
+            first = None
+            received = 0
+            async for message in submit(address, dict(job, e=float(e)), int(priority)):
+                if message['event'] == 'accepted' and message['duplicate']:
+                    counts['deduplicated'] += 1
+                elif message['event'] == 'progress':
+                    received += 1
+                    if first is None:
+                        first = time.perf_counter() - start
+                elif message['event'] == 'error':
+                    counts['errors'] += 1
+            latencies.append(time.perf_counter() - start)
+            progress.append(received)
+            if first is not None:
+                first_progress.append(first)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(e, p) for e, p in zip(frictions, priorities)))
+    wall_time = time.perf_counter() - start
+    simulated = jobs - counts['deduplicated']  # travaux lancés par le service
+    return {
+        'jobs': jobs,
+        'concurrency': concurrency,
+        'distinct': distinct,
+        'wall_time': wall_time,
+        'jobs_per_second': jobs/wall_time,
+        'simulated': simulated,
+        'distinct_jobs_per_second': simulated/wall_time,
+        'latency': _percentiles(latencies),
+        'first_progress': _percentiles(first_progress),
+        'progress_messages': _percentiles(progress),
+        'deduplicated': counts['deduplicated'],
+        'errors': counts['errors'],
+    }
+
+
+def _percentiles(values):
+    if not values:
+        return {}
+    p50, p90, p99 = np.percentile(values, (50, 90, 99))
+    return {'p50': p50, 'p90': p90, 'p99': p99, 'max': max(values)}
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Service local de simulations.")
+    parser.add_argument('command', choices=('serve', 'load-test'))
+    parser.add_argument('--host', default='127.0.0.1', help="adresse d'écoute TCP")
+    parser.add_argument('--port', type=int, default=8765, help="port TCP")
+    parser.add_argument('--unix', help="socket Unix à utiliser à la place de TCP")
+    parser.add_argument('--workers', type=int, help="nombre de processus")
+    parser.add_argument('--connect', action='store_true',
+                        help="load-test : utilise le service déjà lancé à l'adresse donnée")
+    parser.add_argument('--jobs', type=int, default=200, help="load-test : travaux soumis")
+    parser.add_argument('--concurrency', type=int, default=32,
+                        help="load-test : clients simultanés")
+    parser.add_argument('--distinct', type=int, default=50,
+                        help="load-test : travaux différents")
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        async def serve():
+            async with JobServer(args.workers, args.host, args.port, args.unix) as server:
+                print("Service à l'écoute sur {}".format(server.address))
+                await server._server.serve_forever()
+        try:
+            asyncio.run(serve())
+        except KeyboardInterrupt:
+            pass
+    else:
+        address = (args.unix or (args.host, args.port)) if args.connect else None
+        report = asyncio.run(load_test(address, args.jobs, args.concurrency, args.distinct,
+                                       args.workers))
+        print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    main()
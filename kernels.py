@@ -0,0 +1,375 @@
+# Boucle de simulation compilée (numba), si numba est installé
+#
+# La boucle euler_loop réunit la recherche du segment du chemin,
+# l'interpolation de T et C, l'accélération de physic_model_3d et le pas
+# d'Euler semi-implicite. Compilée par numba, elle remplace la boucle en
+# flottants Python de Simulator._integrate ; sans numba (ou avec la variable
+# d'environnement SIMULATION_JIT=0), Simulator garde sa boucle Python.
+# track_euler_loop fait de même pour TrackSimulator sur un circuit polynomial
+# (tracks.py) : u(s) tabulé, puis T et C exacts tirés des polynômes.
+#
+# numba n'est importé qu'à la première simulation qui en a besoin, et le code
+# compilé est gardé sur disque (cache=True, dans __pycache__ ou NUMBA_CACHE_DIR) :
+# seul le tout premier lancement paie la compilation.
+import math
+import os
+
+import numpy as np
+
+# Ecart maximal toléré entre la boucle compilée et la boucle Python, relatif à
+# la longueur du chemin (s) et à la vitesse maximale (vs). Sans fastmath, les
+# opérations sont les mêmes et dans le même ordre : les résultats sont en
+# pratique identiques bit à bit, la tolérance couvre une éventuelle
+# contraction des multiplications-additions (FMA) par le compilateur.
+TOLERANCE = 1e-9
+
+# Nombre de voies entrelacées par sweep_loop
+SWEEP_BLOCK = 8
+
+_compiled = {}
+
+
+def euler_loop(sPath, sBase, table, length, g, e, h, inertia, dt, steps,
+               a_sim, vs_sim, t_sim, s_sim):
+    """Boucle d'Euler semi-implicite sur un chemin (même calcul que Simulator._integrate)
+
+    Args:
+        sPath (array): distance curviligne des N points du chemin
+        sBase (array): origine des segments, array[N+1] (voir sweep.segment_table)
+        table (array): valeurs et pentes de T et C, array[N+1, 12]
+        length (float): longueur du chemin [m]
+        g (float): accélération de gravité [m/s²]
+        e (float): coefficient de frottement
+        h (float): hauteur du centre de la bille au dessus des rails [m]
+        inertia (float): coefficient d'inertie
+        dt (float): pas de temps [s]
+        steps (int): nombre maximal de pas
+        a_sim, vs_sim, t_sim, s_sim (array): tampons array[steps+1], l'indice 0
+            contenant l'état initial
+
+    Returns:
+        int: indice d'arrêt, comme Simulator._integrate
+    """
+    n = sPath.shape[0]
+    minus_g = -g
+    s = s_sim[0]
+    vs = vs_sim[0]
+    t = t_sim[0]
+    lo = 0.
+    hi = 0.
+    k = 0
+    i = 0
+    while i < steps:
+        # Changement de segment d'interpolation (recherche dichotomique)
+        if s < lo or s >= hi:
+            left = 0
+            right = n
+            while left < right:
+                mid = (left + right)//2
+                if s < sPath[mid]:
+                    right = mid
+                else:
+                    left = mid + 1
+            k = left
+            lo = -math.inf if k == 0 else sPath[k-1]
+            hi = math.inf if k == n else sPath[k]
+
+        # Interpolation de T et C (même formule que np.interp)
+        x = s - sBase[k]
+        Tz = table[k, 8]*x + table[k, 2]
+
+        # Accélération (physic_model_3d.acceleration développée)
+        gs = -g*Tz
+        sq_spd = vs**2
+        nx = (table[k, 9]*x + table[k, 3])*sq_spd + (table[k, 6]*x + table[k, 0])*gs
+        ny = (table[k, 10]*x + table[k, 4])*sq_spd + (table[k, 7]*x + table[k, 1])*gs
+        nz = (table[k, 11]*x + table[k, 5])*sq_spd - (minus_g - Tz*gs)
+        a = (gs - e*vs*math.sqrt(nx**2 + ny**2 + nz**2)/h)/inertia
+
+        # Euler semi-implicite
+        vs = vs + a*dt
+        t = t + dt
+        s = s + vs*dt
+        i += 1
+        a_sim[i] = a
+        vs_sim[i] = vs
+        t_sim[i] = t
+        s_sim[i] = s
+
+        # Arrêt de la simulation si on est plus loin que la piste
+        if s > length:
+            return i - 1
+    return i
+
+
+def track_euler_loop(coefficients, sTable, uTable, duTable, length, g, e, h, inertia, dt,
+                     steps, a_sim, vs_sim, t_sim, s_sim):
+    """Boucle d'Euler semi-implicite sur un circuit polynomial (même calcul que
+    TrackSimulator._integrate)
+
+    Args:
+        coefficients (array): polynômes de la courbe, array[3, degré+1]
+            (voir tracks.PolynomialTrack)
+        sTable, uTable, duTable (array): table de s(u) et de du/ds (voir
+            tracks.Track.parameter), array[nodes+1]
+        length (float): longueur du circuit [m]
+        g, e, h, inertia, dt, steps: comme euler_loop
+        a_sim, vs_sim, t_sim, s_sim (array): comme euler_loop
+
+    Returns:
+        int: indice d'arrêt, comme Simulator._integrate
+    """
+    n = sTable.shape[0]
+    degree = coefficients.shape[1]
+    u0 = uTable[0]
+    u1 = uTable[n-1]
+    minus_g = -g
+    s = s_sim[0]
+    vs = vs_sim[0]
+    t = t_sim[0]
+    k = 0
+    i = 0
+    while i < steps:
+        # Paramètre u(s) (tracks.Track.parameter)
+        if s <= 0.:
+            u = u0
+        elif s >= length:
+            u = u1
+        else:
+            if not (sTable[k] <= s and s < sTable[k+1]):
+                left = 0
+                right = n
+                while left < right:
+                    mid = (left + right)//2
+                    if s < sTable[mid]:
+                        right = mid
+                    else:
+                        left = mid + 1
+                k = min(left - 1, n - 2)
+            dh = sTable[k+1] - sTable[k]
+            q = (s - sTable[k])/dh
+            r = 1. - q
+            u = ((1. + 2.*q)*r*r*uTable[k] + q*r*r*dh*duTable[k]
+                 + q*q*(3. - 2.*q)*uTable[k+1] - q*q*r*dh*duTable[k+1])
+
+        # Dérivées de la courbe (tracks.PolynomialTrack.derivatives)
+        dx = dy = dz = ddx = ddy = ddz = 0.
+        for j in range(3):
+            value = slope = half = 0.
+            for m in range(degree):
+                half = half*u + slope
+                slope = slope*u + value
+                value = value*u + coefficients[j, m]
+            if j == 0:
+                dx, ddx = slope, 2.*half
+            elif j == 1:
+                dy, ddy = slope, 2.*half
+            else:
+                dz, ddz = slope, 2.*half
+
+        # T et C (tracks.Track.frame)
+        speed = math.sqrt(dx*dx + dy*dy + dz*dz)
+        Tx, Ty, Tz = dx/speed, dy/speed, dz/speed
+        dot = ddx*Tx + ddy*Ty + ddz*Tz
+        sq = speed*speed
+        Cx, Cy, Cz = (ddx - dot*Tx)/sq, (ddy - dot*Ty)/sq, (ddz - dot*Tz)/sq
+
+        # Accélération (TrackSimulator._integrate)
+        gs = -g*Tz
+        sq_spd = vs**2
+        nx = Cx*sq_spd + Tx*gs
+        ny = Cy*sq_spd + Ty*gs
+        nz = Cz*sq_spd - (minus_g - Tz*gs)
+        a = (gs - e*vs*math.sqrt(nx**2 + ny**2 + nz**2)/h)/inertia
+
+        # Euler semi-implicite
+        vs = vs + a*dt
+        t = t + dt
+        s = s + vs*dt
+        i += 1
+        a_sim[i] = a
+        vs_sim[i] = vs
+        t_sim[i] = t
+        s_sim[i] = s
+
+        if s > length:
+            return i - 1
+    return i
+
+
+def sweep_loop(sPath, sBase, table, length, g, e_h, inv_inertia, dt, steps, record,
+               s, vs, vs_max, finished, finish_time, lane_steps, s_rec, vs_rec):
+    """Boucle du balayage de paramètres (même calcul que sweep.sweep)
+
+    Les voies avancent par blocs de SWEEP_BLOCK : à chaque pas, le pas de
+    chaque voie du bloc est calculé à la suite. Un pas d'une voie dépend du
+    précédent (racine, multiplications, additions en chaîne) ; entrelacer des
+    voies indépendantes permet au processeur de mener ces chaînes de front.
+    Chaque voie fait les opérations de la version numpy de sweep.sweep, dans
+    le même ordre.
+
+    Args:
+        sPath, sBase, table: chemin et table de T et C (voir euler_loop)
+        length (float): longueur du chemin [m]
+        g (float): accélération de gravité [m/s²]
+        e_h, inv_inertia (array): e/h et 1/inertie de chaque voie
+        dt (float): pas de temps [s]
+        steps (int): nombre maximal de pas
+        record (array): pas des enregistrements, croissants (int)
+        s, vs (array): état initial de chaque voie, remplacé par l'état final
+        vs_max (array): vitesse maximale de chaque voie (|vs0| au départ)
+        finished, finish_time, lane_steps (array): résultats de chaque voie
+        s_rec, vs_rec (array): enregistrements, array[voies, len(record)],
+            remplis de NaN au départ
+    """
+    n = sPath.shape[0]
+    lanes = s.shape[0]
+    records = record.shape[0]
+    for first in range(0, lanes, SWEEP_BLOCK):
+        last = min(first + SWEEP_BLOCK, lanes)
+        # Segment courant [lo, hi[ de chaque voie, prochain enregistrement
+        k = np.zeros(SWEEP_BLOCK, np.int64)
+        lo = np.zeros(SWEEP_BLOCK)
+        hi = np.full(SWEEP_BLOCK, -1.)
+        j = np.zeros(SWEEP_BLOCK, np.int64)
+        active = last - first
+        for lane in range(first, last):
+            while j[lane-first] < records and record[j[lane-first]] <= 0:
+                s_rec[lane, j[lane-first]] = s[lane]
+                vs_rec[lane, j[lane-first]] = vs[lane]
+                j[lane-first] += 1
+        t = 0.
+        step = 0
+        while step < steps and active:
+            t = t + dt
+            step += 1
+            for lane in range(first, last):
+                if finished[lane]:
+                    continue
+                b = lane - first
+                s_l = s[lane]
+                vs_l = vs[lane]
+                # Segment de la voie (sweep.segment_table : k = searchsorted 'right')
+                if s_l < lo[b] or s_l >= hi[b]:
+                    left = 0
+                    right = n
+                    while left < right:
+                        mid = (left + right)//2
+                        if s_l < sPath[mid]:
+                            right = mid
+                        else:
+                            left = mid + 1
+                    k[b] = left
+                    lo[b] = sBase[left]
+                    hi[b] = math.inf if left == n else sPath[left]
+                kb = k[b]
+                x = s_l - lo[b]
+                Tx = table[kb, 6]*x + table[kb, 0]
+                Ty = table[kb, 7]*x + table[kb, 1]
+                Tz = table[kb, 8]*x + table[kb, 2]
+                sq_spd = vs_l*vs_l
+                gs = Tz*-g
+                nx = (table[kb, 9]*x + table[kb, 3])*sq_spd + Tx*gs
+                ny = (table[kb, 10]*x + table[kb, 4])*sq_spd + Ty*gs
+                nz = (table[kb, 11]*x + table[kb, 5])*sq_spd + Tz*gs + g
+                norm = math.sqrt(nx*nx + ny*ny + nz*nz)*vs_l*e_h[lane]
+                a = (gs - norm)*inv_inertia[lane]*dt
+                vs_l += a
+                s_l += vs_l*dt
+                s[lane] = s_l
+                vs[lane] = vs_l
+                vs_max[lane] = max(vs_max[lane], abs(vs_l))
+                while j[b] < records and record[j[b]] <= step:
+                    s_rec[lane, j[b]] = s_l
+                    vs_rec[lane, j[b]] = vs_l
+                    j[b] += 1
+                if s_l > length:
+                    finished[lane] = True
+                    finish_time[lane] = t
+                    lane_steps[lane] = step
+                    active -= 1
+        for lane in range(first, last):
+            if not finished[lane]:
+                lane_steps[lane] = step
+
+
+def compiled_euler_loop():
+    """Retourne euler_loop compilée par numba, ou None si indisponible
+
+    La compilation (ou la lecture du cache sur disque) n'a lieu qu'au premier
+    appel.
+    """
+    return _compile(euler_loop)
+
+
+def compiled_track_loop():
+    """Retourne track_euler_loop compilée par numba, ou None si indisponible"""
+    return _compile(track_euler_loop)
+
+
+def compiled_sweep_loop():
+    """Retourne sweep_loop compilée par numba, ou None si indisponible"""
+    return _compile(sweep_loop)
+
+
+def _compile(function):
+    name = function.__name__
+    if name not in _compiled:
+        _compiled[name] = None
+        if os.environ.get('SIMULATION_JIT', '1') != '0':
+            try:
+                import numba
+            except ImportError:
+                pass
+            else:
+                _compiled[name] = numba.njit(cache=True, nogil=True)(function)
+    return _compiled[name]
+
+
+def test(steps=20000):
+    """Compare euler_loop et track_euler_loop (compilées si possible) aux
+    boucles Python de Simulator et TrackSimulator, et sweep_loop à la version
+    numpy de sweep.sweep
+
+    Imprime les écarts maximaux relatifs sur s et vs, qui doivent rester sous
+    TOLERANCE.
+    """
+    import numpy as np
+
+    import path3d as p3d
+    import shape
+    import tracks
+    from simulator import Simulator, TrackSimulator
+
+    path = p3d.path(shape.xyz_from_file('datas/xyz_circuit_real.txt'), 400)
+    simulator = Simulator(path, tEnd=steps*0.0001, jit=False)
+    reference = simulator.run()
+    loop = compiled_euler_loop() or euler_loop
+    result = simulator._run_euler(loop)
+    error_s = np.max(np.abs(result.s - reference.s))/reference.length
+    error_vs = np.max(np.abs(result.vs - reference.vs))/np.max(np.abs(reference.vs))
+    print('numba' if loop is not euler_loop else 'python', error_s, error_vs)
+    assert error_s <= TOLERANCE and error_vs <= TOLERANCE
+
+    # Même comparaison pour track_euler_loop, sur le looping analytique
+    simulator = TrackSimulator(tracks.LoopingTrack(), tEnd=steps*0.0001, jit=False)
+    reference = simulator.run()
+    loop = compiled_track_loop() or track_euler_loop
+    result = simulator._run_euler(loop)
+    error_s = np.max(np.abs(result.s - reference.s))/reference.length
+    error_vs = np.max(np.abs(result.vs - reference.vs))/np.max(np.abs(reference.vs))
+    print('numba' if loop is not track_euler_loop else 'python', error_s, error_vs)
+    assert error_s <= TOLERANCE and error_vs <= TOLERANCE
+
+    # sweep_loop contre la version numpy du balayage
+    import sweep
+    e = np.linspace(0.0005, 0.001, 20)
+    params = dict(r=np.linspace(0.0075, 0.0085, 20), times=[0.5, 1.], tEnd=steps*0.0001)
+    compiled, numpy_ = sweep.sweep(path, e, **params), sweep.sweep(path, e, jit=False, **params)
+    error_s = np.max(np.abs(compiled[1] - numpy_[1]))/reference.length
+    print('sweep', 'numba' if compiled_sweep_loop() else 'numpy', error_s)
+    assert error_s <= TOLERANCE
+
+
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,214 @@
+# Recherche d'une disposition des points de passage pour un temps de parcours visé
+#
+#   python optimizer.py datas/xyz_circuits.txt --target 8 --free 3 4 5 --delta 2
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+import integrators
+import path3d as p3d
+from simulator import Simulator
+
+# Coût minimal d'un circuit qui ne respecte pas les contraintes ; s'y ajoute la
+# fraction du chemin non parcourue, pour guider la recherche
+PENALTY = 100.
+
+
+class TrackProblem:
+    """Coût d'une disposition des points de passage libres
+
+    Chaque candidat est simulé avec arrêt au premier événement : arrivée
+    ('end'), échec (par défaut arrêt de la bille 'stall' et décollement des
+    rails 'lift_off', voir Simulator) ou vitesse supérieure à vs_cap
+    ('overspeed'). Un candidat qui arrive au bout coûte
+    |temps de parcours - target| ; les autres coûtent PENALTY plus la
+    fraction du chemin qu'ils n'ont pas parcourue.
+
+    Args:
+        points (array): points de passage initiaux, array[3, N] [m]
+        free (list): indices des points de passage libres
+        delta (float ou array): déplacement maximal de chaque coordonnée libre
+            autour de sa valeur initiale, array[3, len(free)] [m]
+        target (float): temps de parcours visé [s]
+        vs_cap (float): vitesse maximale permise [m/s]
+        failures (tuple): événements d'échec, en plus de 'overspeed'
+        steps (int): nombre de points du chemin
+        integrator (str ou objet): schéma d'intégration (avec événements)
+        dt (float): pas de temps [s]
+        tEnd (float): durée maximale d'une simulation, 2*target par défaut [s]
+        **params: paramètres physiques transmis à Simulator
+    """
+
+    def __init__(self, points, free, delta, target, vs_cap=3., failures=('stall', 'lift_off'),
+                 steps=400, integrator='rk4', dt=0.01, tEnd=None, **params):
+        self.points = np.asarray(points, dtype=float)
+        self.free = list(free)
+        self.delta = np.broadcast_to(np.asarray(delta, dtype=float), (3, len(self.free)))
+        self.target = target
+        self.vs_cap = vs_cap
+        self.failures = tuple(failures)
+        self.steps = steps
+        self.params = dict(params, integrator=integrator, dt=dt,
+                           tEnd=2*target if tEnd is None else tEnd)
+
+    @property
+    def x0(self):
+        """Coordonnées initiales des points libres, à plat"""
+        return self.points[:, self.free].ravel()
+
+    @property
+    def bounds(self):
+        """Bornes (min, max) de chaque coordonnée libre"""
+        x0 = self.x0
+        delta = self.delta.ravel()
+        return list(zip(x0 - delta, x0 + delta))
+
+    def points_for(self, x):
+        """Points de passage d'un candidat"""
+        points = self.points.copy()
+        points[:, self.free] = np.reshape(x, (3, len(self.free)))
+        return points
+
+    def evaluate(self, x):
+        """Simule un candidat
+
+        Returns:
+            dict: 'cost', 'finished', 'finish_time' (None si le candidat
+                n'arrive pas au bout), 'reason' (nom de l'événement d'arrêt,
+                'timeout' sinon) et 's' (distance parcourue [m])
+        """
+        path = p3d.path(self.points_for(x), self.steps)
+        cap = self.vs_cap
+        events = ('end',) + self.failures + (
+            integrators.Event('overspeed', lambda s, vs: abs(vs) - cap, direction=1),)
+        result = Simulator(path, events=events, **self.params).run()
+        reason = result.events[-1][0] if result.events else 'timeout'
+        if reason == 'end':
+            cost = abs(result.finish_time - self.target)
+        else:
+            cost = PENALTY + 1 - result.s[-1]/result.length
+        finished = reason == 'end'
+        return {'cost': float(cost), 'finished': finished,
+                'finish_time': float(result.finish_time) if finished else None,
+                'reason': reason,
+                's': float(result.s[-1])}
+
+    def __call__(self, x):
+        return self.evaluate(x)['cost']
+
+
+class OptimizationResult:
+    """Résultat d'une optimisation
+
+    Attributes:
+        points (array): meilleurs points de passage, array[3, N] [m]
+        evaluation (dict): simulation de ces points (voir TrackProblem.evaluate)
+        evaluations (int): nombre de candidats simulés
+        wall_time (float): durée de l'optimisation [s]
+    """
+
+    def __init__(self, points, evaluation, evaluations, wall_time):
+        self.points = points
+        self.evaluation = evaluation
+        self.evaluations = evaluations
+        self.wall_time = wall_time
+
+    def save(self, filename):
+        """Sauve les points de passage au format des fichiers xyz (en cm)"""
+        np.savetxt(filename, self.points.T*100, fmt='%.4g')
+
+
+def optimize(problem, tol=0.01, maxiter=200, popsize=15, seed=None, workers=None):
+    """Cherche les points libres qui donnent le temps de parcours visé
+
+    Evolution différentielle (scipy.optimize.differential_evolution) : chaque
+    génération de candidats est simulée en parallèle sur workers processus.
+    Chaque candidat a son propre chemin (les points libres varient
+    continûment) ; sa construction (~0.6 ms pour 400 points) est négligeable
+    devant la simulation. La recherche s'arrête dès
+    qu'un candidat arrive à moins de tol secondes du temps visé.
+
+    Args:
+        problem (TrackProblem): problème à résoudre
+        tol (float): écart toléré au temps visé [s]
+        maxiter (int): nombre maximal de générations
+        popsize (int): taille de la population, par coordonnée libre
+        seed (int): graine du générateur aléatoire
+        workers (int): nombre de processus, par défaut le nombre de coeurs
+            (1 : calcul dans le processus courant)
+
+    Returns:
+        OptimizationResult: meilleure disposition trouvée
+    """
+    from scipy.optimize import differential_evolution
+
+    start = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+
+    def callback(intermediate_result):
+        return intermediate_result.fun < tol
+
+    kwargs = dict(maxiter=maxiter, popsize=popsize, seed=seed, tol=0, polish=False,
+                  updating='deferred', callback=callback, x0=problem.x0)
+    _init_worker(problem)
+    if workers == 1:
+        solution = differential_evolution(_cost, problem.bounds, **kwargs)
+    else:
+        with multiprocessing.Pool(workers, _init_worker, (problem,)) as pool:
+            solution = differential_evolution(_cost, problem.bounds, workers=pool.map, **kwargs)
+    return OptimizationResult(problem.points_for(solution.x), problem.evaluate(solution.x),
+                              solution.nfev, time.perf_counter() - start)
+
+
+# Etat d'un processus de calcul : problème à résoudre
+_problem = None
+
+
+def _init_worker(problem):
+    global _problem
+    _problem = problem
+
+
+def _cost(x):
+    return _problem(x)
+
+
+def main(argv=None):
+    import argparse
+
+    import shape
+
+    parser = argparse.ArgumentParser(description="Optimise les points de passage d'un circuit.")
+    parser.add_argument('track', help="fichier des points de passage (x y z en cm)")
+    parser.add_argument('--target', type=float, required=True, help="temps de parcours visé [s]")
+    parser.add_argument('--free', type=int, nargs='+', required=True,
+                        help="indices des points de passage libres")
+    parser.add_argument('--delta', type=float, default=2., help="déplacement maximal [cm]")
+    parser.add_argument('--vs-cap', type=float, default=3., help="vitesse maximale [m/s]")
+    parser.add_argument('--tol', type=float, default=0.01, help="écart toléré [s]")
+    parser.add_argument('--failures', nargs='*', default=['stall', 'lift_off'],
+                        choices=('stall', 'lift_off'),
+                        help="événements d'échec (en plus de la vitesse maximale)")
+    parser.add_argument('--maxiter', type=int, default=200)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('-o', '--output', help="fichier des points optimisés (x y z en cm)")
+    args = parser.parse_args(argv)
+
+    problem = TrackProblem(shape.xyz_from_file(args.track), args.free, args.delta/100,
+                           args.target, vs_cap=args.vs_cap, failures=args.failures)
+    print("Initial :", problem.evaluate(problem.x0))
+    result = optimize(problem, tol=args.tol, maxiter=args.maxiter, seed=args.seed,
+                      workers=args.workers)
+    print("Optimisé :", result.evaluation)
+    print("{} simulations en {:.1f} s".format(result.evaluations, result.wall_time))
+    if args.output:
+        result.save(args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
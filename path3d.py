@@ -1,9 +1,35 @@
 import numpy as np
-import scipy.interpolate as spip
+
+# scipy.interpolate n'est importé que dans les fonctions qui construisent les
+# splines : son import est lent et inutile quand le chemin vient d'un cache.
 
 # Code fourni par les professeurs de l'UCL
 
 
+def path_spline(points):
+    """
+    Calcule la spline cubique passant par des points de passage.
+
+    Paramètres:
+        points: array[3,N]
+            N points de passage en 3 dimensions
+    Retourne: (spline, tauPoints)
+        spline: tuple
+            représentation (t, c, k) de la spline, pour scipy.interpolate.splev
+        tauPoints: array[N]
+            paramètre de la spline aux points de passage
+    """
+    import scipy.interpolate as spip
+
+    # paramètre: racine carrée de la corde accumulée:
+    deltaTau = np.sqrt(np.sum(np.diff(points)**2, axis=0))
+    tauPoints = np.hstack(((0), np.cumsum(deltaTau)))
+
+    # Interpoler avec des spline cubiques:
+    spline = spip.splprep(points, u=tauPoints, s=0)[0]
+    return spline, tauPoints
+
+
 def path_points(points, steps=None):
     """
     Calcule un chemin courbe à partir de points de passage.
@@ -18,15 +44,10 @@ def path_points(points, steps=None):
         XPath: array[3,steps]
             coordonnées des points sur le chemin en 3 dimensions
     """
-
-    # paramètre: racine carrée de la corde accumulée:
-    deltaTau = np.sqrt(np.sum(np.diff(points)**2, axis=0))
-    tauPoints = np.hstack(((0), np.cumsum(deltaTau)))
+    import scipy.interpolate as spip
+    spline, tauPoints = path_spline(points)
     tauEnd = tauPoints[-1]
 
-    # Interpoler avec des spline cubiques:
-    spline = spip.splprep(points, u=tauPoints, s=0)[0]
-
     # Echantillonner à intervalles réguliers:
     if not steps:
         steps = 10*points.shape[1]
@@ -85,6 +106,110 @@ def path(points, steps=None):
     return sPath, XPath, TPath, CPath
 
 
+def path_tilt(points, beta, steps=None):
+    """
+    Calcule l'angle d'inclinaison des rails aux points d'un chemin,
+    par interpolation linéaire (selon le paramètre de la spline) des
+    angles donnés aux points de passage.
+
+    Paramètres:
+        points: array[3,N]
+            N points de passage en 3 dimensions
+        beta: float ou array[N]
+            angle d'inclinaison aux points de passage (radians, voir tilt_vectors)
+        steps: int
+            nombre de points du chemin, par défaut 10 * N (comme path())
+    Retourne:
+        betaPath: array[steps]
+            angle d'inclinaison aux points du chemin
+    """
+    deltaTau = np.sqrt(np.sum(np.diff(points)**2, axis=0))
+    tauPoints = np.hstack(((0), np.cumsum(deltaTau)))
+    if not steps:
+        steps = 10*points.shape[1]
+    tau = np.linspace(0, tauPoints[-1], steps)
+    return np.interp(tau, tauPoints, np.broadcast_to(beta, tauPoints.shape))
+
+
+def spline_arc_length(spline, tau, order=5):
+    """
+    Calcule la distance curvilinéaire le long d'une spline par quadrature
+    de Gauss-Legendre sur chaque intervalle.
+
+    Paramètres:
+        spline: tuple
+            spline telle que retournée par path_spline()
+        tau: array[M]
+            valeurs croissantes du paramètre, avec des intervalles sur
+            lesquels la spline est polynomiale (par exemple ses noeuds)
+        order: int, défaut=5
+            nombre de points de Gauss par intervalle
+    Retourne:
+        s: array[M]
+            distance curvilinéaire depuis tau[0]
+    """
+    return np.hstack(((0), np.cumsum(_spline_lengths(spline, tau[:-1], tau[1:], order))))
+
+
+def _spline_lengths(spline, a, b, order=5):
+    """Longueurs de la spline sur les intervalles [a, b] (Gauss-Legendre)"""
+    import scipy.interpolate as spip
+    x, w = np.polynomial.legendre.leggauss(order)
+    half = (b - a)/2
+    tau = half*x[:, None] + (a + b)/2
+    dX = np.array(spip.splev(tau.ravel(), spline, der=1))
+    speed = np.sqrt(np.sum(dX**2, axis=0)).reshape(tau.shape)
+    return half*np.sum(w[:, None]*speed, axis=0)
+
+
+def path_analytic(points, steps=None, subdivisions=4, newton=3):
+    """
+    Calcule les éléments d'un chemin courbe à partir de points de passage,
+    en dérivant analytiquement la spline (au lieu de différences finies sur
+    les points générés, comme le fait path_vectors). Les points sont
+    régulièrement espacés en distance curvilinéaire, calculée par
+    quadrature de Gauss.
+
+    Paramètres:
+        points: array[3,N]
+            N points de passage en 3 dimensions
+        steps: int
+            nombre de points à générer, par défaut 10 * N
+        subdivisions: int, défaut=4
+            nombre de sous-intervalles par intervalle entre points de passage
+            pour la table de distance curvilinéaire
+        newton: int, défaut=3
+            nombre d'itérations de Newton pour inverser s(tau)
+    Retourne: (sPath, XPath, TPath, CPath)
+        mêmes éléments que path()
+    """
+    import scipy.interpolate as spip
+    if not steps:
+        steps = 10*points.shape[1]
+    spline, tauPoints = path_spline(points)
+
+    # Table de s(tau), puis inversion par interpolation et méthode de Newton
+    tauTable = np.hstack([np.linspace(a, b, subdivisions, endpoint=False)
+                          for a, b in zip(tauPoints[:-1], tauPoints[1:])] + [tauPoints[-1:]])
+    sTable = spline_arc_length(spline, tauTable)
+    sPath = np.linspace(0, sTable[-1], steps)
+    tau = np.interp(sPath, sTable, tauTable)
+    for _ in range(newton):
+        j = np.clip(np.searchsorted(tauTable, tau, 'right') - 1, 0, len(tauTable) - 2)
+        s = sTable[j] + _spline_lengths(spline, tauTable[j], tau)
+        speed = np.sqrt(np.sum(np.array(spip.splev(tau, spline, der=1))**2, axis=0))
+        tau = np.clip(tau - (s - sPath)/speed, tauPoints[0], tauPoints[-1])
+
+    # Dérivées analytiques, reparamétrées par la distance curvilinéaire
+    XPath = np.array(spip.splev(tau, spline))
+    dX = np.array(spip.splev(tau, spline, der=1))
+    d2X = np.array(spip.splev(tau, spline, der=2))
+    speed = np.sqrt(np.sum(dX**2, axis=0))
+    TPath = dX/speed
+    CPath = (d2X - np.sum(d2X*TPath, axis=0)*TPath)/speed**2
+    return sPath, XPath, TPath, CPath
+
+
 def ainterp(x, xp, ap, **kwargs):
     """
     Interpolation en x sur plusieurs fonctions xp -> ap[k].
@@ -136,28 +261,79 @@ def tilt_vectors(T, beta=0.):
     Retourne les vecteurs d'inclinaison le long d'un chemin.
 
     Paramètres:
-        T: array[3]
-            vecteur tangent au chemin
-        beta: float, défaut=0.
-            angle d'inclinaison par rapport à l'horizontale
+        T: array[3] ou array[3,N]
+            vecteur tangent au chemin (en ses N points)
+        beta: float ou array[N], défaut=0.
+            angle d'inclinaison par rapport aux rails non inclinés
             (> 0 = penche à droite dans le sens de T, en radians)
 
     Retourne: B, N
-        B: array[3]
+        B: array[3] ou array[3,N]
             vecteur unitaire normal parallèle à l'inclinaison
             (à gauche dans le sens de T)
-        B: array[3]
+        N: array[3] ou array[3,N]
             vecteur unitaire normal perpendiculaire à l'inclinaison
-            (vers z > 0)
+            (normale des rails non inclinés pour beta = 0, voir rail_normals)
     """
     T /= np.sqrt(np.sum(T**2, axis=0))  # unit
-    Z = np.array((0, 0, 1))
 
-    D = np.cross(Z, T, axis=0)
-    D /= np.sqrt(np.sum(D**2, axis=0))  # unit normale horizontale
-
-    U = np.cross(T, D, axis=0)  # unit normale verticale
+    U = rail_normals(T)  # unit normale des rails non inclinés
+    D = np.cross(U, T, axis=0)  # unit normale "horizontale", à gauche
 
     B = D*np.cos(beta) + U*np.sin(beta)  # unit normale parallèle
     N = np.cross(T, B, axis=0)  # unit normale perpendiculaire
     return B, N
+
+
+def rail_normals(T, steep=np.sqrt(3)/2):
+    """
+    Retourne la normale des rails non inclinés, du côté de la bille.
+
+    Là où la pente est modérée (|Tz| <= steep), c'est la normale verticale
+    (Z - Tz*T)/sqrt(1 - Tz²), au signe près : le signe est celui qui prolonge
+    la normale précédente. Là où T est presque vertical, cette normale n'est
+    pas définie ou tourne très vite autour de T ; la normale précédente y est
+    simplement transportée (projetée perpendiculairement à T). Dans une
+    boucle, la normale passe ainsi vers le centre de la boucle (z < 0 en haut
+    de la boucle) et revient vers z > 0 à la sortie.
+
+    Paramètres:
+        T: array[3] ou array[3,N]
+            vecteur tangent au chemin, en ses N points (dans l'ordre)
+        steep: float
+            |Tz| au delà duquel la normale est transportée (sin 60°)
+
+    Retourne:
+        U: array[3] ou array[3,N]
+            normale unitaire des rails
+    """
+    T = np.asarray(T, dtype=float)
+    shape = T.shape
+    T = T.reshape(3, -1)/np.sqrt(np.sum(T.reshape(3, -1)**2, axis=0))
+    vertical = -T[2]*T
+    vertical[2] += 1
+    vertical /= np.sqrt(np.maximum(np.sum(vertical**2, axis=0), 1e-300))
+
+    # Boucle sur des flottants Python : quelques µs par point
+    U = []
+    ux, uy, uz = (1., 0., 0.) if abs(T[2, 0]) == 1 else vertical[:, 0]
+    px, py, pz = T[:, 0]
+    for (tx, ty, tz), (vx, vy, vz) in zip(T.T.tolist(), vertical.T.tolist()):
+        if abs(tz) <= steep:
+            sign = 1. if ux*vx + uy*vy + uz*vz >= 0 else -1.
+            ux, uy, uz = sign*vx, sign*vy, sign*vz
+        else:
+            dot = ux*tx + uy*ty + uz*tz
+            wx, wy, wz = ux - dot*tx, uy - dot*ty, uz - dot*tz
+            norm = (wx*wx + wy*wy + wz*wz)**0.5
+            if norm < 1e-6:
+                # Coude à angle droit : la normale précédente est devenue
+                # tangente, la rotation de T l'amène sur -T précédent
+                dot = px*tx + py*ty + pz*tz
+                wx, wy, wz = dot*tx - px, dot*ty - py, dot*tz - pz
+                norm = (wx*wx + wy*wy + wz*wz)**0.5
+            ux, uy, uz = wx/norm, wy/norm, wz/norm
+        px, py, pz = tx, ty, tz
+        U.append((ux, uy, uz))
+    U = np.array(U).T
+    return U.reshape(shape)
@@ -0,0 +1,165 @@
+# Cache des chemins calculés par path3d : en mémoire (LRU) et sur disque (.npz)
+import collections
+import hashlib
+import os
+import time
+
+import numpy as np
+
+import path3d as p3d
+
+_NAMES = ('sPath', 'XPath', 'TPath', 'CPath')
+
+# Version de la construction des chemins, incluse dans les clés : à
+# incrémenter quand path3d change les chemins calculés
+PATH_VERSION = 1
+
+
+class PathCache:
+    """Cache des éléments de chemin (sPath, XPath, TPath, CPath)
+
+    La clé est une empreinte des points de passage, de steps, de la fonction
+    de construction et de PATH_VERSION. Les chemins sont gardés en mémoire (les moins récemment
+    utilisés sont oubliés au delà de max_entries) et, si directory est donné,
+    sauvés en .npz dans ce dossier, dont la taille est limitée à max_bytes en
+    supprimant les fichiers les moins récemment utilisés.
+
+    Args:
+        directory (str): dossier du cache sur disque (pas de cache disque si None)
+        max_entries (int): nombre maximal de chemins gardés en mémoire
+        max_bytes (int): taille maximale du cache sur disque [octets]
+        builder (callable): fonction de construction, path3d.path par défaut
+
+    Attributes:
+        hits (int): chemins trouvés en mémoire
+        disk_hits (int): chemins lus sur le disque
+        misses (int): chemins construits
+        build_time (float): temps total de construction [s]
+        load_time (float): temps total de lecture sur le disque [s]
+    """
+
+    def __init__(self, directory=None, max_entries=32, max_bytes=256*2**20, builder=p3d.path):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.builder = builder
+        self._memory = collections.OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.build_time = 0.
+        self.load_time = 0.
+
+    def key(self, points, steps=None):
+        """Empreinte des paramètres de construction d'un chemin"""
+        points = np.ascontiguousarray(points, dtype=float)
+        h = hashlib.sha1(points.tobytes())
+        h.update(repr((PATH_VERSION, points.shape, steps, self.builder.__module__,
+                       self.builder.__qualname__)).encode())
+        return h.hexdigest()
+
+    def path(self, points, steps=None):
+        """Retourne le chemin passant par les points, comme path3d.path()
+
+        Les tableaux retournés sont partagés entre les appels et donc en
+        lecture seule.
+
+        Args:
+            points (array): N points de passage, array[3, N]
+            steps (int): nombre de points à générer
+
+        Returns:
+            tuple: (sPath, XPath, TPath, CPath)
+        """
+        key = self.key(points, steps)
+        path = self._memory.get(key)
+        if path is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return path
+
+        path = self._load(key)
+        if path is None:
+            start = time.perf_counter()
+            path = self.builder(np.asarray(points, dtype=float), steps)
+            self.build_time += time.perf_counter() - start
+            self.misses += 1
+            self._save(key, path)
+        for array in path:
+            array.setflags(write=False)
+
+        self._memory[key] = path
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+        return path
+
+    def stats(self):
+        """Retourne les compteurs du cache"""
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+                'build_time': self.build_time, 'load_time': self.load_time}
+
+    def clear(self, disk=False):
+        """Vide le cache en mémoire (et sur le disque si disk est vrai)"""
+        self._memory.clear()
+        if disk and self.directory and os.path.isdir(self.directory):
+            for name, size, mtime in self._disk_entries():
+                os.remove(name)
+
+    def _filename(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def _load(self, key):
+        if not self.directory:
+            return None
+        start = time.perf_counter()
+        try:
+            with np.load(self._filename(key)) as data:
+                path = tuple(data[name] for name in _NAMES)
+            os.utime(self._filename(key))  # date d'accès pour l'éviction
+        except (OSError, KeyError, ValueError):
+            return None
+        self.load_time += time.perf_counter() - start
+        self.disk_hits += 1
+        return path
+
+    def _save(self, key, path):
+        if not self.directory:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = self._filename(key) + '.tmp'
+            with open(tmp, 'wb') as f:
+                np.savez(f, **dict(zip(_NAMES, path)))
+            os.replace(tmp, self._filename(key))
+        except OSError:
+            return
+        self._evict()
+
+    def _disk_entries(self):
+        """Fichiers du cache sur disque (nom, taille, date), du plus ancien au plus récent"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz'):
+                name = os.path.join(self.directory, name)
+                stat = os.stat(name)
+                entries.append((name, stat.st_size, stat.st_mtime))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def _evict(self):
+        """Supprime les fichiers les moins récemment utilisés au delà de max_bytes"""
+        entries = self._disk_entries()
+        total = sum(size for name, size, mtime in entries)
+        for name, size, mtime in entries[:-1]:
+            if total <= self.max_bytes:
+                break
+            os.remove(name)
+            total -= size
+
+
+# Cache par défaut, sur disque dans PATH_CACHE_DIR (par défaut .path_cache)
+default_cache = PathCache(os.environ.get('PATH_CACHE_DIR', '.path_cache'))
+
+
+def cached_path(points, steps=None):
+    """path3d.path() à travers le cache par défaut (voir PathCache.path)"""
+    return default_cache.path(points, steps)
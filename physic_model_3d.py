@@ -1,5 +1,32 @@
 import math
 
+import numpy as np
+
+# Les fonctions *_array évaluent le modèle pour plusieurs états à la fois :
+# les vecteurs sont des array[3] ou array[3, N] et la vitesse un float ou un
+# array[N]. Les fonctions sans suffixe en sont des enveloppes pour un seul état.
+
+
+def _vectors(vec, Vs=None):
+    """Convertit vec en array[3, ...] compatible avec la forme de Vs"""
+    vec = np.asarray(vec, dtype=float)
+    if Vs is not None and vec.ndim == 1 and np.ndim(Vs):
+        vec = vec.reshape((vec.shape[0],) + (1,)*np.ndim(Vs))
+    return vec
+
+
+def norm_of_vector_array(vec):
+    """Calcul la norme de vecteurs à n dimension
+
+    Args:
+        vec (array): les vecteurs, array[n] ou array[n, N]
+
+    Returns:
+        array: la norme des vecteurs, float ou array[N]
+    """
+    vec = np.asarray(vec, dtype=float)
+    return np.sqrt(np.einsum('i...,i...->...', vec, vec))
+
 
 def norm_of_vector(vec):
     """Calcul la norme d'un vecteur à n dimension
@@ -10,10 +37,7 @@ def norm_of_vector(vec):
     Returns:
         float: la norme du vecteur
     """
-    sum = 0
-    for comp in vec:  # Je fais une boucle pour mettre au carré chaque composante
-        sum += comp**2
-    return math.sqrt(sum)
+    return float(norm_of_vector_array(vec))
 
 
 def gs_normal(T, g):
@@ -29,6 +53,23 @@ def gs_normal(T, g):
     return -g*T[2]
 
 
+def gn_vector_array(T, g):
+    """Renvoie les vecteurs gn
+
+    Args:
+        T (array): Les vecteurs unitaires trajectoire, array[3] ou array[3, N]
+        g (float): la constante de gravité
+
+    Returns:
+        array: Les vecteurs gn = g-gs, de la forme de T
+    """
+    T = _vectors(T)
+    # Pour avoir gs comme vecteur, on multiplie sa norme par T (vecteur unitaire)
+    gn = -gs_normal(T, g)*T
+    gn[2] -= g  # gn = g - gs avec g = (0, 0, -g)
+    return gn
+
+
 def gn_vector(T, g):
     """Renvoie le vecteur gn
 
@@ -39,12 +80,22 @@ def gn_vector(T, g):
     Returns:
         array: Le vecteur gn sous forme de tableau gn = g-gs
     """
-    gs_norm = gs_normal(T, g)
-    g_vector = [0, 0, -g]
-    # Pour avoir gs comme vecteur, on multiplie sa norme par T (vecteur unitaire)
-    gs_vector = [T[0]*gs_norm, T[1]*gs_norm, T[2]*gs_norm]
-    # on soustrait chaque composante car gn = g - gs
-    return [g_vector[0] - gs_vector[0], g_vector[1]-gs_vector[1], g_vector[2]-gs_vector[2]]
+    return gn_vector_array(T, g).tolist()
+
+
+def norm_vector_rn_array(C, Vs, gn):
+    """Renvoie la norme des "gros" vecteurs qui sont au numérateur
+
+    Args:
+        C (array): les vecteurs de courbure, array[3] ou array[3, N]
+        Vs (float ou array): les vitesses actuelles, float ou array[N]
+        gn (array): les vecteurs gn, de la forme de C
+
+    Returns:
+        array: la norme des gros vecteurs, float ou array[N]
+    """
+    Vs = np.asarray(Vs, dtype=float)
+    return norm_of_vector_array(_vectors(C, Vs)*Vs**2 - _vectors(gn, Vs))
 
 
 def norm_vector_rn(C, Vs, gn):
@@ -58,12 +109,7 @@ def norm_vector_rn(C, Vs, gn):
     Returns:
         float: la norme du gros_vecteur
     """
-    sq_spd = Vs**2
-    speed_vector = [C[0]*sq_spd, C[1]*sq_spd, C[2]*sq_spd]
-    # On soustrait les 2 vecteurs (composante par composante)
-    total_vector = [speed_vector[0]-gn[0],
-                    speed_vector[1]-gn[1], speed_vector[2]-gn[2]]
-    return norm_of_vector(total_vector)
+    return float(norm_vector_rn_array(C, Vs, gn))
 
 
 def numerator_acceleration(Vs, C, T, h, e, g):
@@ -96,6 +142,38 @@ def inertia(r, h):
     return 1 + 2/5*r**2/h**2
 
 
+def acceleration_array(Vs, C, T, h, e, r, g):
+    """Renvoie les accélérations pour plusieurs états à la fois
+
+    Args:
+        Vs (float ou array): vitesses actuelles, float ou array[N]
+        C (array): vecteurs normal/courbure, array[3] ou array[3, N]
+        T (array): vecteurs tangeant à la trajectoire, array[3] ou array[3, N]
+        h (float ou array): hauteur avec la bille et le rail
+        e (float ou array): frottement
+        r (float ou array): rayon de la bille
+        g (float): constante de gravité
+
+    Returns:
+        array: accélérations, float ou array[N]
+    """
+    Vs = np.asarray(Vs, dtype=float)
+    T = _vectors(T, Vs)
+    C = _vectors(C, Vs)
+    # Un vecteur array[3] s'applique à tous les états de l'autre, array[3, N]
+    if T.ndim < C.ndim:
+        T = T.reshape(T.shape + (1,)*(C.ndim - T.ndim))
+    elif C.ndim < T.ndim:
+        C = C.reshape(C.shape + (1,)*(T.ndim - C.ndim))
+    gs = gs_normal(T, g)
+    # gros vecteur C*Vs² - gn, avec gn = g - gs (rn est un nouveau tableau,
+    # de la forme commune à C, T et Vs)
+    rn = C*Vs**2 + gs*T
+    rn[2] += g
+    numerator = gs - e*Vs*norm_of_vector_array(rn)/h
+    return numerator/inertia(r, h)
+
+
 def acceleration(Vs, C, T, h, e, r, g):
     """Renvoie la valeur de l'accélération en fonction des différents paramètres
 
@@ -111,7 +189,7 @@ def acceleration(Vs, C, T, h, e, r, g):
     Returns:
         float: résultats de l'équation en fonction de tous les paramètres
     """
-    return numerator_acceleration(Vs, C, T, h, e, g)/inertia(r, h)
+    return float(acceleration_array(Vs, C, T, h, e, r, g))
 
 
 def cinetic_energy(m, v, I):
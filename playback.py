@@ -0,0 +1,278 @@
+# Animation du mouvement de la bille, en temps réel ou image par image
+#
+#   python playback.py datas/xyz_circuit_real.txt
+#   python playback.py datas/xyz_circuit_real.txt --frames images --fps 30
+#
+# La simulation avance dans un fil d'exécution séparé et envoie ses états dans
+# une file bornée (recorders.QueueRecorder) ; l'affichage lit la file à son
+# propre rythme et interpole la position de la bille à l'heure de l'image. Le
+# circuit n'est dessiné qu'une fois : à chaque image, seuls la bille et le
+# texte sont redessinés (blitting).
+import itertools
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+import path3d as p3d
+import recorders
+
+
+class StateStream:
+    """Etats d'une simulation lancée en arrière-plan, interpolés à la demande
+
+    Args:
+        simulator (Simulator): simulation à lancer (son enregistreur est remplacé)
+        record_dt (float): intervalle de temps entre deux états transmis [s]
+        maxsize (int): nombre maximal de paquets d'états en attente dans la file
+
+    Attributes:
+        result (SimulationResult): résultat de la simulation une fois finie
+            (sans les états, transmis par la file)
+    """
+
+    def __init__(self, simulator, record_dt=0.001, maxsize=4):
+        self.simulator = simulator
+        self.result = None
+        self._queue = queue.Queue(maxsize)
+        self._stop = threading.Event()
+        self._error = None
+        self._recorder = recorders.QueueRecorder(
+            self._queue, max(1, int(round(record_dt/simulator.dt))), self._stop)
+        simulator.recorder = self._recorder
+        self._states = np.zeros(0, recorders.STATE_DTYPE)
+        self.done = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            self.result = self.simulator.run()
+        except recorders.StopSimulation:
+            pass
+        except BaseException as error:
+            self._error = error
+            try:
+                self._recorder.finish()  # fin de la file, pour le lecteur
+            except recorders.StopSimulation:
+                pass
+
+    def stop(self):
+        """Interrompt la simulation"""
+        self._stop.set()
+        self._thread.join()
+
+    def state_at(self, t, block=False):
+        """Etat de la bille au temps t, interpolé linéairement
+
+        Args:
+            t (float): temps [s]
+            block (bool): attend que la simulation ait atteint t (sinon,
+                retourne le dernier état disponible)
+
+        Returns:
+            tuple: (t, s, vs), t étant limité aux temps déjà calculés, ou
+                None si aucun état n'est encore disponible
+        """
+        states = self._states
+        while not self.done and (len(states) == 0 or states['t'][-1] < t):
+            try:
+                chunk = self._queue.get(block)
+            except queue.Empty:
+                break
+            if chunk is None:
+                self.done = True
+                if self._error is not None:
+                    raise self._error
+                break
+            # On garde le dernier état du paquet précédent, pour interpoler
+            states = np.concatenate((states[-1:], chunk))
+        self._states = states = states[max(np.searchsorted(states['t'], t) - 1, 0):]
+        if len(states) == 0:
+            return None
+        t = min(max(t, states['t'][0]), states['t'][-1])
+        return (t, np.interp(t, states['t'], states['s']),
+                np.interp(t, states['t'], states['vs']))
+
+    def finished(self, t):
+        """Vrai si la simulation est finie et que t dépasse son dernier état"""
+        return self.done and (len(self._states) == 0 or t >= self._states['t'][-1])
+
+
+class Player:
+    """Affichage du circuit et de la bille qui le parcourt
+
+    Args:
+        points (array): points de passage, array[3, N] [m]
+        path (tuple): (sPath, XPath, TPath, CPath) tel que retourné par path3d.path()
+        simulator (Simulator): simulation à afficher
+        fps (float): images par seconde
+        speed (float): vitesse de lecture (1 : temps réel)
+        record_dt (float): intervalle de temps entre deux états transmis
+            par la simulation [s]
+    """
+
+    def __init__(self, points, path, simulator, fps=60, speed=1., record_dt=0.001):
+        self.points = points
+        self.path = path
+        self.simulator = simulator
+        self.fps = fps
+        self.speed = speed
+        self.record_dt = record_dt
+        self.frames = 0  # nombre d'images affichées (ou rendues)
+        self.measured_fps = None  # images par seconde obtenues
+
+    def figure(self, fig):
+        """Dessine le circuit et prépare les éléments animés
+
+        Returns:
+            tuple: (bille, texte), les deux éléments redessinés à chaque image
+        """
+        sPath, XPath, TPath, CPath = self.path
+        ax = fig.add_subplot(projection='3d')
+        ax.set_box_aspect(np.ptp(XPath, axis=1))
+        ax.plot(self.points[0], self.points[1], self.points[2], 'bo', ms=3, label='Points')
+        ax.plot(XPath[0], XPath[1], XPath[2], 'k-', lw=0.5, label='Chemin')
+        X = XPath[:, 0]
+        ball, = ax.plot([X[0]], [X[1]], [X[2]], 'ro', ms=8, animated=True, label='Bille')
+        text = ax.text2D(0.02, 0.95, '', transform=ax.transAxes, animated=True)
+        ax.legend(loc='upper right')
+        return ball, text
+
+    def _update(self, ball, text, state):
+        t, s, vs = state
+        X = p3d.ainterp(s, self.path[0], self.path[1])
+        ball.set_data_3d([X[0]], [X[1]], [X[2]])
+        text.set_text('t = {:.2f} s   vs = {:.2f} m/s'.format(t, vs))
+
+    def show(self):
+        """Animation en temps réel dans une fenêtre matplotlib
+
+        La simulation démarre avec l'affichage ; si elle prend du retard sur
+        l'horloge d'affichage, la bille attend les états suivants.
+        """
+        import matplotlib.pyplot as plt
+        from matplotlib.animation import FuncAnimation
+
+        fig = plt.figure()
+        ball, text = self.figure(fig)
+        stream = StateStream(self.simulator, self.record_dt)
+        start = None
+
+        def update(frame):
+            nonlocal start
+            now = time.perf_counter()
+            if start is None:
+                start = now
+            t = (now - start)*self.speed
+            state = stream.state_at(t)
+            if state is not None:
+                self._update(ball, text, state)
+            self.frames += 1
+            if now > start:
+                self.measured_fps = self.frames/(now - start)
+            if stream.finished(t):
+                animation.event_source.stop()
+            return ball, text
+
+        animation = FuncAnimation(fig, update, interval=1000/self.fps, blit=True,
+                                  cache_frame_data=False)
+        try:
+            plt.show()
+        finally:
+            stream.stop()
+        return animation
+
+    def render(self, directory, tEnd=None, dpi=100, prefix='frame'):
+        """Rend l'animation en images PNG, sans fenêtre (matplotlib Agg)
+
+        Une image tous les speed/fps secondes de simulation, jusqu'à la fin
+        de la simulation ou jusqu'à tEnd.
+
+        Args:
+            directory (str): dossier des images (créé si besoin)
+            tEnd (float): temps de la dernière image [s]
+            dpi (int): résolution des images
+            prefix (str): début du nom des images (suivi du numéro)
+
+        Returns:
+            dict: 'frames' (nombre d'images), 'fps' (images rendues et
+                écrites par seconde), 'render_fps' (images rendues par
+                seconde, sans l'écriture) et 'files' (noms des images)
+        """
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+        from matplotlib.image import imsave
+
+        os.makedirs(directory, exist_ok=True)
+        fig = Figure(dpi=dpi)
+        canvas = FigureCanvasAgg(fig)
+        ball, text = self.figure(fig)
+        canvas.draw()
+        background = canvas.copy_from_bbox(fig.bbox)
+        stream = StateStream(self.simulator, self.record_dt)
+        files = []
+        render_time = 0.
+        start = time.perf_counter()
+        try:
+            for frame in itertools.count():
+                t = frame*self.speed/self.fps
+                if (tEnd is not None and t > tEnd) or stream.finished(t):
+                    break
+                state = stream.state_at(t, block=True)
+                if state is None:
+                    break
+                begin = time.perf_counter()
+                canvas.restore_region(background)
+                self._update(ball, text, state)
+                fig.draw_artist(ball)
+                fig.draw_artist(text)
+                image = np.asarray(canvas.buffer_rgba())
+                render_time += time.perf_counter() - begin
+                filename = os.path.join(directory, '{}_{:05d}.png'.format(prefix, frame))
+                imsave(filename, image)
+                files.append(filename)
+        finally:
+            stream.stop()
+        elapsed = time.perf_counter() - start
+        self.frames = len(files)
+        self.measured_fps = len(files)/elapsed if elapsed > 0 else None
+        return {'frames': len(files), 'fps': self.measured_fps,
+                'render_fps': len(files)/render_time if render_time > 0 else None,
+                'files': files}
+
+
+def main(argv=None):
+    import argparse
+
+    import shape
+    from path_cache import cached_path
+    from simulator import Simulator
+
+    parser = argparse.ArgumentParser(description="Anime le mouvement de la bille.")
+    parser.add_argument('track', help="fichier des points de passage (x y z en cm)")
+    parser.add_argument('--fps', type=float, default=60, help="images par seconde")
+    parser.add_argument('--speed', type=float, default=1., help="vitesse de lecture")
+    parser.add_argument('--frames', help="dossier des images (sans fenêtre)")
+    parser.add_argument('--tEnd', type=float, help="temps de la dernière image [s]")
+    parser.add_argument('--dt', type=float, default=0.0001, help="pas de temps [s]")
+    parser.add_argument('--steps', type=int, default=400, help="nombre de points du chemin")
+    args = parser.parse_args(argv)
+
+    points = shape.xyz_from_file(args.track)
+    path = cached_path(points, args.steps)
+    player = Player(points, path, Simulator(path, dt=args.dt), args.fps, args.speed)
+    if args.frames:
+        report = player.render(args.frames, args.tEnd)
+        print("{} images, {:.1f} images/s ({:.1f} images/s sans l'écriture)".format(
+            report['frames'], report['fps'], report['render_fps'] or 0.))
+    else:
+        player.show()
+        print("{} images, {:.1f} images/s".format(player.frames, player.measured_fps or 0.))
+    return 0
+
+
+if __name__ == "__main__":
+    main()
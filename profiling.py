@@ -0,0 +1,239 @@
+# Mesure du temps passé dans chaque partie d'une simulation
+#
+#   with Profiler() as profiler:
+#       path = p3d.path(points, 400)
+#       Simulator(path).run()
+#   profiler.print_report()
+#
+# Hors d'un bloc with Profiler(), rien n'est mesuré et le code n'est pas
+# modifié : les fonctions de path3d et physic_model_3d ne sont remplacées par
+# des versions chronométrées que pendant le bloc, et Simulator ne vérifie la
+# présence d'un profileur qu'une fois par paquet de pas.
+import cProfile
+import functools
+import importlib
+import io
+import json
+import pstats
+import time
+
+# Fonctions chronométrées pendant un bloc with Profiler() : construction du
+# chemin, interpolation, modèle physique, préparation et recherche des
+# segments de Simulator
+TARGETS = (
+    'path3d.path',
+    'path3d.path_points',
+    'path3d.path_spline',
+    'path3d.path_vectors',
+    'path3d.path_analytic',
+    'path3d.path_tilt',
+    'path3d.path_at',
+    'path3d.tilt_vectors',
+    'path_cache.PathCache.path',
+    'physic_model_3d.acceleration',
+    'physic_model_3d.acceleration_array',
+    'physic_model_3d.cinetic_energy',
+    'physic_model_3d.potentiel_energy',
+    'simulator._segments',
+    'simulator._segment_at',
+)
+
+_active = None
+
+
+def active():
+    """Retourne le profileur du bloc with en cours, ou None"""
+    return _active
+
+
+class Profiler:
+    """Chronomètres par phase, compteurs et, en option, cProfile et trace
+
+    Une phase est un nom ('simulator.integrate', 'path3d.path'...) auquel
+    s'ajoutent le temps et le nombre d'appels de chaque mesure. Les temps des
+    phases imbriquées (path3d.path appelle path3d.path_points...) sont inclus
+    dans ceux des phases englobantes.
+
+    Dans la boucle d'Euler en Python de Simulator, les phases 'loop.lookup'
+    (changement de segment), 'loop.interpolation', 'loop.acceleration' et
+    'loop.step' (pas d'Euler et écriture des tampons) sont mesurées à chaque
+    pas si detail est vrai. Le coût d'une lecture de l'horloge (de l'ordre de
+    celui d'une phase) est alors retranché des temps du rapport.
+
+    Args:
+        targets (tuple): fonctions à chronométrer, 'module.fonction' ou
+            'module.Classe.méthode'
+        detail (bool): détaille la boucle d'Euler (la simulation est alors
+            plusieurs fois plus lente)
+        cprofile (bool): enregistre aussi le profil de cProfile
+        trace (bool): garde la chronologie des phases (voir save_trace)
+    """
+
+    def __init__(self, targets=TARGETS, detail=True, cprofile=False, trace=False):
+        self.targets = tuple(targets)
+        self.detail = detail
+        self.timers = {}    # nom: [temps total, nombre d'appels]
+        self.counters = {}  # nom: valeur
+        self.events = [] if trace else None
+        self._cprofile = cProfile.Profile() if cprofile else None
+        self._patches = []
+        self._origin = time.perf_counter()
+        self.clock_overhead = _clock_overhead()
+
+    def __enter__(self):
+        global _active
+        if _active is not None:
+            raise RuntimeError("Un profileur est déjà actif")
+        _active = self
+        for target in self.targets:
+            self._patch(target)
+        if self._cprofile is not None:
+            self._cprofile.enable()
+        return self
+
+    def __exit__(self, *exc):
+        global _active
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        for owner, name, original in reversed(self._patches):
+            setattr(owner, name, original)
+        self._patches = []
+        _active = None
+        return False
+
+    def add(self, name, elapsed, calls=1, start=None):
+        """Ajoute une mesure à la phase name
+
+        Args:
+            name (str): nom de la phase
+            elapsed (float): durée [s]
+            calls (int): nombre d'appels mesurés
+            start (float): instant de début (time.perf_counter), pour la trace
+        """
+        timer = self.timers.setdefault(name, [0., 0])
+        timer[0] += elapsed
+        timer[1] += calls
+        if self.events is not None and start is not None:
+            self.events.append((name, start - self._origin, elapsed))
+
+    def count(self, name, n=1):
+        """Ajoute n au compteur name"""
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def phase(self, name):
+        """Chronomètre un bloc with : with profiler.phase('nom'): ..."""
+        return _Phase(self, name)
+
+    def wrap(self, name, function):
+        """Retourne function chronométrée sous le nom de phase name"""
+        add = self.add
+        clock = time.perf_counter
+
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                add(name, clock() - start, 1, start)
+        return timed
+
+    def report(self, top=20):
+        """Rapport structuré des mesures
+
+        Args:
+            top (int): nombre de fonctions du profil cProfile à garder
+
+        Returns:
+            dict: 'phases' ({nom: {'time', 'calls', 'per_call'}}, temps
+                corrigés du coût de l'horloge, par temps décroissant),
+                'counters', 'clock_overhead' [s] et, avec cprofile, 'profile'
+                (liste de {'function', 'calls', 'tottime', 'cumtime'})
+        """
+        phases = {}
+        for name, (elapsed, calls) in sorted(self.timers.items(), key=lambda x: -x[1][0]):
+            elapsed = max(elapsed - calls*self.clock_overhead, 0.)
+            phases[name] = {'time': elapsed, 'calls': calls,
+                            'per_call': elapsed/calls if calls else None}
+        report = {'phases': phases, 'counters': dict(self.counters),
+                  'clock_overhead': self.clock_overhead}
+        if self._cprofile is not None:
+            report['profile'] = _profile_rows(self._cprofile, top)
+        return report
+
+    def print_report(self, top=20, file=None):
+        """Imprime le rapport (voir report)"""
+        report = self.report(top)
+        print('{:<40} {:>12} {:>10} {:>12}'.format('phase', 'temps [s]', 'appels', 'par appel'),
+              file=file)
+        for name, phase in report['phases'].items():
+            print('{:<40} {:>12.4g} {:>10} {:>12.3g}'.format(
+                name, phase['time'], phase['calls'], phase['per_call'] or 0.), file=file)
+        for name, value in report['counters'].items():
+            print('{:<40} {:>12}'.format(name, value), file=file)
+        for row in report.get('profile', ()):
+            print('{:<60} {:>10} {:>10.4g} {:>10.4g}'.format(
+                row['function'][-60:], row['calls'], row['tottime'], row['cumtime']), file=file)
+
+    def save_trace(self, filename):
+        """Sauve la chronologie des phases au format Trace Event (JSON)
+
+        Le fichier s'ouvre dans chrome://tracing ou https://ui.perfetto.dev.
+        Les phases de la boucle d'Euler, mesurées en bloc, n'y figurent pas.
+        """
+        if self.events is None:
+            raise ValueError("Profiler(trace=True) est nécessaire pour sauver la trace")
+        events = [{'name': name, 'ph': 'X', 'ts': start*1e6, 'dur': elapsed*1e6,
+                   'pid': 0, 'tid': 0} for name, start, elapsed in self.events]
+        with open(filename, 'w') as f:
+            json.dump({'traceEvents': events}, f)
+
+    def _patch(self, target):
+        """Remplace la fonction target par sa version chronométrée"""
+        module, _, name = target.rpartition('.')
+        try:
+            owner = importlib.import_module(module)
+        except ImportError:
+            # 'module.Classe.méthode'
+            module, _, cls = module.rpartition('.')
+            owner = getattr(importlib.import_module(module), cls)
+        original = owner.__dict__[name] if isinstance(owner, type) else getattr(owner, name)
+        self._patches.append((owner, name, original))
+        setattr(owner, name, self.wrap(target, original))
+
+
+class _Phase:
+    """Bloc with chronométré (voir Profiler.phase)"""
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.add(self.name, time.perf_counter() - self.start, 1, self.start)
+        return False
+
+
+def _clock_overhead(n=10000):
+    """Coût moyen d'une mesure start = clock() ... clock() - start [s]"""
+    clock = time.perf_counter
+    start = clock()
+    for _ in range(n):
+        t0 = clock()
+        clock() - t0
+    return (clock() - start)/n
+
+
+def _profile_rows(profile, top):
+    """Fonctions du profil cProfile, par temps cumulé décroissant"""
+    stats = pstats.Stats(profile, stream=io.StringIO())
+    rows = []
+    for (filename, line, function), (cc, nc, tt, ct, callers) in stats.stats.items():
+        rows.append({'function': '{}:{}({})'.format(filename, line, function),
+                     'calls': nc, 'tottime': tt, 'cumtime': ct})
+    rows.sort(key=lambda row: -row['cumtime'])
+    return rows[:top]
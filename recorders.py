@@ -0,0 +1,222 @@
+# Enregistrement des états (t, s, vs, a) calculés par la boucle de simulation
+#
+# La boucle de Simulator avance par paquets de pas et confie chaque paquet à un
+# enregistreur, qui choisit ce qu'il garde : tout (Recorder), un pas sur k
+# (Decimate), un état par intervalle de temps (Sample), les N derniers états
+# (RingBuffer), tout, mais dans un fichier .npy en mémoire partagée
+# (MemmapRecorder), ou les envoyer au fur et à mesure dans une file, pour un
+# autre fil d'exécution (QueueRecorder, voir playback.py).
+import os
+import queue
+import struct
+
+import numpy as np
+
+# Etat de la bille à un pas de temps
+STATE_DTYPE = np.dtype([
+    ('t', float),   # temps [s]
+    ('s', float),   # distance curviligne [m]
+    ('vs', float),  # vitesse tangentielle [m/s]
+    ('a', float),   # accélération tangentielle [m/s²]
+])
+
+
+class Recorder:
+    """Garde tous les états, en mémoire
+
+    Un enregistreur reçoit les paquets d'états dans l'ordre (write), après
+    que start a donné le nombre maximal d'états, puis finish retourne les
+    états gardés.
+    """
+
+    def start(self, capacity):
+        """Prépare l'enregistrement d'au plus capacity états"""
+        self._chunks = []
+
+    def write(self, states):
+        """Enregistre un paquet d'états consécutifs (tableau de STATE_DTYPE)"""
+        self._chunks.append(states.copy())
+
+    def finish(self):
+        """Termine l'enregistrement
+
+        Returns:
+            array: états gardés (tableau de STATE_DTYPE)
+        """
+        states = np.concatenate(self._chunks) if self._chunks else np.zeros(0, STATE_DTYPE)
+        self._chunks = []
+        return states
+
+
+class Decimate(Recorder):
+    """Garde un état sur k (le premier état est toujours gardé)
+
+    Args:
+        k (int): intervalle entre deux états gardés [pas]
+    """
+
+    def __init__(self, k):
+        self.k = k
+
+    def start(self, capacity):
+        super().start(capacity)
+        self._index = 0  # indice du premier état du prochain paquet
+
+    def write(self, states):
+        first = -self._index % self.k
+        self._chunks.append(states[first::self.k].copy())
+        self._index += len(states)
+
+
+class Sample(Recorder):
+    """Garde le premier état de chaque intervalle de temps [n*interval, (n+1)*interval[
+
+    Args:
+        interval (float): intervalle de temps entre deux états gardés [s]
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+
+    def start(self, capacity):
+        super().start(capacity)
+        self._last = -np.inf  # numéro du dernier intervalle enregistré
+
+    def write(self, states):
+        n = np.floor(states['t']/self.interval)
+        keep = np.empty(len(n), dtype=bool)
+        if len(n):
+            keep[0] = n[0] > self._last
+            keep[1:] = n[1:] > n[:-1]
+            self._last = n[-1]
+        self._chunks.append(states[keep])
+
+
+class RingBuffer(Recorder):
+    """Garde les N derniers états
+
+    Args:
+        size (int): nombre d'états gardés
+    """
+
+    def __init__(self, size):
+        self.size = size
+
+    def start(self, capacity):
+        self._buffer = np.zeros(min(self.size, capacity), STATE_DTYPE)
+        self._count = 0  # nombre total d'états reçus
+
+    def write(self, states):
+        size = len(self._buffer)
+        if size == 0:
+            return
+        states = states[-size:]
+        i = np.arange(self._count, self._count + len(states)) % size
+        self._buffer[i] = states
+        self._count += len(states)
+
+    def finish(self):
+        size = len(self._buffer)
+        if self._count <= size:
+            return self._buffer[:self._count].copy()
+        return np.roll(self._buffer, -(self._count % size))
+
+
+class MemmapRecorder(Recorder):
+    """Ecrit tous les états dans un fichier .npy au fur et à mesure
+
+    Le fichier est créé à la taille maximale (en mémoire partagée, seules les
+    pages écrites occupent le disque) puis tronqué au nombre d'états écrits.
+
+    Args:
+        filename (str): nom du fichier .npy
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def start(self, capacity):
+        self._array = np.lib.format.open_memmap(self.filename, 'w+', STATE_DTYPE, (capacity,))
+        self._offset = self._array.offset
+        self._count = 0
+
+    def write(self, states):
+        self._array[self._count:self._count + len(states)] = states
+        self._count += len(states)
+
+    def finish(self):
+        self._array.flush()
+        del self._array
+        with open(self.filename, 'r+b') as f:
+            f.write(_npy_header(STATE_DTYPE, (self._count,), self._offset))
+            f.truncate(self._offset + self._count*STATE_DTYPE.itemsize)
+        return np.load(self.filename, mmap_mode='r')
+
+
+class QueueRecorder(Decimate):
+    """Envoie un état sur k dans une file, paquet par paquet
+
+    Chaque paquet d'états gardés est mis dans la file dès qu'il est calculé,
+    puis None à la fin. Si la file est pleine, la simulation attend qu'elle
+    se vide ; elle s'interrompt (StopSimulation) si stop est activé entre-temps.
+    Rien n'est gardé : finish retourne un tableau vide.
+
+    Args:
+        states (queue.Queue): file des paquets d'états (tableaux de STATE_DTYPE)
+        k (int): intervalle entre deux états envoyés [pas]
+        stop (threading.Event): interruption demandée par le lecteur de la file
+    """
+
+    def __init__(self, states, k=1, stop=None):
+        super().__init__(k)
+        self.states = states
+        self.stop = stop
+
+    def write(self, states):
+        super().write(states)
+        self._put(self._chunks.pop())
+
+    def finish(self):
+        self._put(None)
+        return np.zeros(0, STATE_DTYPE)
+
+    def _put(self, item):
+        while True:
+            if self.stop is not None and self.stop.is_set():
+                raise StopSimulation()
+            try:
+                self.states.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+
+class StopSimulation(Exception):
+    """Simulation interrompue par le lecteur d'une QueueRecorder"""
+
+
+def _npy_header(dtype, shape, size):
+    """En-tête .npy (version 1.0) complété par des espaces jusqu'à size octets"""
+    header = repr({'descr': np.lib.format.dtype_to_descr(dtype),
+                   'fortran_order': False, 'shape': shape})
+    header = header.ljust(size - 10 - 1) + '\n'
+    return np.lib.format.magic(1, 0) + struct.pack('<H', len(header)) + header.encode('latin1')
+
+
+def get_recorder(recorder):
+    """Retourne un enregistreur à partir de sa description
+
+    Args:
+        recorder: None (tout garder), un entier k (Decimate), un nom de
+            fichier .npy (MemmapRecorder) ou un enregistreur
+
+    Returns:
+        objet: l'enregistreur
+    """
+    if recorder is None:
+        return Recorder()
+    if isinstance(recorder, int):
+        return Decimate(recorder)
+    if isinstance(recorder, (str, os.PathLike)):
+        return MemmapRecorder(recorder)
+    return recorder
@@ -0,0 +1,376 @@
+# Stockage des résultats de simulation : trajectoires sur disque et index des résumés
+#
+#   store = ResultStore('.result_store')
+#   result = store.run(Simulator(path, e=0.0008))   # simulée une seule fois
+#   rows = store.query(e=(0.0005, 0.001), finished=True)
+#
+# Chaque simulation est identifiée par une empreinte du chemin (son contenu,
+# pas le nom du fichier des points) et des paramètres de Simulator. Les
+# trajectoires sont sauvées colonne par colonne (un fichier .npy par grandeur,
+# lu en mémoire partagée) et leur résumé (temps de parcours, vitesse maximale,
+# énergie perdue) dans un index sqlite : une recherche par plage de paramètres
+# ne lit que l'index.
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import time
+
+import numpy as np
+
+from simulator import SimulationResult
+
+# Version du format et du modèle physique, incluse dans les clés : à
+# incrémenter quand un changement de Simulator modifie les résultats, pour que
+# les résultats sauvés auparavant ne soient plus relus
+STORE_VERSION = 1
+
+# Grandeurs de la trajectoire sauvées, une par fichier
+COLUMNS = ('t', 's', 'vs', 'a')
+
+# Ligne de l'index, telle que retournée par ResultStore.query
+INDEX_DTYPE = np.dtype([
+    ('key', 'U40'),          # empreinte de la simulation
+    ('track', 'U40'),        # empreinte du chemin (voir track_key)
+    ('simulator', 'U32'),    # classe du simulateur
+    ('integrator', 'U32'),   # nom du schéma d'intégration
+    ('e', float),            # coefficient de frottement
+    ('r', float),            # rayon de la bille [m]
+    ('m', float),            # masse de la bille [kg]
+    ('b', float),            # écart des rails [m]
+    ('g', float),            # accélération de gravité [m/s²]
+    ('dt', float),           # pas de temps [s]
+    ('tEnd', float),         # durée maximale [s]
+    ('length', float),       # longueur du chemin [m]
+    ('finished', bool),      # vrai si la bille a atteint la fin du chemin
+    ('finish_time', float),  # temps de parcours [s] (nan sinon)
+    ('max_speed', float),    # vitesse tangentielle maximale (en valeur absolue) [m/s]
+    ('energy_loss', float),  # énergie mécanique perdue [J]
+    ('steps', int),          # nombre de pas d'intégration
+    ('records', int),        # nombre d'états sauvés
+])
+
+_SCHEMA = """CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY, track TEXT, simulator TEXT, integrator TEXT,
+    e REAL, r REAL, m REAL, b REAL, g REAL, dt REAL, tEnd REAL, length REAL,
+    finished INTEGER, finish_time REAL, max_speed REAL, energy_loss REAL,
+    steps INTEGER, records INTEGER, n_eval INTEGER, dense INTEGER, events TEXT,
+    created REAL)"""
+_INDEXES = ("CREATE INDEX IF NOT EXISTS results_params ON results (track, e, r, m, b)",)
+
+
+def track_key(path, beta=None):
+    """Empreinte du contenu d'un chemin
+
+    Args:
+        path (tuple): (sPath, XPath, TPath, CPath) tel que retourné par path3d.path()
+        beta (array): inclinaison des rails le long du chemin (BankedSimulator)
+
+    Returns:
+        str: empreinte sha1 (40 caractères hexadécimaux)
+    """
+    h = hashlib.sha1()
+    for array in tuple(path) + (() if beta is None else (beta,)):
+        array = np.ascontiguousarray(array, dtype=float)
+        h.update(repr(array.shape).encode())
+        h.update(array.tobytes())
+    return h.hexdigest()
+
+
+class ResultStore:
+    """Résultats de simulation sauvés sur disque, retrouvés par leurs paramètres
+
+    La clé d'une simulation est une empreinte du chemin (track_key), de la
+    classe du simulateur et de tout ce qui change la trajectoire enregistrée :
+    e, r, m, b, g, dt, tEnd, le schéma d'intégration (et ses réglages), les
+    événements, l'enregistreur et STORE_VERSION. Un même calcul demandé depuis plusieurs
+    carnets ou travaux par lots n'est donc fait qu'une fois.
+
+    Les trajectoires relues sont en lecture seule (fichiers .npy en mémoire
+    partagée) ; E_cin et E_pot sont recalculées au premier accès, comme pour
+    une simulation.
+
+    Args:
+        directory (str): dossier du stockage (créé si besoin)
+
+    Attributes:
+        hits (int): résultats relus
+        misses (int): simulations lancées puis sauvées
+        run_time (float): temps total des simulations lancées [s]
+        load_time (float): temps total de lecture des résultats [s]
+    """
+
+    def __init__(self, directory='.result_store'):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self.run_time = 0.
+        self.load_time = 0.
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as db:
+            db.execute(_SCHEMA)
+            for statement in _INDEXES:
+                db.execute(statement)
+
+    def key(self, simulator):
+        """Empreinte d'une simulation (voir ResultStore)
+
+        Raises:
+            TypeError: si le chemin du simulateur n'est pas échantillonné
+                (TrackSimulator)
+        """
+        if not isinstance(simulator.path, tuple):
+            raise TypeError("Seuls les chemins échantillonnés (path3d.path) sont stockés")
+        description = {
+            'version': STORE_VERSION,
+            'track': track_key(simulator.path, getattr(simulator, 'beta', None)),
+            'simulator': type(simulator).__qualname__,
+            'parameters': [float(getattr(simulator, name)) for name in 'ermbg'],
+            'dt': float(simulator.dt),
+            'tEnd': float(simulator.tEnd),
+            'integrator': _describe(simulator.integrator),
+            'events': _describe(simulator.events),
+            'recorder': _describe(simulator.recorder),
+        }
+        return hashlib.sha1(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+    def run(self, simulator):
+        """Retourne le résultat de la simulation, relu s'il a déjà été sauvé
+
+        Sinon, la simulation est lancée puis sauvée. Les simulations avec
+        sensibilités (voir Simulator) ne sont pas stockées : elles sont
+        toujours lancées.
+
+        Args:
+            simulator (Simulator): simulation à lancer
+
+        Returns:
+            SimulationResult: les résultats de la simulation
+        """
+        if simulator.sensitivities:
+            return simulator.run()
+        key = self.key(simulator)
+        result = self.load(key, simulator.energies)
+        if result is not None:
+            return result
+        start = time.perf_counter()
+        result = simulator.run()
+        self.run_time += time.perf_counter() - start
+        self.misses += 1
+        self.save(key, simulator, result)
+        return result
+
+    def load(self, key, energies=None):
+        """Relit un résultat sauvé
+
+        Args:
+            key (str): empreinte de la simulation (voir key)
+            energies (callable): energies(s, vs) -> (E_cin, E_pot), pour
+                E_cin et E_pot (Simulator.energies)
+
+        Returns:
+            SimulationResult: le résultat, ou None s'il n'est pas stocké
+        """
+        start = time.perf_counter()
+        with self._connect() as db:
+            row = db.execute("SELECT length, finished, steps, n_eval, dense, events "
+                             "FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        length, finished, steps, n_eval, dense, events = row
+        try:
+            columns = self.columns(key)
+        except OSError:
+            return None
+        self.load_time += time.perf_counter() - start
+        self.hits += 1
+        return SimulationResult(columns['t'], columns['s'], columns['vs'], columns['a'],
+                                None, None, length, bool(finished), n_eval=n_eval,
+                                dense=bool(dense), events=[tuple(e) for e in json.loads(events)],
+                                energies=energies, steps=steps)
+
+    def columns(self, key, names=COLUMNS):
+        """Lit quelques grandeurs d'une trajectoire sauvée, sans les autres
+
+        Args:
+            key (str): empreinte de la simulation
+            names (tuple): grandeurs parmi COLUMNS
+
+        Raises:
+            OSError: si la trajectoire n'est pas stockée
+
+        Returns:
+            dict: {nom: array} en lecture seule
+        """
+        directory = self._entry(key)
+        return {name: np.load(os.path.join(directory, name + '.npy'), mmap_mode='r')
+                for name in names}
+
+    def save(self, key, simulator, result):
+        """Sauve la trajectoire et ajoute son résumé à l'index
+
+        La trajectoire est écrite dans un dossier temporaire renommé ensuite,
+        puis la ligne d'index est ajoutée : un résultat présent dans l'index
+        est toujours complet.
+        """
+        directory = self._entry(key)
+        if not os.path.isdir(directory):
+            tmp = '{}.{}.tmp'.format(directory, os.getpid())
+            os.makedirs(tmp, exist_ok=True)
+            for name in COLUMNS:
+                np.save(os.path.join(tmp, name + '.npy'), np.asarray(getattr(result, name)))
+            try:
+                os.replace(tmp, directory)
+            except OSError:
+                shutil.rmtree(tmp, ignore_errors=True)  # sauvé entre-temps par un autre
+        E_tot = result.E_tot
+        integrator = simulator.integrator
+        row = {
+            'key': key,
+            'track': track_key(simulator.path, getattr(simulator, 'beta', None)),
+            'simulator': type(simulator).__qualname__,
+            'integrator': integrator if isinstance(integrator, str) else integrator.name,
+            'e': simulator.e, 'r': simulator.r, 'm': simulator.m, 'b': simulator.b,
+            'g': simulator.g, 'dt': simulator.dt, 'tEnd': simulator.tEnd,
+            'length': float(result.length),
+            'finished': bool(result.finished),
+            'finish_time': float(result.finish_time) if result.finished else None,
+            'max_speed': float(np.max(np.abs(result.vs))) if len(result.vs) else 0.,
+            'energy_loss': float(E_tot[0] - E_tot[-1]) if len(E_tot) else 0.,
+            'steps': int(result.steps),
+            'records': len(result.t),
+            'n_eval': result.n_eval,
+            'dense': bool(result.dense),
+            'events': json.dumps([[name] + [float(x) for x in state]
+                                  for name, *state in result.events]),
+            'created': time.time(),
+        }
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO results ({}) VALUES ({})".format(
+                ', '.join(row), ', '.join('?'*len(row))), tuple(row.values()))
+
+    def query(self, track=None, **conditions):
+        """Recherche des résultats dans l'index, sans lire les trajectoires
+
+        Chaque condition porte sur un champ de INDEX_DTYPE : une valeur
+        (égalité) ou une plage (min, max), bornes comprises, None pour une
+        plage ouverte. Par exemple :
+
+            store.query(path, e=(0.0005, 0.001), r=0.008, finished=True)
+
+        Args:
+            track (tuple ou str): chemin (sPath, XPath, TPath, CPath) ou son
+                empreinte (voir track_key) ; tous les chemins si None
+            **conditions: conditions sur les champs de l'index
+
+        Raises:
+            ValueError: pour un champ inconnu
+
+        Returns:
+            array: lignes trouvées (tableau de INDEX_DTYPE), par paramètres
+                croissants
+        """
+        if track is not None:
+            conditions['track'] = track if isinstance(track, str) else track_key(track)
+        clauses = []
+        values = []
+        for name, condition in conditions.items():
+            if name not in INDEX_DTYPE.names:
+                raise ValueError("Champ de l'index inconnu : {}".format(name))
+            if isinstance(condition, (tuple, list)):
+                low, high = condition
+                if low is not None:
+                    clauses.append('{} >= ?'.format(name))
+                    values.append(low)
+                if high is not None:
+                    clauses.append('{} <= ?'.format(name))
+                    values.append(high)
+            else:
+                clauses.append('{} = ?'.format(name))
+                values.append(condition)
+        sql = 'SELECT {} FROM results'.format(', '.join(INDEX_DTYPE.names))
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        with self._connect() as db:
+            rows = db.execute(sql + ' ORDER BY track, e, r, m, b, g, dt, key', values).fetchall()
+        rows = [tuple(np.nan if x is None else x for x in row) for row in rows]
+        return np.array(rows, dtype=INDEX_DTYPE)
+
+    def stats(self):
+        """Retourne les compteurs du stockage"""
+        return {'hits': self.hits, 'misses': self.misses,
+                'run_time': self.run_time, 'load_time': self.load_time}
+
+    def _entry(self, key):
+        return os.path.join(self.directory, key)
+
+    def _connect(self):
+        # Une connexion par opération : le stockage peut être partagé entre
+        # processus (travaux par lots) et fils d'exécution
+        return _Connection(os.path.join(self.directory, 'index.sqlite'))
+
+
+class _Connection:
+    """Connexion sqlite validée puis fermée en sortie de bloc with"""
+
+    def __init__(self, filename):
+        self.db = sqlite3.connect(filename, timeout=60)
+
+    def __enter__(self):
+        return self.db
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.db.commit()
+        self.db.close()
+        return False
+
+
+def _describe(value):
+    """Description JSON d'un réglage (schéma, événements, enregistreur)
+
+    Les objets sont décrits par leur classe et leurs attributs publics, les
+    fonctions par leur nom et les tableaux par une empreinte de leur contenu.
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (tuple, list)):
+        return [_describe(x) for x in value]
+    if isinstance(value, np.ndarray):
+        return hashlib.sha1(np.ascontiguousarray(value).tobytes()).hexdigest()
+    if callable(value) and hasattr(value, '__qualname__'):
+        return '{}.{}'.format(value.__module__, value.__qualname__)
+    return [type(value).__qualname__,
+            {name: _describe(x) for name, x in sorted(vars(value).items())
+             if not name.startswith('_')}]
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Recherche dans le stockage des résultats.")
+    parser.add_argument('directory', nargs='?', default='.result_store',
+                        help="dossier du stockage")
+    parser.add_argument('--where', nargs='*', default=(), metavar='CHAMP=MIN:MAX',
+                        help="conditions, par exemple e=0.0005:0.001 r=0.008 finished=1")
+    args = parser.parse_args(argv)
+
+    conditions = {}
+    for condition in args.where:
+        name, _, value = condition.partition('=')
+        if ':' in value:
+            conditions[name] = tuple(float(x) if x else None for x in value.split(':'))
+        else:
+            conditions[name] = value if INDEX_DTYPE[name].kind == 'U' else float(value)
+    rows = ResultStore(args.directory).query(**conditions)
+    names = ('key', 'e', 'r', 'm', 'b', 'dt', 'finish_time', 'max_speed', 'energy_loss')
+    print(' '.join('{:>12}'.format(name) for name in names))
+    for row in rows:
+        print(' '.join('{:>12.6g}'.format(row[name]) if name != 'key' else row[name][:12]
+                       for name in names))
+    return 0
+
+
+if __name__ == "__main__":
+    main()
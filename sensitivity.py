@@ -0,0 +1,100 @@
+# Vérification des sensibilités de Simulator (voir Simulator._run_sensitivities)
+# par différences finies centrées
+#
+#   python sensitivity.py
+import numpy as np
+
+from simulator import Simulator
+
+PARAMETERS = ('e', 'r', 'b', 'm')
+
+
+def finite_differences(path, names=PARAMETERS, relative_step=1e-7, **params):
+    """Dérivées de s, vs et du temps de parcours par différences finies centrées
+
+    Chaque paramètre demande deux simulations complètes. Le temps de parcours
+    dérivé est crossing_time des simulations avec sensibilités (même
+    définition que finish_time_gradient).
+
+    Les dérivées de l'accélération interpolée sautent aux points du chemin :
+    quand la perturbation décale un pas de part et d'autre d'un point, les
+    différences finies mêlent les deux pentes, avec une erreur proportionnelle
+    au pas. Sur un parcours complet (des centaines de points franchis), il
+    faut des pas relatifs de 1e-8 à 1e-7 pour retrouver les sensibilités à
+    1e-5 près.
+
+    Args:
+        path (tuple): (sPath, XPath, TPath, CPath) tel que retourné par path3d.path()
+        names (tuple): paramètres parmi 'e', 'r', 'b' et 'm'
+        relative_step (float): pas relatif de chaque paramètre
+        **params: paramètres de Simulator
+
+    Returns:
+        tuple: ({paramètre: (ds/dp, dvs/dp)} sur les pas communs aux deux
+            simulations, {paramètre: dérivée du temps de parcours} si la
+            bille arrive au bout dans les deux simulations)
+    """
+    base = dict({'e': 0.00073, 'r': 0.008, 'b': 0.014, 'm': 0.008}, **params)
+    derivatives = {}
+    gradient = {}
+    for name in names:
+        step = relative_step*base[name]
+        runs = [Simulator(path, sensitivities=(name,),
+                          **dict(base, **{name: base[name] + sign*step})).run()
+                for sign in (1, -1)]
+        n = min(len(run.t) for run in runs)
+        derivatives[name] = ((runs[0].s[:n] - runs[1].s[:n])/(2*step),
+                             (runs[0].vs[:n] - runs[1].vs[:n])/(2*step))
+        if all(run.finished for run in runs):
+            gradient[name] = (runs[0].crossing_time - runs[1].crossing_time)/(2*step)
+    return derivatives, gradient
+
+
+def compare(path, names=PARAMETERS, relative_step=1e-7, **params):
+    """Compare les sensibilités intégrées aux différences finies
+
+    Returns:
+        dict: par paramètre, écarts maximaux relatifs sur ds/dp et dvs/dp
+            (rapportés à leur maximum) et, si la bille arrive au bout, sur la
+            dérivée du temps de parcours
+    """
+    result = Simulator(path, sensitivities=names, **params).run()
+    derivatives, gradient = finite_differences(path, names, relative_step, **params)
+    rows = {}
+    for name in names:
+        ds, dvs = result.sensitivities[name]
+        ds_fd, dvs_fd = derivatives[name]
+        n = len(ds_fd)
+        rows[name] = {'ds': _relative(ds[:n], ds_fd), 'dvs': _relative(dvs[:n], dvs_fd)}
+        if result.finished and name in gradient:
+            rows[name]['finish_time'] = _relative(result.finish_time_gradient[name],
+                                                  gradient[name])
+    return rows
+
+
+def _relative(x, reference):
+    """Ecart maximal relatif au maximum de la référence (absolu si elle est nulle)"""
+    scale = np.max(np.abs(reference))
+    error = np.max(np.abs(np.asarray(x) - reference))
+    return float(error/scale if scale > 0 else error)
+
+
+def test(tolerance=1e-4):
+    """Vérifie les sensibilités sur le circuit réel (jusqu'à l'arrivée) et
+    sur la parabole (3 s d'aller-retour)"""
+    import path3d as p3d
+    import shape
+
+    cases = (
+        (p3d.path(shape.xyz_from_file('datas/xyz_circuit_real.txt'), 400), 1e-8, {}),
+        (p3d.path(shape.parabole_points(0.681*2, 0.412), 200), 1e-7, {'tEnd': 3}),
+    )
+    for path, relative_step, params in cases:
+        rows = compare(path, relative_step=relative_step, **params)
+        for name, row in rows.items():
+            print(name, row)
+            assert max(row.values()) < tolerance, (name, row)
+
+
+if __name__ == "__main__":
+    test()
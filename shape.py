@@ -1,6 +1,8 @@
 # Ce fichier contient plusieurs fonctions pour faire différentes formes de chemin ainsi que de sauvegarder ces points dans un fichier
 import numpy as np
 
+import datafiles
+
 
 def looping_points(steps=21):
     """
@@ -50,20 +52,43 @@ def parabole_points(L, H, steps=12):
     return Xpoints
 
 
-def xyz_from_file(filename):
+def xyz_from_file(filename, cache=True):
     """Renvoie les coordonnés depuis un fichier (en cm)
-    Format du ficher : x y z
+    Format du ficher : x y z (nombres décimaux acceptés)
 
     Args:
         filename (str): nom du fichier
+        cache (bool): utilise le cache binaire de datafiles.load_table
 
     Returns:
-        array_numpy: tableau numpy
+        array_numpy: tableau numpy array[3, N] en mètre
     """
-    data = np.loadtxt(filename, int, unpack=True)
+    data = datafiles.load_table(filename, columns=3, cache=cache).T
     return data/100  # Pour avoir les données en mètre
 
 
+def track_from_file(filename, cache=True):
+    """Renvoie les points de passage et l'inclinaison des rails depuis un fichier
+    Format du fichier : x y z [beta], coordonnées en cm et inclinaison en degrés
+    (> 0 = penche à droite, voir path3d.tilt_vectors), nulle si la colonne manque
+
+    Args:
+        filename (str): nom du fichier
+        cache (bool): utilise le cache binaire de datafiles.load_table
+
+    Raises:
+        ValueError: si le fichier n'a pas 3 ou 4 colonnes
+
+    Returns:
+        tuple: (points array[3, N] en mètre, beta array[N] en radians)
+    """
+    data = datafiles.load_table(filename, cache=cache).T
+    if data.shape[0] not in (3, 4):
+        raise ValueError("{} : {} colonnes au lieu de 3 ou 4".format(filename, data.shape[0]))
+    beta = np.radians(data[3]) if data.shape[0] == 4 else np.zeros(data.shape[1])
+    return data[:3]/100, beta
+
+
 def generate_looping(origin, rayon, ecart):
     """Méthode pour générer des points pour un looping
 
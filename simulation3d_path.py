@@ -2,21 +2,22 @@
 import path3d as p3d
 import numpy as np
 import matplotlib.pyplot as plt
-import physic_model_3d as phys
 import shape
+from path_cache import cached_path
+from playback import Player
+from simulator import Simulator
 
 # Initialisation des variables temporels de la simulation
-t = 0
 tEnd = 20
 dt = 0.0001
-steps = int(tEnd//dt)
 steps_graphic = 400  # Pour le lag de la représentation graphique si dt est trop petit
 
 # Récupération des points de passages
 xyzPoints = shape.xyz_from_file("datas/xyz_circuit_real.txt")
 
 # Utilisation de path3d pour obtenir les points et les vecteurs tangents et de courbure
-sPath, xyzPath, TPath, CPath = p3d.path(xyzPoints, steps_graphic)
+path = cached_path(xyzPoints, steps_graphic)
+sPath, xyzPath, TPath, CPath = path
 
 # Points jalons à afficher sur le graphique
 length = sPath[-1]
@@ -61,60 +62,22 @@ r = 0.008  # Rayon de la bille
 m = 0.008  # Masse de la bille
 b = 0.014  # Ecart des rails
 g = 9.81  # Accélération du à la gravité
-h = np.sqrt(r**2 - (b**2)/4)
 
-# Données à remplir (tableaux numpy vides)
-a_sim = np.zeros(steps+1)
-vs_sim = np.zeros(steps+1)
-t_sim = np.zeros(steps+1)
-s_sim = np.zeros(steps+1)
-
-# Tableaux des énergies
-E_cin_sim = np.zeros(steps+1)
-E_pot_sim = np.zeros(steps+1)
-
-# Valeurs initiales
-a_sim[0] = 0
-vs_sim[0] = 0
-t_sim[0] = 0
-s_sim[0] = 0
-E_cin_sim[0] = phys.cinetic_energy(m, vs_sim[0], phys.inertia(r, h))
-E_pot_sim[0] = phys.potentiel_energy(m, xyzPoints[2][0], g)
-
-# Boucle principale de la simulation
-i = 0
-while i < steps:
-    # Interpolations des vecteurs
-    T = p3d.ainterp(s_sim[i], sPath, TPath)
-    C = p3d.ainterp(s_sim[i], sPath, CPath)
-
-    # Calcul de l'accélération
-    a = phys.acceleration(vs_sim[i], C, T, h, e, r, g)
-
-    # Stockage des valeurs
-    a_sim[i+1] = a
-    vs_sim[i+1] = vs_sim[i] + a*dt
-    t_sim[i+1] = t_sim[i] + dt
-    s_sim[i+1] = s_sim[i] + vs_sim[i+1] * dt
-
-    xyz = p3d.ainterp(s_sim[i+1], sPath, xyzPath)
-    E_cin_sim[i+1] = phys.cinetic_energy(m, vs_sim[i+1], phys.inertia(r, h))
-    E_pot_sim[i+1] = phys.potentiel_energy(m,
-                                           xyz[2], g)
-
-    # Arrêt de la simulation si on est plus loin que la piste
-    if s_sim[i+1] > length:
-        break
-    i += 1
-
-# Suppression des données superflues (si arrêt de la simulation)
-if i != steps:
-    a_sim = np.delete(a_sim, np.s_[i:])
-    vs_sim = np.delete(vs_sim, np.s_[i:])
-    t_sim = np.delete(t_sim, np.s_[i:])
-    s_sim = np.delete(s_sim, np.s_[i:])
-    E_cin_sim = np.delete(E_cin_sim, np.s_[i:])
-    E_pot_sim = np.delete(E_pot_sim, np.s_[i:])
+# Boucle de simulation (voir simulator.py)
+simulator = Simulator(path, r=r, m=m, b=b, e=e, g=g, dt=dt, tEnd=tEnd)
+result = simulator.run()
+
+a_sim = result.a
+vs_sim = result.vs
+t_sim = result.t
+s_sim = result.s
+E_cin_sim = result.E_cin
+E_pot_sim = result.E_pot
+
+# Animation de la bille en temps réel (voir playback.py)
+show_playback = False
+if show_playback:
+    Player(xyzPoints, path, Simulator(path, r=r, m=m, b=b, e=e, g=g, dt=dt, tEnd=tEnd)).show()
 
 # Graphique de la vitesse, l'accélération tangentielle et la distance curviligne
 plt.figure()
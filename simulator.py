@@ -0,0 +1,927 @@
+# Moteur de simulation réutilisable du mouvement de la bille sur un chemin 3D
+import bisect
+import functools
+import math
+import time
+
+import numpy as np
+
+import integrators
+import kernels
+import path3d as p3d
+import physic_model_3d as phys
+import profiling
+import recorders
+import sweep
+
+# Nombre de pas par paquet transmis à l'enregistreur (voir recorders.py)
+CHUNK = 2**16
+
+
+class SimulationResult:
+    """Résultats d'une simulation
+
+    Attributes:
+        t (array): temps [s]
+        s (array): distance curviligne [m]
+        vs (array): vitesse tangentielle [m/s]
+        a (array): accélération tangentielle [m/s²]
+        E_cin (array): énergie cinétique [J], calculée au premier accès
+        E_pot (array): énergie potentielle [J], calculée au premier accès
+        length (float): longueur du chemin [m]
+        finished (bool): vrai si la bille a atteint la fin du chemin
+        n_eval (int): nombre d'évaluations de l'accélération
+        steps (int): nombre de pas d'intégration (len(t) - 1 si tous les
+            états sont enregistrés)
+        dense (bool): vrai si a[i] est l'accélération au point i, ce qui
+            permet une sortie dense d'ordre 3 (sinon a[i] est l'accélération
+            du pas qui mène au point i, comme dans la boucle d'origine)
+        events (list): événements rencontrés (nom, t, s, vs), voir Simulator
+        sensitivities (dict): {paramètre: (ds/dp, dvs/dp)} aux temps t, si
+            demandées (voir Simulator)
+        finish_time_gradient (dict): {paramètre: dérivée de crossing_time},
+            si les sensibilités sont demandées et que la bille est arrivée
+        crossing_time (float): instant où la trajectoire, linéaire entre deux
+            pas, atteint la fin du chemin, si les sensibilités sont demandées
+            et que la bille est arrivée (sinon None)
+
+    Args:
+        energies (callable): energies(s, vs) -> (E_cin, E_pot), utilisée si
+            E_cin et E_pot valent None
+    """
+
+    def __init__(self, t, s, vs, a, E_cin, E_pot, length, finished,
+                 n_eval=None, dense=False, events=(), energies=None, steps=None,
+                 sensitivities=None, finish_time_gradient=None, crossing_time=None):
+        self.t = t
+        self.s = s
+        self.vs = vs
+        self.a = a
+        self._E_cin = E_cin
+        self._E_pot = E_pot
+        self._energies = energies
+        self.length = length
+        self.finished = finished
+        self.n_eval = n_eval
+        self.steps = len(t) - 1 if steps is None else steps
+        self.dense = dense
+        self.events = list(events)
+        self.sensitivities = sensitivities
+        self.finish_time_gradient = finish_time_gradient
+        self.crossing_time = crossing_time
+
+    @property
+    def E_cin(self):
+        if self._E_cin is None:
+            self._E_cin, self._E_pot = self._energies(self.s, self.vs)
+        return self._E_cin
+
+    @property
+    def E_pot(self):
+        if self._E_pot is None:
+            self._E_cin, self._E_pot = self._energies(self.s, self.vs)
+        return self._E_pot
+
+    @property
+    def E_tot(self):
+        """Energie mécanique totale [J]"""
+        return self.E_cin + self.E_pot
+
+    @property
+    def finish_time(self):
+        """Temps de parcours [s] (instant de l'événement 'end' s'il a été
+        localisé, sinon dernier temps enregistré)
+
+        Avec les sensibilités, c'est le même qu'avec run() sans elles ; leur
+        gradient finish_time_gradient est celui de crossing_time, qui en
+        diffère de moins d'un pas (le dernier temps enregistré ne varie pas
+        continûment avec les paramètres).
+        """
+        for name, t, s, vs in self.events:
+            if name == 'end':
+                return t
+        return self.t[-1]
+
+    def resample(self, t):
+        """Rééchantillonne la trajectoire aux temps demandés
+
+        Args:
+            t (array): temps [s]
+
+        Returns:
+            tuple: (s, vs) aux temps t, interpolés par Hermite cubique si la
+                sortie est dense, linéairement sinon
+        """
+        if self.dense:
+            return integrators.hermite(t, self.t, self.s, self.vs, self.a)
+        return np.interp(t, self.t, self.s), np.interp(t, self.t, self.vs)
+
+
+class Simulator:
+    """Simulation du mouvement d'une bille sur un chemin 3D (Euler semi-implicite)
+
+    La boucle travaille sur des flottants Python et des tableaux préalloués :
+    aucun objet numpy n'est créé à chaque pas. L'interpolation reprend exactement
+    la formule de np.interp, les résultats sont donc identiques bit à bit à ceux
+    de la boucle d'origine de simulation3d_path.py.
+
+    Args:
+        path (tuple): (sPath, XPath, TPath, CPath) tel que retourné par path3d.path()
+        r (float): rayon de la bille [m]
+        m (float): masse de la bille [kg]
+        b (float): écart des rails [m]
+        e (float): coefficient de frottement
+        g (float): accélération de gravité [m/s²]
+        dt (float): pas de temps [s]
+        tEnd (float): durée maximale de la simulation [s]
+        integrator (str ou objet): schéma d'intégration (voir integrators.py) ;
+            'euler' sans événements utilise la boucle optimisée d'origine ;
+            'arclength' intègre d'un point du chemin au suivant
+        events (list): événements terminaux à détecter parmi 'end' (fin du
+            chemin), 'stall' (la vitesse s'annule et change de signe) et
+            'lift_off' (la force normale des rails s'annule, voir normal_force)
+            ou des objets integrators.Event ; par défaut 'end' et 'stall' pour
+            les autres schémas qu'euler
+        jit (bool): avec 'euler' sans événements, utilise la boucle compilée
+            de kernels.py si numba est installé
+        recorder: états à garder, voir recorders.get_recorder (tous par défaut)
+        profiler (profiling.Profiler): mesure des temps de la simulation ; par
+            défaut celui du bloc with Profiler() en cours, s'il y en a un
+        sensitivities (tuple): paramètres parmi 'e', 'r', 'b' et 'm' dont on
+            veut les dérivées de s, vs et du temps de parcours, intégrées avec
+            la trajectoire (schéma 'euler' sans événements, voir
+            _run_sensitivities)
+    """
+
+    chunk = CHUNK  # pas par paquet transmis à l'enregistreur (schéma 'euler')
+
+    def __init__(self, path, r=0.008, m=0.008, b=0.014, e=0.00073, g=9.81,
+                 dt=0.0001, tEnd=20, integrator='euler', events=None, jit=True,
+                 recorder=None, profiler=None, sensitivities=None):
+        self.path = path
+        self.r = r
+        self.m = m
+        self.b = b
+        self.e = e
+        self.g = g
+        self.dt = dt
+        self.tEnd = tEnd
+        self.integrator = integrator
+        self.events = events
+        self.jit = jit
+        self.recorder = recorder
+        self.profiler = profiler
+        self.sensitivities = sensitivities
+
+        self._prepare_path()
+        self._h = float(self.h)
+        self._inertia = phys.inertia(self.r, self._h)
+
+    def _prepare_path(self):
+        """Prépare l'interpolation du chemin (length et _segments)"""
+        sPath, XPath, TPath, CPath = self.path
+        self.length = sPath[-1]
+        self._segments = _segments(sPath, np.vstack((TPath, CPath)))
+
+    @property
+    def h(self):
+        """Hauteur du centre de la bille au dessus des rails [m]"""
+        return np.sqrt(self.r**2 - (self.b**2)/4)
+
+    @property
+    def steps(self):
+        """Nombre maximal de pas de la simulation"""
+        return int(self.tEnd//self.dt)
+
+    def run(self):
+        """Lance la simulation depuis le début du chemin, à vitesse nulle
+
+        Avec le schéma 'euler' sans événements, comme dans la boucle d'origine,
+        la simulation s'arrête dès que la bille dépasse la fin du chemin et les
+        deux derniers pas sont écartés. Sinon elle s'arrête au premier événement
+        terminal, localisé dans le pas où il se produit.
+
+        Returns:
+            SimulationResult: les résultats de la simulation
+        """
+        if self.sensitivities:
+            return self._run_sensitivities()
+        if self.integrator != 'euler' or self.events is not None:
+            return self._run_integrator()
+        return self._run_euler(self._compiled_loop() if self.jit else None)
+
+    def _compiled_loop(self):
+        """Boucle d'Euler compilée (voir kernels.py), ou None"""
+        return kernels.compiled_euler_loop()
+
+    def _kernel_args(self):
+        """Arguments de la boucle compilée, avant steps et les tampons"""
+        sPath = np.ascontiguousarray(self.path[0], dtype=float)
+        sBase, table = sweep.segment_table(sPath, np.vstack(self.path[2:4]))
+        return (sPath, sBase, table, float(self.length), float(self.g), float(self.e),
+                self._h, self._inertia, float(self.dt))
+
+    def _run_euler(self, kernel=None):
+        """Simulation d'origine, par la boucle Python ou par kernel (voir kernels.py)
+
+        La boucle avance par paquets de chunk pas, confiés à l'enregistreur.
+        Le dernier état d'un paquet sert d'état initial au suivant et n'est
+        transmis qu'avec lui, pour pouvoir écarter les deux derniers pas.
+        """
+        steps = self.steps
+        chunk = min(self.chunk, steps)
+        if kernel is None:
+            # Tampons d'un paquet (listes : l'écriture d'un flottant y est la moins chère)
+            buffers = [[0.0]*(chunk+1) for _ in range(4)]
+            integrate = self._integrate
+        else:
+            buffers = list(np.zeros((4, chunk+1)))
+            args = self._kernel_args()
+
+            def integrate(a_sim, vs_sim, t_sim, s_sim, steps):
+                return kernel(*args, steps, a_sim, vs_sim, t_sim, s_sim)
+
+        recorder = recorders.get_recorder(self.recorder)
+        write, finish = recorder.write, recorder.finish
+        profiler = self.profiler or profiling.active()
+        if profiler is not None:
+            if kernel is None and profiler.detail and self._integrate.__func__ is Simulator._integrate:
+                integrate = functools.partial(self._integrate_profiled, profiler)
+            integrate = profiler.wrap('simulator.integrate', integrate)
+            write = profiler.wrap('simulator.record', write)
+            finish = profiler.wrap('simulator.record', finish)
+        recorder.start(steps+1)
+        done = 0
+        finished = False
+        while True:
+            n = min(chunk, steps - done)
+            i = integrate(*buffers, n)
+            finished = i != n
+            done += i + 1 if finished else n
+            # Etats transmis : tout le paquet sauf son dernier état, sauf à la
+            # fin (sans les deux derniers pas si la bille est arrivée)
+            last = done == steps and not finished
+            count = i + 1 if last else i
+            states = np.empty(count, recorders.STATE_DTYPE)
+            for name, buffer in zip(('a', 'vs', 't', 's'), buffers):
+                states[name] = buffer[:count]
+                buffer[0] = buffer[n]
+            write(states)
+            if finished or last:
+                break
+        states = finish()
+        done = done if finished else steps
+        if profiler is not None:
+            profiler.count('steps', done)
+            profiler.count('n_eval/euler', done)
+
+        return SimulationResult(states['t'], states['s'], states['vs'], states['a'],
+                                None, None, self.length, finished, n_eval=done,
+                                energies=self.energies, steps=done)
+
+    def _run_sensitivities(self):
+        """Simulation d'origine (Euler semi-implicite) et ses sensibilités
+
+        Les dérivées de (s, vs) par rapport à chaque paramètre p sont
+        propagées par le linéaire tangent du pas d'Euler :
+
+            dvs' = dvs + (a_s*ds + a_vs*dvs + a_p)*dt
+            ds'  = ds + dvs'*dt
+
+        a_s, a_vs et a_p étant les dérivées partielles exactes de
+        l'accélération interpolée (T et C sont linéaires sur chaque segment du
+        chemin) ; p agit à travers h = sqrt(r² - b²/4) et le coefficient
+        d'inertie. Ce sont donc les dérivées exactes de la trajectoire
+        calculée, au coût de 2 à 4 fois la boucle Python seule (de un à quatre
+        paramètres). La masse n'intervient pas dans l'accélération : ses
+        sensibilités sont nulles.
+
+        Le gradient du temps de parcours est celui de crossing_time, l'instant
+        où la trajectoire, linéaire entre deux pas, atteint la fin du chemin.
+        La trajectoire et finish_time sont identiques bit à bit à ceux de run()
+        sans sensibilités ; tous les états sont gardés (l'enregistreur est
+        ignoré).
+        """
+        names = tuple(self.sensitivities)
+        unknown = set(names) - {'e', 'r', 'b', 'm'}
+        if unknown:
+            raise ValueError("Sensibilités inconnues : {}".format(', '.join(sorted(unknown))))
+        if self.integrator != 'euler' or self.events is not None:
+            raise ValueError("Les sensibilités demandent le schéma 'euler' sans événements")
+        if type(self)._integrate is not Simulator._integrate:
+            raise ValueError("Pas de sensibilités pour {}".format(type(self).__name__))
+        segments = self._segments
+        sqrt = math.sqrt
+
+        g = float(self.g)
+        minus_g = -g
+        e = float(self.e)
+        r = float(self.r)
+        b = float(self.b)
+        h = float(self.h)
+        dt = float(self.dt)
+        inertia = phys.inertia(r, h)
+        length = float(self.length)
+        steps = self.steps
+        # Dérivées de h et de l'inertie par rapport à r et b
+        dh = {'r': r/h, 'b': -b/(4*h)}
+        dI_dh = -4/5*r**2/h**3
+        dI = {'r': 4/5*r/h**2 + dI_dh*dh['r'], 'b': dI_dh*dh['b']}
+
+        k = len(names)
+        a_sim, vs_sim, t_sim, s_sim = ([0.]*(steps+1) for _ in range(4))
+        ds_sim = [[0.]*(steps+1) for _ in range(k)]
+        dvs_sim = [[0.]*(steps+1) for _ in range(k)]
+        ds = [0.]*k
+        dvs = [0.]*k
+        a_p = [0.]*k
+        s = vs = t = 0.
+        lo = hi = 0.
+        i = 0
+        finished = False
+        while i < steps:
+            if s < lo or s >= hi:
+                lo, hi, s0, Tx0, Ty0, Tz0, Cx0, Cy0, Cz0, \
+                    dTx, dTy, dTz, dCx, dCy, dCz = _segment_at(segments, s)
+
+            # Accélération (comme _integrate)
+            x = s - s0
+            Tx, Ty, Tz = dTx*x + Tx0, dTy*x + Ty0, dTz*x + Tz0
+            Cx, Cy, Cz = dCx*x + Cx0, dCy*x + Cy0, dCz*x + Cz0
+            gs = -g*Tz
+            sq_spd = vs**2
+            nx = Cx*sq_spd + Tx*gs
+            ny = Cy*sq_spd + Ty*gs
+            nz = Cz*sq_spd - (minus_g - Tz*gs)
+            norm = sqrt(nx**2 + ny**2 + nz**2)
+            a = (gs - e*vs*norm/h)/inertia
+
+            # Dérivées partielles de l'accélération
+            dgs = -g*dTz
+            dnx = dCx*sq_spd + dTx*gs + Tx*dgs
+            dny = dCy*sq_spd + dTy*gs + Ty*dgs
+            dnz = dCz*sq_spd + dTz*gs + Tz*dgs
+            if norm > 0:
+                dnorm_ds = (nx*dnx + ny*dny + nz*dnz)/norm
+                dnorm_dvs = 2*vs*(nx*Cx + ny*Cy + nz*Cz)/norm
+            else:
+                dnorm_ds = dnorm_dvs = 0.
+            a_s = (dgs - e*vs*dnorm_ds/h)/inertia
+            a_vs = -e*(norm + vs*dnorm_dvs)/(h*inertia)
+            a_h = e*vs*norm/(h*h*inertia)  # à inertie constante
+            for j, name in enumerate(names):
+                if name == 'e':
+                    a_p[j] = -vs*norm/(h*inertia)
+                elif name == 'm':
+                    a_p[j] = 0.
+                else:
+                    a_p[j] = a_h*dh[name] - a*dI[name]/inertia
+
+            # Euler semi-implicite et son linéaire tangent
+            vs_new = vs + a*dt
+            s_new = s + vs_new*dt
+            for j in range(k):
+                dvs_new = dvs[j] + (a_s*ds[j] + a_vs*dvs[j] + a_p[j])*dt
+                if s_new > length:
+                    # Temps de parcours t + (length - s)/vs_new et ses dérivées
+                    a_p[j] = -ds[j]/vs_new - (length - s)*dvs_new/vs_new**2
+                dvs[j] = dvs_new
+                ds[j] = ds[j] + dvs_new*dt
+            if s_new > length:
+                finished = True
+                crossing = t + (length - s)/vs_new
+                break
+            vs = vs_new
+            t = t + dt
+            s = s_new
+            i += 1
+            a_sim[i] = a
+            vs_sim[i] = vs
+            t_sim[i] = t
+            s_sim[i] = s
+            for j in range(k):
+                ds_sim[j][i] = ds[j]
+                dvs_sim[j][i] = dvs[j]
+
+        # Comme run() : sans le dernier état avant la sortie du chemin
+        count = i if finished else i + 1
+        result = SimulationResult(
+            np.array(t_sim[:count]), np.array(s_sim[:count]), np.array(vs_sim[:count]),
+            np.array(a_sim[:count]), None, None, self.length, finished,
+            n_eval=i + 1 if finished else i, energies=self.energies,
+            steps=i + 1 if finished else i,
+            sensitivities={name: (np.array(ds_sim[j][:count]), np.array(dvs_sim[j][:count]))
+                           for j, name in enumerate(names)},
+            finish_time_gradient=dict(zip(names, a_p)) if finished else None,
+            crossing_time=crossing if finished else None)
+        return result
+
+    def _run_integrator(self):
+        """Simulation avec un schéma de integrators.py et des événements"""
+        integrator = integrators.get_integrator(self.integrator, self.dt)
+        events = self.events
+        if events is None:
+            events = ('end', 'stall')
+        events = [self._event(name) if isinstance(name, str) else name for name in events]
+        acceleration = self.acceleration
+        profiler = self.profiler or profiling.active()
+        if profiler is not None:
+            acceleration = profiler.wrap('simulator.acceleration', acceleration)
+            events = [integrators.Event(event.name,
+                                        profiler.wrap('event.' + event.name, event.function),
+                                        event.terminal, event.direction) for event in events]
+            start = time.perf_counter()
+        if isinstance(integrator, integrators.ArcLength):
+            *sim, found, n_eval = integrator.integrate(
+                acceleration, self._grid(), 0., 0., self.tEnd, events)
+        else:
+            *sim, found, n_eval = integrators.integrate(
+                acceleration, integrator, 0., 0., self.tEnd, events)
+        if profiler is not None:
+            profiler.add('simulator.integrate', time.perf_counter() - start, 1, start)
+            profiler.count('steps', len(sim[0]) - 1)
+            profiler.count('n_eval/' + integrator.name, n_eval)
+            start = time.perf_counter()
+        states = np.empty(len(sim[0]), recorders.STATE_DTYPE)
+        for name, x in zip(('t', 's', 'vs', 'a'), sim):
+            states[name] = x
+        recorder = recorders.get_recorder(self.recorder)
+        recorder.start(len(states))
+        recorder.write(states)
+        states = recorder.finish()
+        if profiler is not None:
+            profiler.add('simulator.record', time.perf_counter() - start, 1, start)
+        finished = any(name == 'end' for name, *state in found)
+        return SimulationResult(states['t'], states['s'], states['vs'], states['a'],
+                                None, None, self.length, finished, n_eval=n_eval,
+                                dense=True, events=found, energies=self.energies,
+                                steps=len(sim[0]) - 1)
+
+    def _grid(self):
+        """Points de la grille du schéma 'arclength' : ceux du chemin"""
+        return self.path[0]
+
+    def _event(self, name):
+        """Retourne l'événement terminal de nom donné (voir Simulator)"""
+        if name == 'end':
+            length = self.length
+            return integrators.Event('end', lambda s, vs: s - length, direction=1)
+        if name == 'stall':
+            return integrators.Event('stall', lambda s, vs: vs, direction=-1)
+        if name == 'lift_off':
+            return integrators.Event('lift_off', self.normal_force, direction=-1)
+        raise ValueError("Evénement inconnu : {}".format(name))
+
+    def acceleration(self, s, vs):
+        """Accélération tangentielle de la bille en un point du chemin
+
+        Args:
+            s (float): distance curviligne [m]
+            vs (float): vitesse tangentielle [m/s]
+
+        Returns:
+            float: accélération tangentielle [m/s²]
+        """
+        lo, hi, s0, Tx0, Ty0, Tz0, Cx0, Cy0, Cz0, \
+            dTx, dTy, dTz, dCx, dCy, dCz = _segment_at(self._segments, s)
+        x = s - s0
+        Tz = dTz*x + Tz0
+        g = self.g
+        gs = -g*Tz
+        sq_spd = vs**2
+        nx = (dCx*x + Cx0)*sq_spd + (dTx*x + Tx0)*gs
+        ny = (dCy*x + Cy0)*sq_spd + (dTy*x + Ty0)*gs
+        nz = (dCz*x + Cz0)*sq_spd - (-g - Tz*gs)
+        return (gs - self.e*vs*math.sqrt(nx**2 + ny**2 + nz**2)/self._h)/self._inertia
+
+    def normal_force(self, s, vs):
+        """Force normale spécifique des rails sur la bille
+
+        C'est la composante du vecteur C*vs² - gn (voir
+        physic_model_3d.norm_vector_rn) selon la normale U des rails, du côté
+        où ils peuvent pousser la bille (path3d.rail_normals : vers z > 0 en
+        général, vers le centre de la boucle dans un looping). La bille quitte
+        les rails quand elle devient négative. Comme T.U = 0, elle vaut
+        (C.U)*vs² + g*Uz ; C.U et Uz sont interpolés entre les points du chemin.
+
+        Args:
+            s (float): distance curviligne [m]
+            vs (float): vitesse tangentielle [m/s]
+
+        Returns:
+            float: force normale par unité de masse [m/s²]
+        """
+        lo, hi, s0, cU0, Uz0, dcU, dUz = _segment_at(self._rail, s)
+        x = s - s0
+        return (dcU*x + cU0)*vs**2 + self.g*(dUz*x + Uz0)
+
+    @functools.cached_property
+    def _rail(self):
+        """Segments de C.U et Uz, U normale des rails (pour normal_force)"""
+        sPath, XPath, TPath, CPath = self.path
+        UPath = p3d.rail_normals(TPath)
+        return _segments(sPath, np.vstack((np.sum(CPath*UPath, axis=0), UPath[2])))
+
+    def energies(self, s, vs):
+        """Calcule les énergies cinétique et potentielle le long d'une trajectoire
+
+        Args:
+            s (array): distance curviligne [m]
+            vs (array): vitesse tangentielle [m/s]
+
+        Returns:
+            tuple: (E_cin, E_pot) en J
+        """
+        sPath, XPath = self.path[0], self.path[1]
+        E_cin = phys.cinetic_energy(self.m, vs, phys.inertia(self.r, self.h))
+        E_pot = phys.potentiel_energy(self.m, np.interp(s, sPath, XPath[2]), self.g)
+        return E_cin, E_pot
+
+    def _integrate(self, a_sim, vs_sim, t_sim, s_sim, steps):
+        """Boucle principale : avance d'au plus steps pas depuis l'état d'indice 0,
+        remplit les tampons et retourne l'indice d'arrêt"""
+        segments = self._segments
+        sqrt = math.sqrt
+
+        g = float(self.g)
+        minus_g = -g
+        e = float(self.e)
+        h = float(self.h)
+        dt = float(self.dt)
+        inertia = phys.inertia(float(self.r), h)
+        length = float(self.length)
+
+        s = s_sim[0]
+        vs = vs_sim[0]
+        t = t_sim[0]
+        lo = hi = 0.
+        i = 0
+        while i < steps:
+            # Changement de segment d'interpolation (rare : ds << écart des points)
+            if s < lo or s >= hi:
+                lo, hi, s0, Tx0, Ty0, Tz0, Cx0, Cy0, Cz0, \
+                    dTx, dTy, dTz, dCx, dCy, dCz = _segment_at(segments, s)
+
+            # Interpolation de T et C (même formule que np.interp)
+            x = s - s0
+            Tz = dTz*x + Tz0
+
+            # Accélération (physic_model_3d.acceleration développée ;
+            # v - (0 - u) devient v + u, identique une fois mis au carré)
+            gs = -g*Tz
+            sq_spd = vs**2
+            nx = (dCx*x + Cx0)*sq_spd + (dTx*x + Tx0)*gs
+            ny = (dCy*x + Cy0)*sq_spd + (dTy*x + Ty0)*gs
+            nz = (dCz*x + Cz0)*sq_spd - (minus_g - Tz*gs)
+            a = (gs - e*vs*sqrt(nx**2 + ny**2 + nz**2)/h)/inertia
+
+            # Euler semi-implicite
+            vs = vs + a*dt
+            t = t + dt
+            s = s + vs*dt
+            i += 1
+            a_sim[i] = a
+            vs_sim[i] = vs
+            t_sim[i] = t
+            s_sim[i] = s
+
+            # Arrêt de la simulation si on est plus loin que la piste
+            if s > length:
+                return i - 1
+        return i
+
+    def _integrate_profiled(self, profiler, a_sim, vs_sim, t_sim, s_sim, steps):
+        """Boucle principale identique à _integrate, chronométrée phase par phase
+        (voir profiling.Profiler)"""
+        segments = self._segments
+        sqrt = math.sqrt
+        clock = time.perf_counter
+
+        g = float(self.g)
+        minus_g = -g
+        e = float(self.e)
+        h = float(self.h)
+        dt = float(self.dt)
+        inertia = phys.inertia(float(self.r), h)
+        length = float(self.length)
+
+        t_lookup = t_interp = t_accel = t_step = 0.
+        lookups = 0
+        s = s_sim[0]
+        vs = vs_sim[0]
+        t = t_sim[0]
+        lo = hi = 0.
+        i = 0
+        stop = None
+        while i < steps:
+            t0 = clock()
+            if s < lo or s >= hi:
+                lo, hi, s0, Tx0, Ty0, Tz0, Cx0, Cy0, Cz0, \
+                    dTx, dTy, dTz, dCx, dCy, dCz = _segment_at(segments, s)
+                lookups += 1
+                t1 = clock()
+                t_lookup += t1 - t0
+                t0 = t1
+
+            x = s - s0
+            Tz = dTz*x + Tz0
+            Tx = dTx*x + Tx0
+            Ty = dTy*x + Ty0
+            Cx = dCx*x + Cx0
+            Cy = dCy*x + Cy0
+            Cz = dCz*x + Cz0
+            t1 = clock()
+            t_interp += t1 - t0
+
+            gs = -g*Tz
+            sq_spd = vs**2
+            nx = Cx*sq_spd + Tx*gs
+            ny = Cy*sq_spd + Ty*gs
+            nz = Cz*sq_spd - (minus_g - Tz*gs)
+            a = (gs - e*vs*sqrt(nx**2 + ny**2 + nz**2)/h)/inertia
+            t2 = clock()
+            t_accel += t2 - t1
+
+            vs = vs + a*dt
+            t = t + dt
+            s = s + vs*dt
+            i += 1
+            a_sim[i] = a
+            vs_sim[i] = vs
+            t_sim[i] = t
+            s_sim[i] = s
+            stop = s > length
+            t_step += clock() - t2
+            if stop:
+                break
+
+        profiler.add('loop.lookup', t_lookup, lookups)
+        profiler.add('loop.interpolation', t_interp, i)
+        profiler.add('loop.acceleration', t_accel, i)
+        profiler.add('loop.step', t_step, i)
+        profiler.count('loop.segment_changes', lookups)
+        return i - 1 if stop else i
+
+
+class BankedSimulator(Simulator):
+    """Simulation sur des rails inclinés d'un angle beta autour de T
+
+    Le repère des rails (B parallèle à l'inclinaison, N perpendiculaire, voir
+    path3d.tilt_vectors) est calculé une fois aux points du chemin. La force
+    C*vs² - gn des rails sur la bille y a pour composantes
+    rn_N = (C.N)*vs² + g*Nz et rn_B = (C.B)*vs² + g*Bz : seuls C.N, C.B, Nz et
+    Bz sont interpolés pour la calculer.
+
+    Chaque rail touche la bille selon une direction inclinée de alpha par
+    rapport à N (sin(alpha) = b/(2r)) : l'inclinaison répartit la force entre
+    les deux rails (rail_forces) et la bille déraille quand la réaction d'un
+    rail s'annule (événement 'derail'). Le frottement reste celui de
+    Simulator, proportionnel à |C*vs² - gn| = sqrt(rn_N² + rn_B²), qui ne
+    dépend pas de l'inclinaison : le mouvement est donc exactement celui de
+    Simulator (même boucle, compilée si jit est vrai), quel que soit beta.
+
+    Args:
+        path (tuple): (sPath, XPath, TPath, CPath) tel que retourné par path3d.path()
+        beta (float ou array): inclinaison des rails aux points du chemin
+            (voir path3d.path_tilt) [rad]
+        **params: paramètres de Simulator ; l'événement 'derail' (une des
+            réactions des rails s'annule) s'ajoute à ceux de Simulator
+    """
+
+    def __init__(self, path, beta=0., **params):
+        super().__init__(path, **params)
+        sPath, XPath, TPath, CPath = path
+        self.beta = np.broadcast_to(np.asarray(beta, dtype=float), sPath.shape)
+        BPath, NPath = p3d.tilt_vectors(np.array(TPath, dtype=float), self.beta)
+        frame = np.vstack((np.sum(CPath*NPath, axis=0), np.sum(CPath*BPath, axis=0),
+                           NPath[2], BPath[2]))
+        self._frame = _segments(sPath, frame)
+
+    def rail_forces(self, s, vs):
+        """Composantes de la force des rails dans leur repère incliné
+
+        Args:
+            s (float): distance curviligne [m]
+            vs (float): vitesse tangentielle [m/s]
+
+        Returns:
+            tuple: (rn_N, rn_B, R_gauche, R_droite) par unité de masse [m/s²],
+                R étant la réaction de chaque rail (négative si la bille
+                s'en écarte)
+        """
+        lo, hi, s0, cN0, cB0, Nz0, Bz0, dcN, dcB, dNz, dBz = _segment_at(self._frame, s)
+        x = s - s0
+        g = self.g
+        sq_spd = vs**2
+        rn_N = (dcN*x + cN0)*sq_spd + g*(dNz*x + Nz0)
+        rn_B = (dcB*x + cB0)*sq_spd + g*(dBz*x + Bz0)
+        radial = rn_N*self.r/self._h  # rn_N/cos(alpha)
+        lateral = rn_B*2*self.r/self.b  # rn_B/sin(alpha)
+        return rn_N, rn_B, (radial - lateral)/2, (radial + lateral)/2
+
+    def normal_force(self, s, vs):
+        """Force spécifique des rails selon leur normale inclinée N [m/s²]"""
+        return self.rail_forces(s, vs)[0]
+
+    def _event(self, name):
+        if name == 'derail':
+            return integrators.Event('derail', lambda s, vs: min(self.rail_forces(s, vs)[2:]),
+                                     direction=-1)
+        return super()._event(name)
+
+
+class TrackSimulator(Simulator):
+    """Simulation sur un circuit analytique (voir tracks.py), sans interpolation
+
+    T et C sont calculés exactement à chaque évaluation de l'accélération
+    (même formule que Simulator.acceleration), au point u(s) tiré de la table
+    du circuit (tracks.Track.parameter). La boucle d'Euler est celle de
+    Simulator, hors recherche de segment ; sur un circuit polynomial
+    (ParabolaTrack, LoopingTrack), elle est compilée par numba si jit est vrai
+    (kernels.track_euler_loop). Mesuré sur LoopingTrack (20 000 pas) : ~6 ms
+    compilée, moins de deux fois la boucle compilée de Simulator ; ~0.2 s en
+    Python, quatre à cinq fois la boucle Python de Simulator (les dérivées de
+    la courbe coûtent plus qu'une interpolation).
+
+    Args:
+        track (tracks.Track): circuit
+        **params: paramètres de Simulator
+    """
+
+    def _prepare_path(self):
+        self.track = self.path
+        self.length = self.track.length
+
+    def _grid(self):
+        return np.linspace(0., self.length, 401)
+
+    def _compiled_loop(self):
+        if self.track.coefficients is None:
+            return None
+        return kernels.compiled_track_loop()
+
+    def _kernel_args(self):
+        track = self.track
+        return (np.ascontiguousarray(track.coefficients, dtype=float),
+                np.array(track._s), np.array(track._u), np.array(track._du),
+                float(self.length), float(self.g), float(self.e), self._h, self._inertia,
+                float(self.dt))
+
+    def acceleration(self, s, vs):
+        X, (Tx, Ty, Tz), (Cx, Cy, Cz) = self.track.frame(s)
+        g = self.g
+        gs = -g*Tz
+        sq_spd = vs**2
+        nx = Cx*sq_spd + Tx*gs
+        ny = Cy*sq_spd + Ty*gs
+        nz = Cz*sq_spd - (-g - Tz*gs)
+        return (gs - self.e*vs*math.sqrt(nx**2 + ny**2 + nz**2)/self._h)/self._inertia
+
+    def normal_force(self, s, vs):
+        # U interpolée entre les points de la grille, puis rendue
+        # perpendiculaire au vecteur T exact
+        X, T, C = self.track.frame(s)
+        sGrid, UGrid = self._rail
+        U = np.array([np.interp(s, sGrid, u) for u in UGrid])
+        U -= np.dot(U, T)*np.asarray(T)
+        U /= math.sqrt(np.dot(U, U))
+        return float(np.dot(C, U)*vs**2 + self.g*U[2])
+
+    @functools.cached_property
+    def _rail(self):
+        """Normale des rails aux points de la grille (voir Simulator.normal_force)"""
+        sGrid = self._grid()
+        return sGrid, p3d.rail_normals(self.track.at(sGrid)[1])
+
+    def energies(self, s, vs):
+        E_cin = phys.cinetic_energy(self.m, vs, self._inertia)
+        E_pot = phys.potentiel_energy(self.m, self.track.at(s)[0][2], self.g)
+        return E_cin, E_pot
+
+    def _integrate(self, a_sim, vs_sim, t_sim, s_sim, steps):
+        frame = self.track.frame
+        sqrt = math.sqrt
+        g = float(self.g)
+        minus_g = -g
+        e = float(self.e)
+        h = self._h
+        dt = float(self.dt)
+        inertia = self._inertia
+        length = float(self.length)
+
+        s = s_sim[0]
+        vs = vs_sim[0]
+        t = t_sim[0]
+        i = 0
+        while i < steps:
+            X, (Tx, Ty, Tz), (Cx, Cy, Cz) = frame(s)
+            gs = -g*Tz
+            sq_spd = vs**2
+            nx = Cx*sq_spd + Tx*gs
+            ny = Cy*sq_spd + Ty*gs
+            nz = Cz*sq_spd - (minus_g - Tz*gs)
+            a = (gs - e*vs*sqrt(nx**2 + ny**2 + nz**2)/h)/inertia
+
+            vs = vs + a*dt
+            t = t + dt
+            s = s + vs*dt
+            i += 1
+            a_sim[i] = a
+            vs_sim[i] = vs
+            t_sim[i] = t
+            s_sim[i] = s
+
+            if s > length:
+                return i - 1
+        return i
+
+
+def compare_integrators(path, schemes, reference=None, samples=1000, **params):
+    """Compare des schémas d'intégration au schéma 'euler' de référence historique
+
+    Chaque trajectoire est rééchantillonnée sur une grille de temps commune et
+    comparée à une solution de référence très précise.
+
+    Args:
+        path (tuple): (sPath, XPath, TPath, CPath) tel que retourné par path3d.path()
+        schemes (list): schémas à comparer (noms ou objets de integrators.py)
+        reference (objet): schéma de référence, par défaut RK45 à rtol=1e-11
+        samples (int): nombre de temps de comparaison
+        **params: paramètres physiques et dt/tEnd transmis à Simulator
+
+    Returns:
+        list: un dictionnaire par schéma ('euler' en premier) avec le nombre
+            d'évaluations, le rapport aux évaluations d'euler et l'erreur
+            maximale sur s et vs
+    """
+    if reference is None:
+        reference = integrators.RK45(rtol=1e-11, atol=1e-13)
+    params.pop('integrator', None)
+    exact = Simulator(path, integrator=reference, **params).run()
+    euler = Simulator(path, **params).run()
+    t = np.linspace(0, min(exact.t[-1], euler.t[-1]), samples)
+    s_ref, vs_ref = exact.resample(t)
+
+    rows = []
+    for scheme in ['euler'] + list(schemes):
+        result = euler if scheme == 'euler' else Simulator(path, integrator=scheme, **params).run()
+        s, vs = result.resample(t)
+        rows.append({
+            'integrator': scheme if isinstance(scheme, str) else scheme.name,
+            'n_eval': result.n_eval,
+            'eval_ratio': euler.n_eval/result.n_eval,
+            'error_s': np.max(np.abs(s - s_ref)),
+            'error_vs': np.max(np.abs(vs - vs_ref)),
+        })
+    return rows
+
+
+def _segments(sPath, fPath):
+    """Prépare les segments d'interpolation linéaire d'un chemin
+
+    Args:
+        sPath (array): distance curviligne des N points du chemin
+        fPath (array): valeurs des K fonctions aux points du chemin, array[K, N]
+
+    Returns:
+        tuple: (sList, segments) où segments[j] = (début, fin, s_j, f_j..., pentes_j...)
+            en flottants Python. Les deux segments extrêmes, constants, prolongent
+            le chemin comme le fait np.interp.
+    """
+    sList = [float(s) for s in sPath]
+    slopes = np.diff(fPath, axis=1)/np.diff(sPath)
+    zeros = (0.,)*fPath.shape[0]
+    segments = [(-math.inf, sList[0], sList[0]) + tuple(fPath[:, 0].tolist()) + zeros]
+    for j in range(len(sList)-1):
+        segments.append((sList[j], sList[j+1], sList[j]) + tuple(fPath[:, j].tolist())
+                        + tuple(slopes[:, j].tolist()))
+    segments.append((sList[-1], math.inf, sList[-1]) + tuple(fPath[:, -1].tolist()) + zeros)
+    return sList, segments
+
+
+def _segment_at(segments, s):
+    """Retourne le segment d'interpolation contenant s (voir _segments)"""
+    sList, segments = segments
+    return segments[bisect.bisect_right(sList, s)]
+
+
+def test():
+    """Vérifie que les événements ne se déclenchent pas à tort sur le circuit réel"""
+    import shape
+
+    path = p3d.path(shape.xyz_from_file('datas/xyz_circuit_real.txt'), 400)
+    reference = Simulator(path).run()
+    result = Simulator(path, integrator='rk45', events=('end', 'stall', 'lift_off')).run()
+    # La bille passe le looping (s ≈ 0.9 m) sans quitter les rails
+    assert [event[0] for event in result.events] == ['end'], result.events
+    assert abs(result.finish_time - reference.finish_time) < 1e-2
+    print('lift_off', result.events)
+
+    # Rails non inclinés : même mouvement que Simulator, au bit près
+    banked = BankedSimulator(path, beta=0.).run()
+    assert np.array_equal(banked.s, reference.s) and np.array_equal(banked.vs, reference.vs)
+    print('beta = 0', banked.finish_time, reference.finish_time)
+
+
+if __name__ == "__main__":
+    test()
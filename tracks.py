@@ -0,0 +1,304 @@
+# Circuits de forme analytique : géométrie exacte, sans interpolation de T et C
+#
+# Un circuit analytique est une courbe X(u) connue par ses dérivées. La
+# distance curviligne s(u) est calculée exactement (parabole) ou par
+# quadrature de Gauss-Legendre (polynôme), une fois pour toutes en nodes
+# points ; u(s) en est l'interpolation d'Hermite cubique (pentes du/ds = 1/|dX/du|
+# exactes aux noeuds), à ~1e-12 près en u. T et C viennent des dérivées exactes
+# de la courbe.
+#
+# TrackSimulator (simulator.py) simule la bille sur un tel circuit ; as_path
+# et path_error servent de référence pour les chemins échantillonnés.
+import bisect
+import math
+
+import numpy as np
+
+
+def _gauss(n):
+    """Points et poids de Gauss-Legendre à n points sur [0, 1]"""
+    x, w = np.polynomial.legendre.leggauss(n)
+    return list(zip(((x + 1)/2).tolist(), (w/2).tolist()))
+
+
+_GAUSS_8 = _gauss(8)
+_GAUSS_3 = _gauss(3)  # pour les très petits intervalles (pas de simulation)
+
+
+class Track:
+    """Courbe X(u), u0 ≤ u ≤ u1, parcourue par la bille
+
+    Les classes dérivées donnent derivatives et, si elle est connue, la
+    primitive de la vitesse |dX/du| (integral). Les courbes polynomiales
+    donnent aussi leurs coefficients, pour la boucle compilée de TrackSimulator
+    (kernels.track_euler_loop).
+
+    Args:
+        u0, u1 (float): bornes du paramètre
+        nodes (int): nombre d'intervalles de la table de s(u) (voir parameter)
+
+    Attributes:
+        u0, u1 (float): bornes du paramètre
+        length (float): longueur du circuit [m]
+        coefficients (array): polynômes de la courbe, array[3, degré+1] (voir
+            PolynomialTrack), None si elle n'est pas polynomiale
+    """
+
+    coefficients = None
+
+    def __init__(self, u0, u1, nodes=4096):
+        self.u0 = u0
+        self.u1 = u1
+        self.length = self.integral(u0, u1)
+        # Table de s(u) et de du/ds = 1/|dX/du| à pas constant en u, en listes
+        # de flottants Python (lues élément par élément à chaque pas)
+        u = np.linspace(u0, u1, nodes + 1).tolist()
+        s = [0.]
+        for a, b in zip(u[:-1], u[1:]):
+            s.append(s[-1] + self.integral(a, b))
+        self._u = u
+        self._s = s
+        self._du = [1/self.speed(x) for x in u]
+        self._k = 0  # dernier intervalle utilisé
+
+    def derivatives(self, u):
+        """Point et dérivées de la courbe
+
+        Returns:
+            tuple: (X, dX/du, d²X/du²), chacun un tuple de 3 flottants
+        """
+        raise NotImplementedError
+
+    def speed(self, u):
+        """|dX/du|"""
+        dx, dy, dz = self.derivatives(u)[1]
+        return math.sqrt(dx*dx + dy*dy + dz*dz)
+
+    def integral(self, a, b):
+        """Longueur de la courbe entre les paramètres a et b [m]
+
+        Quadrature de Gauss-Legendre à 8 points sur des intervalles d'au plus
+        (u1 - u0)/32, à 3 points sous (u1 - u0)/1000. Pour ces courbes lisses,
+        l'erreur relative est celle des arrondis, ~1e-15 (vérifié par test()
+        sur la parabole, dont la longueur est connue exactement).
+        """
+        span = abs(b - a)/(self.u1 - self.u0)
+        rule = _GAUSS_3 if span < 1e-3 else _GAUSS_8
+        n = max(1, math.ceil(32*span))
+        h = (b - a)/n
+        speed = self.speed
+        total = 0.
+        for k in range(n):
+            start = a + k*h
+            for x, w in rule:
+                total += w*speed(start + x*h)
+        return total*h
+
+    def arc_length(self, u):
+        """Distance curviligne du point de paramètre u [m]"""
+        return self.integral(self.u0, u)
+
+    def parameter(self, s):
+        """Paramètre u du point à la distance curviligne s
+
+        Interpolation d'Hermite cubique de la table de s(u), avec les pentes
+        exactes du/ds aux noeuds : l'erreur est en h⁴ (~1e-12 en u avec 4096
+        intervalles, vérifié par test()). L'intervalle du dernier appel est
+        essayé en premier : le long d'une simulation, il n'y a presque jamais
+        de recherche. En dehors du circuit, u est limité à [u0, u1] (le
+        circuit est prolongé par ses extrémités, comme np.interp le fait des
+        chemins échantillonnés).
+        """
+        if s <= 0.:
+            return self.u0
+        if s >= self.length:
+            return self.u1
+        table = self._s
+        k = self._k
+        if not table[k] <= s < table[k + 1]:
+            k = min(bisect.bisect_right(table, s) - 1, len(table) - 2)
+            self._k = k
+        h = table[k + 1] - table[k]
+        q = (s - table[k])/h
+        r = 1. - q
+        return ((1. + 2.*q)*r*r*self._u[k] + q*r*r*h*self._du[k]
+                + q*q*(3. - 2.*q)*self._u[k + 1] - q*q*r*h*self._du[k + 1])
+
+    def frame(self, s):
+        """Point, vecteur tangent et vecteur de courbure exacts en s
+
+        Returns:
+            tuple: (X, T, C), chacun un tuple de 3 flottants
+        """
+        (x, y, z), (dx, dy, dz), (ddx, ddy, ddz) = self.derivatives(self.parameter(s))
+        speed = math.sqrt(dx*dx + dy*dy + dz*dz)
+        tx, ty, tz = dx/speed, dy/speed, dz/speed
+        dot = ddx*tx + ddy*ty + ddz*tz
+        sq = speed*speed
+        return ((x, y, z), (tx, ty, tz),
+                ((ddx - dot*tx)/sq, (ddy - dot*ty)/sq, (ddz - dot*tz)/sq))
+
+    def at(self, s):
+        """Comme frame, pour plusieurs points
+
+        Args:
+            s (array): distances curvilignes des M points
+
+        Returns:
+            tuple: (X, T, C), chacun array[3, M]
+        """
+        frames = np.array([self.frame(x) for x in np.ravel(s)]).reshape(-1, 9)
+        return frames[:, 0:3].T, frames[:, 3:6].T, frames[:, 6:9].T
+
+    def as_path(self, steps=1000):
+        """Echantillonne le circuit à distance curviligne constante
+
+        Returns:
+            tuple: (sPath, XPath, TPath, CPath), comme path3d.path() mais exacts
+        """
+        sPath = np.linspace(0., self.length, steps)
+        return (sPath,) + self.at(sPath)
+
+    def path_error(self, path):
+        """Ecarts d'un chemin échantillonné au circuit exact
+
+        Chaque point du chemin est comparé au point du circuit de même
+        distance curviligne.
+
+        Args:
+            path (tuple): (sPath, XPath, TPath, CPath), par exemple
+                path3d.path() des points de passage de ce circuit
+
+        Returns:
+            dict: écart maximal sur la longueur totale ('length') et sur X,
+                T et C aux points du chemin
+        """
+        sPath, XPath, TPath, CPath = path
+        X, T, C = self.at(sPath)
+        return {'length': abs(sPath[-1] - self.length),
+                'X': float(np.max(np.abs(XPath - X))),
+                'T': float(np.max(np.abs(TPath - T))),
+                'C': float(np.max(np.abs(CPath - C)))}
+
+
+class ParabolaTrack(Track):
+    """Parabole z = A*x², y = slant*x, pour -L/2 ≤ x ≤ L/2 (paramètre u = x)
+
+    Avec slant = 0.2, c'est la courbe de shape.parabole_points ; avec
+    slant = 0, celle de 2D/simulation_parabole.py. La distance curviligne a
+    une expression exacte.
+
+    Args:
+        L (float): longueur horizontale [m]
+        H (float): hauteur [m]
+        slant (float): pente du plan de la parabole, y = slant*x
+    """
+
+    def __init__(self, L=0.681*2, H=0.412, slant=0.2):
+        self.L = L
+        self.H = H
+        self.slant = slant
+        self.A = 4*H/L**2
+        self.coefficients = np.array([[0., 1., 0.], [0., slant, 0.], [self.A, 0., 0.]])
+        self._a2 = 1 + slant**2
+        self._b = 2*self.A
+        super().__init__(-L/2, L/2)
+
+    def derivatives(self, u):
+        A, k = self.A, self.slant
+        return (u, k*u, A*u*u), (1., k, 2*A*u), (0., 0., 2*A)
+
+    def speed(self, u):
+        b = self._b*u
+        return math.sqrt(self._a2 + b*b)
+
+    def integral(self, a, b):
+        return self._primitive(b) - self._primitive(a)
+
+    def _primitive(self, u):
+        # Primitive de sqrt(a² + b²u²) : (u*sqrt(a² + b²u²) + a²/b*asinh(b*u/a))/2
+        a2, b = self._a2, self._b
+        return (u*math.sqrt(a2 + b*b*u*u) + a2/b*math.asinh(b*u/math.sqrt(a2)))/2
+
+
+class PolynomialTrack(Track):
+    """Courbe polynomiale X(u) = (Px(u), Py(u), Pz(u)), u0 ≤ u ≤ u1
+
+    Args:
+        coefficients (array): coefficients des trois polynômes, du plus haut
+            degré au terme constant (comme np.polyval), array[3, degré+1]
+        u0, u1 (float): bornes du paramètre
+    """
+
+    def __init__(self, coefficients, u0, u1):
+        c = np.asarray(coefficients, dtype=float)
+        self.coefficients = c
+        d1 = np.array([np.polyder(p) for p in c])
+        d2 = np.array([np.polyder(p, 2) for p in c])
+        self._polynomials = [p.tolist() for p in (c, d1, d2)]
+        super().__init__(u0, u1)
+
+    def derivatives(self, u):
+        # Schéma de Horner étendu : P, P' et P''/2 en une passe par polynôme
+        px, py, pz = [self._horner2(p, u) for p in self._polynomials[0]]
+        return (px[0], py[0], pz[0]), (px[1], py[1], pz[1]), (px[2], py[2], pz[2])
+
+    @staticmethod
+    def _horner2(p, u):
+        value = slope = half = 0.
+        for c in p:
+            half = half*u + slope
+            slope = slope*u + value
+            value = value*u + c
+        return value, slope, 2.*half
+
+    def speed(self, u):
+        total = 0.
+        for p in self._polynomials[1]:
+            value = 0.
+            for c in p:
+                value = value*u + c
+            total += value*value
+        return math.sqrt(total)
+
+
+class LoopingTrack(PolynomialTrack):
+    """Courbe de shape.looping_points, pour -1 ≤ u ≤ 1 :
+
+        x = u**3 - 0.5*u
+        y = 0.5*u**3 - 0.5*u
+        z = 2*u**4 - 1.62*u**2 + 0.5
+    """
+
+    def __init__(self):
+        super().__init__([[0., 1., 0., -0.5, 0.],
+                          [0., 0.5, 0., -0.5, 0.],
+                          [2., 0., -1.62, 0., 0.5]], -1., 1.)
+
+
+def test():
+    """Compare les circuits analytiques aux chemins de path3d et à leurs points"""
+    import path3d as p3d
+    import shape
+
+    # Quadrature générique contre la longueur exacte de la parabole
+    parabola = ParabolaTrack()
+    for a, b in ((parabola.u0, parabola.u1), (parabola.u0, 0.1), (-0.3, 0.2), (0.2, 0.2005)):
+        exact = parabola.integral(a, b)
+        assert abs(Track.integral(parabola, a, b) - exact) < 1e-13*exact
+    # Inversion tabulée de s(u)
+    for track in (parabola, LoopingTrack()):
+        for s in np.linspace(0., track.length, 1001)[1:-1].tolist():
+            assert abs(track.arc_length(track.parameter(s)) - s) < 1e-11
+
+    for track, points in ((ParabolaTrack(), shape.parabole_points(0.681*2, 0.412, 101)),
+                          (LoopingTrack(), shape.looping_points(201))):
+        # Les points de passage sont sur la courbe exacte
+        X = track.at([track.arc_length(u) for u in np.linspace(track.u0, track.u1,
+                                                                points.shape[1])])[0]
+        assert np.max(np.abs(X - points)) < 1e-12
+        print(type(track).__name__, track.length, track.path_error(p3d.path(points, 2000)))
+
+
+if __name__ == "__main__":
+    test()